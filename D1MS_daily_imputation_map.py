@@ -7,112 +7,216 @@ Created on Thu Sep  7 10:13:58 2023
 """
 
 
-import calendar
+import os
+import numpy as np
 import pandas as pd
-import datetime as dt
-
-from channel_config import (CHANNEL_ABM_MAP, CHANNEL_DIR, CHANNEL_SALES_YEARS,
-                            DATA_DIR)
-
-dfs = []
-    
-crop='CORN'
-abm_map = pd.read_csv(CHANNEL_ABM_MAP)
-
-year_range = [2016, 2017, 2018, 2019, 2020]
-
-for year in year_range:
-    print('Reading ' + str(year) + ' sales data...')
-        
-    dfi_path = DATA_DIR + CHANNEL_DIR + str(year) + '_CH.csv'
-        
-    # read in an individual year
-    dfi = pd.read_csv(dfi_path)
-        
-    # grab the data for the requested crop
-    dfi = dfi[dfi['SPECIE_DESCR'] == crop].reset_index(drop=True)
-    dfi['year'] = year
-        
-    # convert the date to datetime format
-    dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
-    dfs.append(dfi)
-        
-sales = pd.concat(dfs).reset_index(drop=True)
-    
-    
-# grab relevant columns
-sales = sales[
-        ['year', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE', 'NET_SHIPPED_QTY_TO_DATE',
-         'ORDER_QTY_TO_DATE', 'REPLANT_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
-         'SHIPPING_FIPS_CODE', 'VARIETY_NAME']]
-    
-# rename columns
-sales = sales.rename(columns={'NET_SALES_QTY_TO_DATE': 'nets_Q',
-                              'NET_SHIPPED_QTY_TO_DATE': 'shipped_Q',
-                              'ORDER_QTY_TO_DATE': 'order_Q',
-                              'REPLANT_QTY_TO_DATE': 'replant_Q',
-                              'RETURN_QTY_TO_DATE': 'return_Q',
-                              'SHIPPING_FIPS_CODE': 'fips',
-                              'VARIETY_NAME': 'hybrid'})
-    
-sales = sales[sales['fips'].isna()==False].reset_index(drop=True)
-sales['fips'] = sales['fips'].astype(int)
-
-# merge with ABM map and drop the fips column
-sales = sales.merge(abm_map, on=['fips'], how='left').drop(columns=['fips'])
-    
-sales_abm_by_date = pd.DataFrame()
-
-sales_abm_level_agg = sales.drop(columns=['year', 'hybrid']).groupby(by=['abm'], as_index=False).sum()
-
-month_range = [9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
-
-for year in sales['year'].unique():
-    for month in month_range:
-        for day in range(1, calendar.monthrange(year, month)[1] + 1):
-            if month > 8:
-                date_mask = dt.datetime(year=year - 1,
-                                        month=month,
-                                        day=day)
-            else:
-                date_mask = dt.datetime(year=year,
-                                        month=month,
-                                        day=day)
-            
-            single_year = sales[sales['year'] == year].reset_index(drop=True)
-            single_year_to_date = single_year[single_year['EFFECTIVE_DATE'] <= date_mask].reset_index(drop=True)
-            
-            single_year_to_date['month'] = month
-            single_year_to_date['day'] = day
-            
-            single_year_to_date_agg = single_year_to_date.groupby(
-                    by=['abm', 'year', 'month', 'day'],
-                    as_index=False).sum()
-            
-            if sales_abm_by_date.empty == True:
-                sales_abm_by_date = single_year_to_date_agg.copy()
-            else:
-                sales_abm_by_date = pd.concat([sales_abm_by_date, single_year_to_date_agg])
-                
-sales_abm_by_date_no_year = sales_abm_by_date.drop(
-        columns=['year']).groupby(['abm', 'month', 'day'], as_index=False).sum()
-    
-sales_abm_by_date_no_year = sales_abm_by_date_no_year.rename(
-        columns={'nets_Q': 'nets_Q_ratio',
-                 'shipped_Q': 'shipped_Q_ratio',
-                 'order_Q': 'order_Q_ratio',
-                 'replant_Q': 'replant_Q_ratio',
-                 'return_Q': 'return_Q_ratio'})
-    
-sales_abm_ratios = sales_abm_by_date_no_year.merge(sales_abm_level_agg, on=['abm'], how='left')
-
-sales_abm_ratios['nets_Q_ratio'] = sales_abm_ratios['nets_Q_ratio'] / sales_abm_ratios['nets_Q']
-sales_abm_ratios['shipped_Q_ratio'] = sales_abm_ratios['shipped_Q_ratio'] / sales_abm_ratios['shipped_Q']
-sales_abm_ratios['order_Q_ratio'] = sales_abm_ratios['order_Q_ratio'] / sales_abm_ratios['order_Q']
-sales_abm_ratios['replant_Q_ratio'] = sales_abm_ratios['replant_Q_ratio'] / sales_abm_ratios['replant_Q']
-sales_abm_ratios['return_Q_ratio'] = sales_abm_ratios['return_Q_ratio'] / sales_abm_ratios['return_Q']
-
-sales_abm_ratios = sales_abm_ratios.drop(columns=['nets_Q', 'shipped_Q', 'order_Q', 'replant_Q', 'return_Q'])
-
-sales_abm_ratios.to_csv('channel_abm_date_ratios_corn.csv',index=False)
\ No newline at end of file
+
+from channel_config import (CHANNEL_ABM_MAP, CHANNEL_DIR, DATA_DIR,
+                            DATE_RATIO_YEARS)
+from yearly_reader import read_yearly_csvs
+
+
+QUANTITIES = ['nets_Q', 'shipped_Q', 'order_Q', 'replant_Q', 'return_Q']
+
+
+def read_channel_daily_sales(crop, abm_map, years):
+    """Reads in the Channel sales for a crop with the abm of each order.
+
+    Keyword arguments:
+        crop -- the crop we want to get the data for
+        abm_map -- the dataframe mapping fips to abm
+        years -- the sales years to read
+    Returns:
+        sales -- the dataframe of the sales quantities by abm and effective date
+    """
+    # read the years several at a time, keeping only the requested crop and
+    # the columns used below
+    sales = read_yearly_csvs(path_template=DATA_DIR + CHANNEL_DIR + '{year}_CH.csv',
+                             years=years,
+                             source='channel_sales',
+                             usecols=['EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE',
+                                      'NET_SHIPPED_QTY_TO_DATE', 'ORDER_QTY_TO_DATE',
+                                      'REPLANT_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
+                                      'SHIPPING_FIPS_CODE'],
+                             filters={'SPECIE_DESCR': crop},
+                             date_columns=['EFFECTIVE_DATE'])
+
+    # grab relevant columns
+    sales = sales[
+            ['year', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE', 'NET_SHIPPED_QTY_TO_DATE',
+             'ORDER_QTY_TO_DATE', 'REPLANT_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
+             'SHIPPING_FIPS_CODE']]
+
+    # rename columns
+    sales = sales.rename(columns={'NET_SALES_QTY_TO_DATE': 'nets_Q',
+                                  'NET_SHIPPED_QTY_TO_DATE': 'shipped_Q',
+                                  'ORDER_QTY_TO_DATE': 'order_Q',
+                                  'REPLANT_QTY_TO_DATE': 'replant_Q',
+                                  'RETURN_QTY_TO_DATE': 'return_Q',
+                                  'SHIPPING_FIPS_CODE': 'fips'})
+
+    sales = sales[sales['fips'].isna()==False].reset_index(drop=True)
+    sales['fips'] = sales['fips'].astype(int)
+
+    # merge with ABM map and drop the fips column
+    sales = sales.merge(abm_map, on=['fips'], how='left').drop(columns=['fips'])
+
+    return sales
+
+
+def create_daily_cumulative_sales(sales):
+    """Creates the quantities each abm had by every day of each marketing
+    year. Each order is put on the first fiscal day whose midnight mask it
+    falls before, the per day increments are summed once and cumulatively
+    summed per (abm, year) over every day of that year's calendar.
+
+    Keyword arguments:
+        sales -- the dataframe of the sales quantities by abm and effective date
+    Returns:
+        sales_abm_by_date -- the dataframe of the quantities to date by abm,
+            year, month and day, starting at each abm's first order
+        sales_abm_year_totals -- the dataframe of the total quantities by abm
+            and year
+    """
+    sales = sales[sales['abm'].isna() == False].reset_index(drop=True)
+
+    # the fiscal year runs from september 1st of year - 1 to august 31st
+    season_start = pd.to_datetime(pd.DataFrame({'year': sales['year'] - 1,
+                                                'month': 9,
+                                                'day': 1}))
+
+    # orders before the start of the season count from the first day on
+    days_in = (sales['EFFECTIVE_DATE'] - season_start) / pd.Timedelta(days=1)
+    sales['fiscal_day'] = np.ceil(days_in).clip(lower=0)
+
+    sales_abm_year_totals = sales.groupby(by=['abm', 'year'], as_index=False)[QUANTITIES].sum()
+
+    dfs_by_date = []
+    for year in sales['year'].unique():
+        single_year = sales[sales['year'] == year]
+
+        season_days = pd.date_range(start=pd.Timestamp(year=year - 1, month=9, day=1),
+                                    end=pd.Timestamp(year=year, month=8, day=31))
+
+        # orders after the end of august don't count towards any day
+        single_year = single_year[single_year['fiscal_day'] < len(season_days)]
+
+        daily = single_year.groupby(by=['abm', 'fiscal_day'])[QUANTITIES].sum()
+        daily['n_orders'] = single_year.groupby(by=['abm', 'fiscal_day']).size()
+
+        # lay the days out densely for every abm and cumulate
+        dense_index = pd.MultiIndex.from_product(
+                [daily.index.get_level_values('abm').unique(), range(len(season_days))],
+                names=['abm', 'fiscal_day'])
+
+        to_date = daily.reindex(dense_index, fill_value=0).groupby(level='abm').cumsum()
+
+        # an abm only has a row once it has had an order
+        to_date = to_date[to_date['n_orders'] > 0].drop(columns=['n_orders']).reset_index()
+
+        fiscal_dates = season_days[to_date['fiscal_day'].astype(int)]
+        to_date['year'] = year
+        to_date['month'] = fiscal_dates.month
+        to_date['day'] = fiscal_dates.day
+
+        dfs_by_date.append(to_date[['abm', 'year', 'month', 'day'] + QUANTITIES])
+
+    sales_abm_by_date = pd.concat(dfs_by_date).reset_index(drop=True)
+
+    return sales_abm_by_date, sales_abm_year_totals
+
+
+def create_abm_date_ratios(sales_abm_by_date, sales_abm_year_totals):
+    """Creates the fraction of each abm's quantities that had come in by every
+    day of the marketing year, summed over the years.
+
+    Keyword arguments:
+        sales_abm_by_date -- the dataframe of the quantities to date by abm,
+            year, month and day
+        sales_abm_year_totals -- the dataframe of the total quantities by abm
+            and year
+    Returns:
+        sales_abm_ratios -- the dataframe of the quantity ratios by abm, month
+            and day
+    """
+    sales_abm_by_date_no_year = sales_abm_by_date.groupby(
+            by=['abm', 'month', 'day'])[QUANTITIES].sum()
+
+    sales_abm_level_agg = sales_abm_year_totals.groupby(by=['abm'])[QUANTITIES].sum()
+
+    sales_abm_ratios = sales_abm_by_date_no_year.div(
+            sales_abm_level_agg.reindex(
+                    sales_abm_by_date_no_year.index.get_level_values('abm')).values)
+
+    sales_abm_ratios.columns = [quantity + '_ratio' for quantity in QUANTITIES]
+    sales_abm_ratios = sales_abm_ratios.reset_index()
+
+    return sales_abm_ratios
+
+
+def build_abm_date_ratios(crop, abm_map, years=DATE_RATIO_YEARS, incremental=False,
+                          refresh_years=None):
+    """Builds and writes the daily abm ratio map for a crop. The per year
+    quantities to date and totals are kept next to the map, so in incremental
+    mode only the seasons that aren't stored yet, plus those in refresh_years,
+    are read and computed. The latest year is refreshed by default, as it may
+    be the season in progress and only stored as of its last snapshot.
+
+    Keyword arguments:
+        crop -- the crop we want to build the map for
+        abm_map -- the dataframe mapping fips to abm
+        years -- the sales years the map is built from
+        incremental -- whether to reuse the stored per year quantities
+        refresh_years -- list of the years to recompute even when stored,
+            None for the latest of the years
+    Returns:
+        sales_abm_ratios -- the dataframe of the quantity ratios by abm, month
+            and day
+    """
+    by_date_path = 'channel_abm_date_to_date_' + crop + '.csv'
+    totals_path = 'channel_abm_year_totals_' + crop + '.csv'
+
+    if refresh_years is None:
+        refresh_years = [max(years)]
+
+    if incremental == True and os.path.exists(by_date_path) and os.path.exists(totals_path):
+        stored_by_date = pd.read_csv(by_date_path)
+        stored_totals = pd.read_csv(totals_path)
+
+        # drop the years that will be recomputed or are no longer wanted
+        keep_years = [year for year in years if year not in refresh_years]
+        stored_by_date = stored_by_date[stored_by_date['year'].isin(keep_years)]
+        stored_totals = stored_totals[stored_totals['year'].isin(keep_years)]
+
+        new_years = [year for year in years if year not in stored_totals['year'].unique()]
+    else:
+        stored_by_date = pd.DataFrame()
+        stored_totals = pd.DataFrame()
+        new_years = list(years)
+
+    if len(new_years) > 0:
+        sales = read_channel_daily_sales(crop=crop, abm_map=abm_map, years=new_years)
+        new_by_date, new_totals = create_daily_cumulative_sales(sales=sales)
+
+        sales_abm_by_date = pd.concat([stored_by_date, new_by_date]).reset_index(drop=True)
+        sales_abm_year_totals = pd.concat([stored_totals, new_totals]).reset_index(drop=True)
+
+        sales_abm_by_date.to_csv(by_date_path, index=False)
+        sales_abm_year_totals.to_csv(totals_path, index=False)
+    else:
+        sales_abm_by_date = stored_by_date
+        sales_abm_year_totals = stored_totals
+
+    sales_abm_ratios = create_abm_date_ratios(sales_abm_by_date=sales_abm_by_date,
+                                              sales_abm_year_totals=sales_abm_year_totals)
+
+    sales_abm_ratios.to_csv('channel_abm_date_ratios_' + crop + '.csv', index=False)
+
+    return sales_abm_ratios
+
+
+if __name__ == '__main__':
+    abm_map = pd.read_csv(CHANNEL_ABM_MAP)
+
+    for crop in ['CORN', 'SOYBEAN']:
+        build_abm_date_ratios(crop=crop, abm_map=abm_map, incremental=True)
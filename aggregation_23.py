@@ -7,22 +7,53 @@ Created on Mon Jul 26 13:58:06 2021
 """
 
 import pandas as pd 
-from functools import reduce 
 import numpy as np
 from calendar import monthrange
 import datetime as dt
-from pandasql import sqldf
+from functools import lru_cache
 
 from aggregation_config import(ABM_FIPS_MAP, ABM_TABLE, BIG_CF_FILE, BLIZZARD_DIR, CF_2022_FILE,
-                               CF_2023_FILE, CM_DIR, DAILY_FRACTIONS, DATA_DIR, H2H_DIR, HISTORICAL_SRP, MONTHLY_FRACTIONS,
+                               CF_2023_FILE, CM_CONTRACT_MONTHS, CM_DIR,
+                               CM_UPDATE_MONTHS, DAILY_FRACTIONS, DATA_DIR, H2H_DIR, HISTORICAL_SRP, MONTHLY_FRACTIONS,
                                OLD_2020, ORDER_DATE, ORDER_FRACTION_2021, SALES_2021, SALES_2022,
-                               SALES_2021_W_DATE, SALES_DIR, SCM_DATA_DIR, SCM_DATA_FILE, 
-                               YIELD_COUNTY_DATA, YEARLY_ABM_FIPS_MAP)
+                               SALES_2021_W_DATE, SALES_DIR, SCM_DATA_DIR, SCM_DATA_FILE, STAGE_GRAPH_WORKERS,
+                               WEATHER_FEATURES, WEATHER_FIPS_TOLERANCE, YIELD_COUNTY_DATA,
+                               YEARLY_ABM_FIPS_MAP)
+import commodity_prep
+from commodity_prep import create_commodity_features, read_commodity_monthly
+from cumulative_sales import(MARKETING_MONTHS, create_monthly_order_features,
+                             cumulative_to_date, marketing_month_ends)
+import geography
+from geography import MISSING_FIPS, combine_fips, format_fips, read_geocodes
+from key_codes import decode_keys, encode_key, encode_keys
+from level_imputation import build_level_cube, impute_from_cube
+from relative_maturity import get_RM
+from sales_cache import read_sales_years
+from sales_lags import create_lag_features, impute_cohort_lags
+import source_schemas
+from source_schemas import read_source
+from stage_cache import cached_stage
+from stage_graph import run_stage_graph
+import weather_prep
+from weather_prep import flatten_monthly_weather, read_weather_abm_monthly
+import yearly_reader
+from yearly_reader import read_yearly_csvs
+import yield_advantages
+from yield_advantages import ADV_FEATURES, read_h2h_advantages
+
+
+# the settings used when the module is run as a script, max_workers being the
+# number of processes the pipeline branches run in (None for one per core, 0
+# to run them one after another)
+RUN_CONFIG = {'output_file': 'r_r_yunxuan_2023_nov28_agefix_daily_lagfix_D1MS_CY.csv',
+              'max_workers': STAGE_GRAPH_WORKERS}
 
 
 ###### --------------------- Read ABM & Teamkey Map  ------------------- ######
+@lru_cache(maxsize=None)
 def read_abm_teamkey_file():
-    """ Reads in and returns the abm and teamkey data as a dataframe.
+    """ Reads in and returns the abm and teamkey data as a dataframe. The file
+    is only read once and later calls share the cached dataframe.
     
     Keyword arguments:
         None
@@ -32,7 +63,7 @@ def read_abm_teamkey_file():
     
     # read in data
     abm_Teamkey_Address = DATA_DIR + ABM_TABLE
-    abm_Teamkey = pd.read_csv(abm_Teamkey_Address)
+    abm_Teamkey = read_source('abm_table', abm_Teamkey_Address)
     
     # rename columns 
     abm_Teamkey = abm_Teamkey.rename(columns = {'Old Area ID':'abm', 'New Area ID':'TEAM_KEY'})
@@ -42,14 +73,12 @@ def read_abm_teamkey_file():
     return abm_Teamkey
 
 
-abm_Teamkey = read_abm_teamkey_file()
-
 ###### ---------------------- Read Sales Data ------------------------ ######
 def Preprocess_2020_sale():
     df2020_path = DATA_DIR + SALES_DIR + '2020.csv'
     dfsale_2020 = pd.read_csv(df2020_path)
     dfsale_2020 = dfsale_2020.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
-    dfsale_2020 = dfsale_2020.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
+    dfsale_2020 = dfsale_2020.merge(read_abm_teamkey_file(), how = 'left', on = ['TEAM_KEY'])
     dfsale_2020 = dfsale_2020.rename(columns = {'abm':'SLS_LVL_2_ID'})
     
     df2020_path_new = DATA_DIR + SALES_DIR + '2020.csv'
@@ -70,36 +99,27 @@ def read_sales_filepath():
     # preprocess sales 2020 sales data to get consistent abm data  
     #Preprocess_2020_sale()
 
-    # define a list to store all sales data 
-    dfs_path = []
+    # read in the soybean data by year from the parquet cache, which only
+    # re-parses a year's csv when it has changed
+    SALES_COLUMNS = ['SPECIE_DESCR', 'BRAND_FAMILY_DESCR', 'SLS_LVL_2_ID',
+                     'VARIETY_NAME', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE',
+                     'ORDER_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
+                     'REPLANT_QTY_TO_DATE']
     
-    # read in the data by year 
-    for year in range(2012, 2021):
-        print("Read ", str(year), " Sales Data")
-        dfi_path = DATA_DIR + SALES_DIR + str(year) + '.csv'
-        dfi = pd.read_csv(dfi_path)
-        
-        dfi = dfi[dfi['SPECIE_DESCR'] == 'SOYBEAN'].reset_index(drop=True)
-        
-        # set a year parameter to be the year 
-        dfi['year'] = year
-        
-        # convert the effective date to a datetime format in order to set the mask 
-        dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
-        # set 2020 abms to old format
-        if year == 2020:
-            dfi = dfi.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
-            dfi = dfi.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
-            dfi = dfi.rename(columns = {'abm':'SLS_LVL_2_ID'})
-            dfi = dfi.drop(columns=['TEAM_KEY'])
-
-        
-        # add modified dataframe to the list 
-        dfs_path.append(dfi)
-      
-    # concate all dataframes  
-    Sale_2012_2020 = pd.concat(dfs_path).reset_index(drop=True)
+    Sale_2012_2020 = read_sales_years(years=range(2012, 2021),
+                                      species=['SOYBEAN'],
+                                      brand_families=['NATIONAL'],
+                                      columns=SALES_COLUMNS)
+    
+    # set 2020 abms to old format
+    Sale_2020 = Sale_2012_2020[Sale_2012_2020['year'] == 2020]
+    Sale_2020 = Sale_2020.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
+    Sale_2020 = Sale_2020.merge(read_abm_teamkey_file(), how = 'left', on = ['TEAM_KEY'])
+    Sale_2020 = Sale_2020.rename(columns = {'abm':'SLS_LVL_2_ID'})
+    Sale_2020 = Sale_2020.drop(columns=['TEAM_KEY'])
+    
+    Sale_2012_2020 = pd.concat([Sale_2012_2020[Sale_2012_2020['year'] != 2020],
+                                Sale_2020]).reset_index(drop=True)
     
     # rename the columns 
     SALES_COLUMN_NAMES = {'year': 'year', 'SPECIE_DESCR': 'crop',
@@ -111,33 +131,15 @@ def read_sales_filepath():
     
     Sale_2012_2020 = Sale_2012_2020.rename(columns = SALES_COLUMN_NAMES)
     
-    # select the soybean crop 
-    Sale_2012_2020 = Sale_2012_2020[
-            Sale_2012_2020['BRAND_FAMILY_DESCR'] == 'NATIONAL'].reset_index(drop=True)
-    
     # set year as str
     Sale_2012_2020['year'] = Sale_2012_2020['year'].astype(str)
     
     # create a clean sales data for monthly calculation
     df_clean_sale = Sale_2012_2020.copy()
     
-    # drop unnecessary columns
-    SALES_COLUMNS_TO_DROP_Monthly = ['BRAND_FAMILY_DESCR', 
-                                     'DEALER_ACCOUNT_CY_BRAND_FAMILY',
-                                     'SHIPPING_STATE_CODE', 'SHIPPING_COUNTY',
-                                     'SHIPPING_FIPS_CODE', 'SLS_LVL_1_ID', 'CUST_ID',
-                                     'ACCT_ID', 'NET_SHIPPED_QTY_TO_DATE']
-    
-    df_clean_sale = df_clean_sale.drop(columns = SALES_COLUMNS_TO_DROP_Monthly)
-    
-    # drop unnecessary columns for yearly sales
-    SALES_COLUMNS_TO_DROP_Yearly = ['BRAND_FAMILY_DESCR', 'EFFECTIVE_DATE',
-                                    'DEALER_ACCOUNT_CY_BRAND_FAMILY',
-                                    'SHIPPING_STATE_CODE', 'SHIPPING_COUNTY',
-                                    'SHIPPING_FIPS_CODE', 'SLS_LVL_1_ID', 'CUST_ID',
-                                    'ACCT_ID', 'NET_SHIPPED_QTY_TO_DATE']
-    
-    Sale_2012_2020 = Sale_2012_2020.drop(columns=SALES_COLUMNS_TO_DROP_Yearly)
+    # keep the columns needed for the monthly calculation
+    df_clean_sale = df_clean_sale[['EFFECTIVE_DATE', 'year', 'crop', 'abm', 'Variety_Name',
+                                   'nets_Q', 'order_Q', 'return_Q', 'replant_Q']]
     
     # reorder the columns
     Sale_2012_2020 = Sale_2012_2020[['year', 'abm', 'Variety_Name', 
@@ -158,7 +160,7 @@ def merge_2021_sales_data_w_date(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2021 = pd.read_csv(DATA_DIR + SALES_2021_W_DATE)
+    sales_2021 = read_source('d1ms_sales', DATA_DIR + SALES_2021_W_DATE)
     
     # grab relevant columns
     sales_2021_subset = sales_2021[['MK_YR', 'EFFECTIVE_DATE', 'BRAND_FAMILY_DESCR',
@@ -185,7 +187,7 @@ def merge_2021_sales_data_w_date(df):
     sales_soybeans = sales_soybeans[
             sales_soybeans['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_soybeans = sales_soybeans.merge(abm_Teamkey, on=['TEAM_KEY'], how='left')
+    sales_soybeans = sales_soybeans.merge(read_abm_teamkey_file(), on=['TEAM_KEY'], how='left')
     
     sales_soybeans = sales_soybeans.drop(columns=['TEAM_KEY'])
     sales_soybeans['year'] = '2021'
@@ -203,32 +205,24 @@ def merge_2021_sales_data_w_date(df):
     sales_soybeans = sales_soybeans.drop(columns=['date'])
     
     # only grab orders after certain date
-    months=[9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
     year = 2021
     
     # create the total monthly dataframe
     sales_monthly_total = sales_soybeans[
             ['year', 'abm', 'Variety_Name']].drop_duplicates().reset_index(drop=True)
     
-    for month in months:
-        print("month", month)
-        if month > 8:
-            date_mask = dt.datetime(year = int(year) - 1, month = month, day = monthrange(int(year) - 1, month)[1])
-            
-        if month <= 8:
-            date_mask = dt.datetime(year = int(year), month = month, day = monthrange(int(year), month)[1])
-            
-        sales_monthly = sales_soybeans[sales_soybeans['EFFECTIVE_DATE'] <= date_mask].copy().reset_index(drop = True)
-        
-        sales_monthly = sales_monthly.groupby(
-                by=['year','Variety_Name', 'abm'], as_index=False).sum().reset_index(drop = True)
-        
-        # rename 
-        sales_monthly = sales_monthly.rename(columns = {'order_Q': 'order_Q_month_' + str(month)})
-            
-        # merge with df_monthly_total 
-        sales_monthly_total = sales_monthly_total.merge(
-                sales_monthly, on=['year', 'Variety_Name', 'abm'], how='left')
+    # cumulative orders at the end of each month of the marketing year
+    sales_monthly = cumulative_to_date(df=sales_soybeans,
+                                       keys=['year', 'Variety_Name', 'abm'],
+                                       date_col='EFFECTIVE_DATE',
+                                       value_col='order_Q',
+                                       cutoffs=marketing_month_ends(year),
+                                       labels=['order_Q_month_' + str(month)
+                                               for month in MARKETING_MONTHS])
+    
+    # merge with df_monthly_total 
+    sales_monthly_total = sales_monthly_total.merge(
+            sales_monthly, on=['year', 'Variety_Name', 'abm'], how='left')
     
     sales_monthly_total = sales_monthly_total.fillna(0)
         
@@ -257,7 +251,7 @@ def merge_2021_sales_data_impute_daily(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2021 = pd.read_csv(DATA_DIR + SALES_2021)
+    sales_2021 = read_source('team_sales', DATA_DIR + SALES_2021)
     
     # grab relevant columns
     sales_2021_subset = sales_2021[['Team', 'VARIETY', 'CY Net Sales',
@@ -277,7 +271,7 @@ def merge_2021_sales_data_impute_daily(df):
     sales_2021_subset = sales_2021_subset[
             sales_2021_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_2021_subset = sales_2021_subset.merge(abm_Teamkey, on=['TEAM_KEY'],
+    sales_2021_subset = sales_2021_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'],
                                                 how='left')
     
     sales_2021_subset = sales_2021_subset.drop(columns=['TEAM_KEY'])
@@ -353,7 +347,7 @@ def merge_2022_sales_data_impute_daily(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2022 = pd.read_csv(DATA_DIR + SALES_2022)
+    sales_2022 = read_source('team_sales', DATA_DIR + SALES_2022)
     
     # grab relevant columns
     sales_2022_subset = sales_2022[['Team', 'VARIETY', 'CY Net Sales',
@@ -372,7 +366,7 @@ def merge_2022_sales_data_impute_daily(df):
     sales_2022_subset = sales_2022_subset[
             sales_2022_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_2022_subset = sales_2022_subset.merge(abm_Teamkey, on=['TEAM_KEY'],
+    sales_2022_subset = sales_2022_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'],
                                                 how='left')
     
     sales_2022_subset = sales_2022_subset.drop(columns=['TEAM_KEY'])
@@ -447,7 +441,7 @@ def merge_2021_sales_data_impute_monthly(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2021 = pd.read_csv(DATA_DIR + SALES_2021)
+    sales_2021 = read_source('team_sales', DATA_DIR + SALES_2021)
     
     # grab relevant columns
     sales_2021_subset = sales_2021[['Team', 'VARIETY', 'CY Net Sales',
@@ -466,7 +460,7 @@ def merge_2021_sales_data_impute_monthly(df):
     sales_2021_subset = sales_2021_subset[
             sales_2021_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_2021_subset = sales_2021_subset.merge(abm_Teamkey, on=['TEAM_KEY'],
+    sales_2021_subset = sales_2021_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'],
                                                 how='left')
     
     sales_2021_subset = sales_2021_subset.drop(columns=['TEAM_KEY'])
@@ -555,7 +549,7 @@ def merge_2022_sales_data_impute_monthly(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2022 = pd.read_csv(DATA_DIR + SALES_2022)
+    sales_2022 = read_source('team_sales', DATA_DIR + SALES_2022)
     
     # grab relevant columns
     sales_2022_subset = sales_2022[['Team', 'VARIETY', 'CY Net Sales',
@@ -574,7 +568,7 @@ def merge_2022_sales_data_impute_monthly(df):
     sales_2022_subset = sales_2022_subset[
             sales_2022_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_2022_subset = sales_2022_subset.merge(abm_Teamkey, on=['TEAM_KEY'],
+    sales_2022_subset = sales_2022_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'],
                                                 how='left')
     
     sales_2022_subset = sales_2022_subset.drop(columns=['TEAM_KEY'])
@@ -661,7 +655,7 @@ def merge_2021_sales_data(df):
         df_merged
     """
     # read in the 2021 sales data
-    sales_2021 = pd.read_csv(DATA_DIR + SALES_2021)
+    sales_2021 = read_source('team_sales', DATA_DIR + SALES_2021)
     
     # grab relevant columns
     sales_2021_subset = sales_2021[['Team', 'VARIETY', 'CY Net Sales',
@@ -679,7 +673,7 @@ def merge_2021_sales_data(df):
     sales_2021_subset = sales_2021_subset[
             sales_2021_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_2021_subset = sales_2021_subset.merge(abm_Teamkey, on=['TEAM_KEY'],
+    sales_2021_subset = sales_2021_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'],
                                                 how='left')
     
     sales_2021_subset = sales_2021_subset.drop(columns=['TEAM_KEY'])
@@ -724,33 +718,28 @@ def merge_2021_sales_data(df):
 
 
 def create_late_lagged_sales(df, full_df, year):
+    """Adds the sales of the two previous years to the sales of a year that
+    is read in separately from the main sales data.
+
+    Keyword arguments:
+        df -- the dataframe of the year's sales
+        full_df -- the dataframe of the sales of the earlier years
+        year -- the year of the sales in df
+    Returns:
+        df_merged -- the dataframe with the lagged sales features added
     """
-    """
-       # get the lagged sales data
-    df_last_year = full_df[full_df['year'] == str(year - 1)].copy().reset_index(drop=True)
-    df_last_year = df_last_year[['abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                                 'return_Q', 'replant_Q']]
-    df_last_year['year'] = str(year)
-    df_last_year = df_last_year.rename(columns={'nets_Q': 'nets_Q_1',
-                                                'order_Q': 'order_Q_1',
-                                                'return_Q': 'return_Q_1',
-                                                'replant_Q': 'replant_Q_1'})
-        
-    df_two_year = full_df[full_df['year'] == str(year - 2)].copy().reset_index(drop=True)
-    df_two_year = df_two_year[['abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                               'return_Q', 'replant_Q']]
-    df_two_year['year'] = str(year)
-    df_two_year = df_two_year.rename(columns={'nets_Q': 'nets_Q_2',
-                                              'order_Q': 'order_Q_2',
-                                              'return_Q': 'return_Q_2',
-                                              'replant_Q': 'replant_Q_2'})
-
-    df_merged = df.merge(df_last_year, 
-                         on=['year', 'Variety_Name', 'abm'], 
-                         how='left')
-    df_merged = df_merged.merge(df_two_year,
-                                on=['year', 'Variety_Name', 'abm'],
-                                how='left')
+    # get the lagged sales data
+    earlier_years = full_df[full_df['year'].isin([str(year - 1), str(year - 2)])]
+
+    df_merged = create_lag_features(df=df,
+                                    keys=['Variety_Name', 'abm'],
+                                    time_col='year',
+                                    value_cols={'nets_Q': 'nets_Q',
+                                                'order_Q': 'order_Q',
+                                                'return_Q': 'return_Q',
+                                                'replant_Q': 'replant_Q'},
+                                    lags=[1, 2],
+                                    source=earlier_years)
     
     return df_merged
 
@@ -758,7 +747,7 @@ def merge_2022_sales_data(df):
     """
     """
     # read in the 2022 data
-    sales_2022 = pd.read_csv(DATA_DIR + SALES_2022)
+    sales_2022 = read_source('d1ms_sales', DATA_DIR + SALES_2022)
         
     # grab relevant columns
     sales_2022_subset = sales_2022[['MK_YR', 'EFFECTIVE_DATE', 'BRAND_FAMILY_DESCR',
@@ -785,7 +774,7 @@ def merge_2022_sales_data(df):
     sales_soybeans = sales_soybeans[
             sales_soybeans['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    sales_soybeans = sales_soybeans.merge(abm_Teamkey, on=['TEAM_KEY'], how='left')
+    sales_soybeans = sales_soybeans.merge(read_abm_teamkey_file(), on=['TEAM_KEY'], how='left')
     
     sales_soybeans = sales_soybeans.drop(columns=['TEAM_KEY'])
     sales_soybeans['year'] = '2022'
@@ -803,32 +792,24 @@ def merge_2022_sales_data(df):
     sales_soybeans = sales_soybeans.drop(columns=['date'])
     
     # only grab orders after certain date
-    months=[9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
     year = 2022
     
     # create the total monthly dataframe
     sales_monthly_total = sales_soybeans[
             ['year', 'abm', 'Variety_Name']].drop_duplicates().reset_index(drop=True)
     
-    for month in months:
-        print("month", month)
-        if month > 8:
-            date_mask = dt.datetime(year = int(year) - 1, month = month, day = monthrange(int(year) - 1, month)[1])
-            
-        if month <= 8:
-            date_mask = dt.datetime(year = int(year), month = month, day = monthrange(int(year), month)[1])
-            
-        sales_monthly = sales_soybeans[sales_soybeans['EFFECTIVE_DATE'] <= date_mask].copy().reset_index(drop = True)
-        
-        sales_monthly = sales_monthly.groupby(
-                by=['year','Variety_Name', 'abm'], as_index=False).sum().reset_index(drop = True)
-        
-        # rename 
-        sales_monthly = sales_monthly.rename(columns = {'order_Q': 'order_Q_month_' + str(month)})
-            
-        # merge with df_monthly_total 
-        sales_monthly_total = sales_monthly_total.merge(
-                sales_monthly, on=['year', 'Variety_Name', 'abm'], how='left')
+    # cumulative orders at the end of each month of the marketing year
+    sales_monthly = cumulative_to_date(df=sales_soybeans,
+                                       keys=['year', 'Variety_Name', 'abm'],
+                                       date_col='EFFECTIVE_DATE',
+                                       value_col='order_Q',
+                                       cutoffs=marketing_month_ends(year),
+                                       labels=['order_Q_month_' + str(month)
+                                               for month in MARKETING_MONTHS])
+    
+    # merge with df_monthly_total 
+    sales_monthly_total = sales_monthly_total.merge(
+            sales_monthly, on=['year', 'Variety_Name', 'abm'], how='left')
     
     sales_monthly_total = sales_monthly_total.fillna(0)
     
@@ -845,7 +826,7 @@ def merge_2022_SCM_data(df):
     """
     """
     # read in the SCM data
-    SCM_data = pd.read_csv(DATA_DIR + SCM_DATA_DIR + SCM_DATA_FILE)
+    SCM_data = read_source('scm_orders', DATA_DIR + SCM_DATA_DIR + SCM_DATA_FILE)
     
     SCM_data_subset = SCM_data[['Team', 'VARIETY', 'Dealer/Gross Orders']]
     
@@ -862,7 +843,7 @@ def merge_2022_SCM_data(df):
     SCM_data_subset = SCM_data_subset[
             SCM_data_subset['Variety_Name'] != '(Empty)'].reset_index(drop=True)
         
-    SCM_data_subset = SCM_data_subset.merge(abm_Teamkey, on=['TEAM_KEY'], how='left')
+    SCM_data_subset = SCM_data_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'], how='left')
     
     SCM_data_subset = SCM_data_subset.drop(columns=['TEAM_KEY'])
     SCM_data_subset['year'] = '2022'
@@ -888,7 +869,7 @@ def merge_2023_D1MS(df):
     """
     
     # read in the file
-    sales_23 = pd.read_csv(DATA_DIR + 'D1_MS_23_product_location_112822.csv')
+    sales_23 = read_source('d1ms_sales', DATA_DIR + 'D1_MS_23_product_location_112822.csv')
     
     # fill nas with 0
     sales_23 = sales_23.fillna(0)
@@ -912,7 +893,7 @@ def merge_2023_D1MS(df):
     sales_23_subset = sales_23_subset.dropna().reset_index(drop=True)
     
     # re-adjust to old abm names
-    sales_23_subset = sales_23_subset.merge(abm_Teamkey, on=['TEAM_KEY'], how='left')
+    sales_23_subset = sales_23_subset.merge(read_abm_teamkey_file(), on=['TEAM_KEY'], how='left')
     sales_23_subset = sales_23_subset.drop(columns=['TEAM_KEY'])
     
     # remove the 'RIB' string from the hybrid name
@@ -939,35 +920,10 @@ def merge_2023_D1MS(df):
     # set the orders to date quantity
     sales_23_no_date['orders_to_date'] = sales_23_no_date['order_Q'].values
     
-    # get lagged sales
-    sales_21 = df[df['year'] == '2021'].copy()
-    sales_22 = df[df['year'] == '2022'].copy()
-    
-    sales_21 = sales_21[['year', 'abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                         'return_Q', 'replant_Q']]
-    sales_22 = sales_22[['year', 'abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                         'return_Q', 'replant_Q']]
-
-    #rename the columns
-    sales_21 = sales_21.rename(columns={'nets_Q': 'nets_Q_2',
-                                        'order_Q': 'order_Q_2',
-                                        'return_Q': 'return_Q_2',
-                                        'replant_Q': 'replant_Q_2'})
-    
-    sales_22 = sales_22.rename(columns={'nets_Q': 'nets_Q_1',
-                                        'order_Q': 'order_Q_1',
-                                        'return_Q': 'return_Q_1',
-                                        'replant_Q': 'replant_Q_1'})
-    
-    sales_21['year'] = '2023'
-    sales_22['year'] = '2023'
-    
-    sales_23_no_date = sales_23_no_date.merge(sales_21,
-                                              on=['year', 'Variety_Name', 'abm'],
-                                              how='left')
-    sales_23_no_date = sales_23_no_date.merge(sales_22,
-                                              on=['year', 'Variety_Name', 'abm'],
-                                              how='left')
+    # get the lagged sales of 2021 and 2022
+    sales_23_no_date = create_late_lagged_sales(df=sales_23_no_date,
+                                                full_df=df,
+                                                year=2023)
 
     df_w_23 = pd.concat([df, sales_23_no_date])
     
@@ -985,7 +941,7 @@ def merge_2023_tim_pulled_data(df):
                                         'Acronym Name': 'Variety_Name',
                                         ' Total ': 'order_Q'})
         
-    sales_23 = sales_23.merge(abm_Teamkey, on=['TEAM_KEY'], how='left')
+    sales_23 = sales_23.merge(read_abm_teamkey_file(), on=['TEAM_KEY'], how='left')
     sales_23 = sales_23.drop(columns=['TEAM_KEY'])
         
     sales_23 = sales_23.dropna().reset_index(drop=True)
@@ -1004,35 +960,10 @@ def merge_2023_tim_pulled_data(df):
     # set the year
     sales_23['year'] = '2023'
     
-    # get lagged sales
-    sales_21 = df[df['year'] == '2021'].copy()
-    sales_22 = df[df['year'] == '2022'].copy()
-    
-    sales_21 = sales_21[['year', 'abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                         'return_Q', 'replant_Q']]
-    sales_22 = sales_22[['year', 'abm', 'Variety_Name', 'nets_Q', 'order_Q',
-                         'return_Q', 'replant_Q']]
-
-    #rename the columns
-    sales_21 = sales_21.rename(columns={'nets_Q': 'nets_Q_2',
-                                        'order_Q': 'order_Q_2',
-                                        'return_Q': 'return_Q_2',
-                                        'replant_Q': 'replant_Q_2'})
-    
-    sales_22 = sales_22.rename(columns={'nets_Q': 'nets_Q_1',
-                                        'order_Q': 'order_Q_1',
-                                        'return_Q': 'return_Q_1',
-                                        'replant_Q': 'replant_Q_1'})
-    
-    sales_21['year'] = '2023'
-    sales_22['year'] = '2023'
-    
-    sales_23 = sales_23.merge(sales_21,
-                              on=['year', 'Variety_Name', 'abm'],
-                              how='left')
-    sales_23 = sales_23.merge(sales_22,
-                              on=['year', 'Variety_Name', 'abm'],
-                              how='left')
+    # get the lagged sales of 2021 and 2022
+    sales_23 = create_late_lagged_sales(df=sales_23,
+                                        full_df=df,
+                                        year=2023)
 
     df_w_23 = pd.concat([df, sales_23])
     
@@ -1070,24 +1001,13 @@ def create_lagged_sales(df):
     #sales_with_lag = sqldf(current_year_q + last_year_q + two_years_q + 
     #                       join_last_year + join_two_years)
     
-    sales_all_lag_1 = sales_all.copy()
-    sales_all_lag_2 = sales_all.copy()
-    
-    # adjust years
-    sales_all_lag_1['year'] = sales_all_lag_1['year'] + 1
-    sales_all_lag_2['year'] = sales_all_lag_2['year'] + 1
-    
-    sales_all_lag_1 = sales_all_lag_1[
-            ['year', 'hybrid', 'abm', 'nets_Q', 'order_Q', 'return_Q', 'replant_Q']].rename(
-            columns={'nets_Q': 'nets_Q_1', 'order_Q': 'order_Q_1',
-                     'return_Q': 'return_Q_1', 'replant_Q': 'replant_Q_1'})
-    sales_all_lag_2 = sales_all_lag_2[
-            ['year', 'hybrid', 'abm', 'nets_Q', 'order_Q', 'return_Q']].rename(
-            columns={'nets_Q': 'nets_Q_2', 'order_Q': 'order_Q_2',
-                     'return_Q': 'return_Q_2'})
-    
-    sales_with_lag = sales_all.merge(sales_all_lag_1, on=['year', 'hybrid', 'abm'], how='left')
-    sales_with_lag = sales_with_lag.merge(sales_all_lag_2, on=['year', 'hybrid', 'abm'], how='left')
+    # look up each product's sales in the ABM one and two years before
+    sales_with_lag = create_lag_features(df=sales_all,
+                                         keys=['hybrid', 'abm'],
+                                         time_col='year',
+                                         value_cols=['nets_Q', 'order_Q', 'return_Q', 'replant_Q'],
+                                         lags=[1, 2])
+    sales_with_lag = sales_with_lag.drop(columns=['replant_Q_2'])
     
     # impute, replacing the NaNs with zeros
     for feature in LAGGED_FEATURES:
@@ -1119,64 +1039,13 @@ def create_monthly_sales(Sale_2012_2020_lagged, clean_Sale):
     """
     print('Creating monthly features...')
 
-    clean_Sale = clean_Sale[['EFFECTIVE_DATE', 'year', 'abm', 'Variety_Name', 'order_Q']]
-    months = [9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
-    
-    dfs_monthly_netsales = []
     years = ['2012', '2013', '2014', '2015', '2016', '2017', '2018', '2019', '2020']
-    for year in years:
-        print('year', year)
-        df_year = clean_Sale[clean_Sale['year'] == year].reset_index(drop = True)
-        
-        df_monthly_total = pd.DataFrame()
-        
-        df_single_year = Sale_2012_2020_lagged[Sale_2012_2020_lagged['year'] == year].copy().reset_index(drop = True)
-        
-        df_monthly_total['year'] = df_single_year['year'].tolist()
-        df_monthly_total['Variety_Name'] = df_single_year['Variety_Name'].tolist()
-        df_monthly_total['abm'] = df_single_year['abm'].tolist()
-        
-        orders_to_date_mask = dt.datetime(year=int(year) - 1,
-                                          month=ORDER_DATE['month'],
-                                          day=ORDER_DATE['day'])
-        
-        # grab the orders to date
-        df_to_date = df_year[
-                df_year['EFFECTIVE_DATE'] <= orders_to_date_mask].copy().reset_index(drop=True)
-        
-        df_to_date = df_to_date.groupby(by=['year', 'Variety_Name', 'abm'],
-                                        as_index=False).sum().reset_index(drop=True)
-        
-        df_to_date = df_to_date.rename(columns={'order_Q': 'orders_to_date'})
-        
-        
-        for month in months:
-            print("month", month)
-            if month > 8:
-                date_mask = dt.datetime(year = int(year) - 1, month = month, day = monthrange(int(year) - 1, month)[1])
-            
-            if month <= 8:
-                date_mask = dt.datetime(year = int(year), month = month, day = monthrange(int(year), month)[1])
-            
-            df_monthly = df_year[df_year['EFFECTIVE_DATE'] <= date_mask].copy().reset_index(drop = True)
-            
-            df_monthly = df_monthly.groupby(by = ['year','Variety_Name', 'abm'], as_index = False).sum().reset_index(drop = True)
-            
-            # rename 
-            df_monthly = df_monthly.rename(columns = {'order_Q': 'order_Q_month_' + str(month)})
-            
-            # merge with df_montly_total 
-            df_monthly_total = df_monthly_total.merge(df_monthly, on = ['year', 'Variety_Name', 'abm'], how = 'left')
-        
-        # merge the orders to date
-        df_monthly_total = df_monthly_total.merge(df_to_date,
-                                                  on=['year', 'Variety_Name', 'abm'],
-                                                  how='left')
-        
-        dfs_monthly_netsales.append(df_monthly_total)
-     
-    Sales_monthly = pd.concat(dfs_monthly_netsales).reset_index(drop = True)    
-    Sales_monthly = Sales_monthly.fillna(0)
+    
+    # bucket the orders into marketing months and cumulate them in one pass
+    Sales_monthly = create_monthly_order_features(df_keys=Sale_2012_2020_lagged,
+                                                  clean_Sale=clean_Sale,
+                                                  years=years,
+                                                  order_date_year_offset=-1)
     
     Sale_all = Sale_2012_2020_lagged.merge(Sales_monthly, on = ['year', 'Variety_Name', 'abm'], how = 'left')
     
@@ -1200,369 +1069,61 @@ def create_monthly_sales(Sale_2012_2020_lagged, clean_Sale):
     return Sale_all_2023
 
 
-def get_RM(df):
-    """
-    """
-    hybrids = df['Variety_Name']
-    
-    digits = hybrids.str.findall('[0-9]+')
-    
-    for i in range(len(digits)):
-        if len(digits[i]) > 0:
-            digits[i] = digits[i][0]
-        else:
-            digits[i] = '00'
-    
-    # turn the digits series into a df
-    digits = digits.to_frame(name='digits')
-    
-    # set the RM to be 0 and then 
-    digits['RM'] = 0
-    digits['Variety_Name'] = hybrids.values
-    
-    digits = digits.drop_duplicates().reset_index(drop=True)
-    for i in range(len(digits)):
-        if int(digits.loc[i, 'digits'][:2]) <= 0:
-            digits.loc[i, 'RM'] = -0.1
-        elif (int(digits.loc[i, 'digits'][:2]) > 0  and int(digits.loc[i, 'digits'][:2]) < 5):
-            digits.loc[i, 'RM'] = 0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 5 and int(digits.loc[i, 'digits'][:2]) < 10):
-            digits.loc[i, 'RM'] = 0.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 10 and int(digits.loc[i, 'digits'][:2]) < 15):
-            digits.loc[i, 'RM'] = 1.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 15 and int(digits.loc[i, 'digits'][:2]) < 20):
-            digits.loc[i, 'RM'] = 1.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 20 and int(digits.loc[i, 'digits'][:2]) < 25):
-            digits.loc[i, 'RM'] = 2.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 25 and int(digits.loc[i, 'digits'][:2]) < 30):
-            digits.loc[i, 'RM'] = 2.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 30 and int(digits.loc[i, 'digits'][:2]) < 35):
-            digits.loc[i, 'RM'] = 3.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 35 and int(digits.loc[i, 'digits'][:2]) < 40):
-            digits.loc[i, 'RM'] = 3.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 40 and int(digits.loc[i, 'digits'][:2]) < 45):
-            digits.loc[i, 'RM'] = 4.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 45 and int(digits.loc[i, 'digits'][:2]) < 50):
-            digits.loc[i, 'RM'] = 4.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 50 and int(digits.loc[i, 'digits'][:2]) < 55):
-            digits.loc[i, 'RM'] = 5.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 55 and int(digits.loc[i, 'digits'][:2]) < 60):
-            digits.loc[i, 'RM'] = 5.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 60 and int(digits.loc[i, 'digits'][:2]) < 65):
-            digits.loc[i, 'RM'] = 6.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 65 and int(digits.loc[i, 'digits'][:2]) < 70):
-            digits.loc[i, 'RM'] = 6.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 70 and int(digits.loc[i, 'digits'][:2]) < 75):
-            digits.loc[i, 'RM'] = 7.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 75 and int(digits.loc[i, 'digits'][:2]) < 80):
-            digits.loc[i, 'RM'] = 7.5
-        elif (int(digits.loc[i, 'digits'][:2]) >= 80 and int(digits.loc[i, 'digits'][:2]) < 85):
-            digits.loc[i, 'RM'] = 8.0
-        elif (int(digits.loc[i, 'digits'][:2]) >= 85 and int(digits.loc[i, 'digits'][:2]) < 90):
-            digits.loc[i, 'RM'] = 8.5
-            
-    df_w_RM = df.merge(digits.drop(columns=['digits']),
-                       on=['Variety_Name'],
-                       how='left')
-    
-    return df_w_RM, digits
-
-
-Sale_2012_2020, clean_Sale = read_sales_filepath()
-Sale_2012_2020_lagged = create_lagged_sales(Sale_2012_2020)
-Sale_all = create_monthly_sales(Sale_2012_2020_lagged, clean_Sale).reset_index(drop=True)
-
-Sale_all, digies = get_RM(df=Sale_all)
-
-print("Sale's Structure: ", Sale_all.info())
-df_save_path = 'output/Sale_all.csv'
-Sale_all.to_csv(df_save_path, index = False)
-print("Check the fraction of missing values in Sales data: ", Sale_all.isna().sum())
-print("Sale's shape: ", Sale_all.shape)
-
-
-
-###### --------------------- Read Age & Trait Data -------------------- ######
-
-Age_Trait = pd.read_csv('Age_Trait_23_fixed.csv')
-Age_Trait['year'] = Age_Trait['year'].astype(dtype='str',copy=False)
-print("Check the fraction of missing values in Age & Trait data: ", Age_Trait.isna().sum())
-print("Age Trait's shape: ", Age_Trait.shape)
-
 ###### -------- Read Weather & County Location & FIPS_abm Data --------- ######
 def read_weather_filepath():
-    """Reads in the Blizzard data and concatenates it into a single dataframe.
+    """Reads in the Blizzard data one year at a time and aggregates each year
+    to the abm level before reading the next.
        Reads in the county_locations data 
        Reads in the abm_years
     
     Keyword arguments:
-        years -- the years we want to read the data for
+        None
     Returns:
-        Weather_2012_2020 -- the dataframe of all the county level blizzard data
+        Weather -- the dataframe of the blizzard data aggregated to the abm level
         County_Location - the dataframe of all fips code w.r.t lati and long
         FIPS_abm - the dataframe of all fips w.r.t abm and year 
         
     """
-    # define a list to store all weather data 
-    dfs_path = []
-    
-    # read in the data by year
-    for i in range(2012, 2024):
-        print("Read ", str(i), " Weather Data")
-        dfi_path = BLIZZARD_DIR + 'Blizzard_' + str(i) + '.csv'
-        dfi = pd.read_csv(dfi_path)
-        
-        # add the dataframe to the list
-        dfs_path.append(dfi)
-        
-    # concate all dataframes  
-    Weather_2012_2020 = pd.concat(dfs_path).reset_index(drop = True)
-    
     County_Location_Address = BLIZZARD_DIR + 'county_locations.csv'
-    County_Location = pd.read_csv(County_Location_Address)
+    County_Location = read_source('county_locations', County_Location_Address)
     
     FIPS_abm_Address = YEARLY_ABM_FIPS_MAP #DATA_DIR + 'abm_years.csv'
-    FIPS_abm = pd.read_csv(FIPS_abm_Address)
+    FIPS_abm = read_source('abm_fips_map', FIPS_abm_Address)
     FIPS_abm = FIPS_abm[['year', 'fips', 'abm']]
     
     # set year as str
-    Weather_2012_2020['year'] = Weather_2012_2020['year'].astype(str)
     FIPS_abm['year'] = FIPS_abm['year'].astype(str)
     
     # set fips to int in FIPS_abm
     FIPS_abm['fips'] = FIPS_abm['fips'].astype(int)
     
-    return Weather_2012_2020, County_Location, FIPS_abm
-
-Weather_2012_2020, County_Location, FIPS_abm = read_weather_filepath()
-print("Weather's Structure: ", Weather_2012_2020.info())
-print("County_Location's Structure: ", County_Location.info())
-print("FIPS_abm's Structure: ", FIPS_abm.info())
-
-
-def clean_Weather(df_weather, df_county_locations, df_fips):
-    """Adds the FIPS code to the Blizzard data, merging on the latitude and 
-    longitude.
-       Adds the abm feature to the Blizzard data, merging on the fips and year.
-       Aggregate the county-level Blizzard data to the abm level. 
-    
-    Keyword arguments:
-        df_weather -- the dataframe of the Blizzard data
-        df_county_locations -- the dataframe with fips, latitude, longtitude
-        df_fips -- the dataframe with fips, abm, year 
-    Returns:
-        Weather_w_abm -- the dataframe aggregated to the abm level
-    """   
-    Weather = Weather_2012_2020.copy()
-    Weather = df_weather.copy()
-    County_Locations = df_county_locations.copy()
-    
-    # round latitude and longitude 
-    Weather['latitude'] = Weather['latitude'].round(2)
-    Weather['longitude'] = Weather['longitude'].round(2)
+    # stream the years, keeping only the monthly abm aggregate of each
+    Weather = read_weather_abm_monthly(years=range(2012, 2024),
+                                       df_county_locations=County_Location,
+                                       df_fips=FIPS_abm)
     
-    County_Locations['latitude'] = County_Locations['latitude'].round(2)
-    County_Locations['longitude'] = County_Locations['longitude'].round(2)
-    
-    # merge Weather with County_Locations to add the FIPS feature 
-    Weather = Weather.merge(County_Locations, on=['latitude', 'longitude'], how='left')
-    
-    # merge Weather with FIPS_abm to add the abm feature
-    Weather = Weather.merge(df_fips, on = ['fips', 'year'])
-    
-    # Drop missing value 
-    print("Check the fraction of missing value: ", Weather.isna().sum()/Weather.shape[0])
-    Weather = Weather.dropna().reset_index(drop = True)
-    
-    # Drop latitude, longitude, fips 
-    dropped_cols = ['latitude', 'longitude', 'fips']
-    Weather = Weather.drop(columns = dropped_cols)
-    
-    # group by the abm, year, and month and take the avg of min/max temperatures
-    Weather = Weather.groupby(by=['year', 'month', 'abm'],as_index=False).mean().reset_index(drop=True)
-    
-    return Weather
-   
-Weather = clean_Weather(Weather_2012_2020, County_Location, FIPS_abm) 
-print("Weather's Structure: ", Weather.info())
+    return Weather, County_Location, FIPS_abm
 
-def flatten_monthly_weather(df_weather):
-    """Flattens the commodity dataframe in such a way that each month in a year
-    gets a column. The number of rows will be the number of years and abms, and 
-    the number of columns the number of months * the number of weather features
-    + 2 for the year and abm. The data inside is the weather data itself.
-    
-    Keyword arguments:
-        df_weather -- the unflattened dataframe with the weather data
-    Returns:
-        weather_flattened -- the data flattened as detailed above
-    """
-    
-    # define a list to store all flattened weather data 
-    dfs_flattened = []
-    df = df_weather.copy()
-    
-    # get the month range 
-    weather_month = df['month'].unique().tolist()
-    
-    # get weather features 
-    weather_features = ['precipitation', 'total_solar_radiation','minimum_temperature', 'maximum_temperature']
-    
-    for month in weather_month:
-        df_month = df[df['month'] == month].reset_index(drop = True)
-        
-        for feature in weather_features:
-            df_month = df_month.rename(columns = {feature: feature + "_" + str(month)})
-        
-        # drop unnecessary columns
-        df_month = df_month.drop(columns=['month']) 
-        dfs_flattened.append(df_month)
-    
-    # merge all dfs together 
-    weather_flattened = reduce(lambda df1,df2: pd.merge(df1,df2,how = 'left', on=['year', 'abm']), dfs_flattened)
-    return weather_flattened
-
-Weather_Flattened = flatten_monthly_weather(Weather)
-
-df_save_path = 'Flattened_Weather_abm_fips.csv'
-Weather_Flattened.to_csv(df_save_path, index = False)
-print("Flattened Weather's Structure: ", Weather_Flattened.info())
-print("Check the fraction of missing value in weather data: ", Weather_Flattened.isnull().sum())
-print("Flattened Weather's shape: ", Weather_Flattened.shape)
 
 ###### ------------------- Read Commodity Price Data ------------------ ######
 def read_commodity_corn_soybean():
-    """Reads in the commodity data for both corn and soybeans.
+    """Reads in the commodity data for both corn and soybeans, ingesting any
+    new quotes into the commodity store first.
     
     Keyword arguments:
         None
     Returns:
-        Commodity_Corn -- the soybean commodity data to date
-        Commodity_Soybean -- the corn commodity data to date
+        Commodity_Corn_Soybean -- the mean price of both crops by update
+            month and contract month
     """
     # read in soybean and commodity data
     Corn_Address = DATA_DIR + CM_DIR + 'corn_to_09262022.csv'
     Soybean_Address = DATA_DIR + CM_DIR + 'soybean_to_09262022.csv'
     
-    Commodity_Corn = pd.read_csv(Corn_Address)
-    Commodity_Soybean = pd.read_csv(Soybean_Address)
+    Commodity_Corn_Soybean = read_commodity_monthly([Corn_Address, Soybean_Address])
     
-    return Commodity_Corn, Commodity_Soybean
+    return Commodity_Corn_Soybean
 
-Commodity_Corn, Commodity_Soybean = read_commodity_corn_soybean()
-
-def clean_commodity(df_soy, df_corn):
-    """Cleans the soy and corn commodity data and combines them into a single
-    dataframe.
-       Aggregates the commodity data by month, crop, etc.
-    
-    Keyword arguments:
-        df_soy -- the dataframe of soy commodity data
-        df_corn -- the dataframe of corn commodity data
-    
-    Returns:
-        corn_soybean -- the combined dataframe appropriately aggregated of 
-                        the cleaned corn and soy data
-    """
-    
-    # concatenate two dfs
-    corn_soybean = pd.concat([df_soy, df_corn])
-    
-    # only get those rows that have a real valued Price
-    corn_soybean= corn_soybean[
-            corn_soybean['Price'].notnull()].reset_index(drop=True)
-    
-    # only get those rows that have a real Contract Date
-    corn_soybean = corn_soybean[
-            corn_soybean['Contract Date'].notnull()].reset_index(drop=True)
-    
-    # create datetime format
-    corn_soybean['Contract Date'] = pd.to_datetime(corn_soybean['Contract Date'])
-    corn_soybean['Update Date'] = pd.to_datetime(corn_soybean['Update Date'])
-    
-    # create new features for the day, month, and year for the contract and update 
-    corn_soybean['cYr'] = corn_soybean['Contract Date'].dt.year
-    corn_soybean['cMn'] = corn_soybean['Contract Date'].dt.month
-    corn_soybean['cDt'] = corn_soybean['Contract Date'].dt.day
-    
-    corn_soybean['uYr'] = corn_soybean['Update Date'].dt.year
-    corn_soybean['uMn'] = corn_soybean['Update Date'].dt.month
-    corn_soybean['uDt'] = corn_soybean['Update Date'].dt.day
-    
-    # drop unnecesary columns 
-    corn_soybean = corn_soybean.drop(columns=['Contract Date', 'Update Date', 'cDt', 'uDt'])
-    
-    # get the mean price, grouping by the crop and dates
-    corn_soybean = corn_soybean.groupby(
-            by=['Crop', 'uYr', 'uMn', 'cYr', 'cMn'], as_index=False).mean()
-    
-    return corn_soybean 
-    
-Commodity_Corn_Soybean = clean_commodity(Commodity_Corn, Commodity_Soybean)
-
-def create_commodity_features(df, crop_type):
-    """Creates the commodity price features.
-    
-    Keyword arguments:
-        df -- the dataframe of the corn/soy data
-        crop_type -- the crop we're creating features for
-        
-    Returns:
-        Commodity_crop -- the dataframe with the newly created commodity features
-                          from 1980 to 2022
-    """
-    # define a list to store all cm dataframes
-    dfs_commodity = []
-    
-    # define the months we will iterate over
-    update_months = [1, 2, 3, 4, 5, 6, 7]
-    if crop_type == 'soybean':
-        contract_months = [7, 8, 9, 11]
-    elif crop_type == 'corn':
-        contract_months = [7, 9, 12]
-        
-    # iterate over the contract and update months
-    for update_month in update_months:
-        for contract_month in contract_months:
-            
-            # grab the data for the relevant crop 
-            df_crop = df[df['Crop'] == crop_type].reset_index(drop = True)
-            
-            # match the years
-            df_commodity = df_crop[
-                ((df_crop['uYr'] + 1 == df_crop['cYr']) & 
-                 (df_crop['uMn'] == update_month) & 
-                 (df_crop['cMn'] == contract_month))].reset_index(drop = True)
-            
-            # create a timing feature
-            df_commodity['timing'] = ('CMprice_' + crop_type + '_' + str(update_month) + 
-                      '_' + str(contract_month))
-            
-            # rename the price feature to include crop name
-            df_commodity = df_commodity.rename(columns={'Price': 'CMprice_' + crop_type})
-            
-            # select relevant columns and rename it 
-            df_commodity = df_commodity[['cYr', 'timing', 'CMprice_' + crop_type]]
-            df_commodity = df_commodity.rename(columns={'cYr': 'year'})
-            dfs_commodity.append(df_commodity)
-    
-    # concatenate all modified cm dataframes
-    Commodity_crop = pd.concat(dfs_commodity)
-    
-    # reshape the commodity data
-    Commodity_crop = Commodity_crop.pivot(index='year', columns='timing', values='CMprice_' + crop_type)
-    
-    # reset the index to make the year value a column and set all values to be floats
-    Commodity_crop = Commodity_crop.reset_index().astype('float64')
-    
-    Commodity_crop['year'] = Commodity_crop['year'].astype('int32').astype(str)
-    
-    return Commodity_crop
-
-CM_Soybean = create_commodity_features(Commodity_Corn_Soybean, 'soybean')
-CM_Corn = create_commodity_features(Commodity_Corn_Soybean, 'corn')
-# concatenate crops together
-CM_Soybean_Corn = CM_Soybean.merge(CM_Corn, on=['year'])
 
 def create_lagged_features(df_cm):
     """Creates the lagged commodity features in the dataframe that can then be
@@ -1596,211 +1157,50 @@ def create_lagged_features(df_cm):
     df_corn_soy_lag['year'] = df_corn_soy_lag['year'].astype(str)
     return df_corn_soy_lag
 
-CM_lagged = create_lagged_features(CM_Soybean_Corn)
-df_save_path = 'CM_Soybean_Corn_Lagged.csv'
-CM_lagged.to_csv(df_save_path, index = False)
-print("Flattened Commodity_Price's Structure: ", CM_lagged.shape)
 
-###### --------------------- Read Performance Data --------------------- ######
-## State_County fips Files 
-def read_performance():
-    """ Reads in and returns the performance data as a dataframe.
+def read_commodity_lagged():
+    """Reads in the commodity data for both crops and creates the lagged
+    commodity features.
     
     Keyword arguments:
         None
     Returns:
-        Peformance_2011_2022 -- the dataframe of the performance data from 2011 to 2019
+        CM_lagged -- the dataframe of the lagged commodity features by year
     """
+    Commodity_Corn_Soybean = read_commodity_corn_soybean()
     
-    # create a list to store all H2H data
-    dfs_path = []
-    for i in range(2011, 2022):
-        print("Read ", str(i), "H2H Data")
-        dfi_path = DATA_DIR + H2H_DIR + 'Combined_H2H'+ str(i) + '.csv'
-        dfi = pd.read_csv(dfi_path)
-        
-        # set a year parameter to be the year
-        dfi['year'] = i + 1
-        dfs_path.append(dfi)
-            
-        
-    # concatenate all H2H data
-    Performance_2011_2022 = pd.concat(dfs_path)
+    # both crops' features together
+    CM_Soybean_Corn = create_commodity_features(Commodity_Corn_Soybean)
     
-    # set the 2022 data equal to the 2021 data
-    #Performance_2022 = Performance_2011_2021[
-    #        Performance_2011_2021['year'] == 2021].copy().reset_index(drop=True)
-    #Performance_2022['year'] = 2022
+    CM_lagged = create_lagged_features(CM_Soybean_Corn)
     
-    #Performance_2011_2022 = pd.concat([Performance_2011_2021, Performance_2022])
-    
-    return Performance_2011_2022
-
-
-Performance_2011_2019 = read_performance()
-
-
-def read_state_county_fips():
-    """ Reads in and returns the performance data as a dataframe.
-    
-    Keyword arguments:
-        None
-    Returns:
-        State_fips -- the dataframe of state and fips info
-        County_fips -- the dataframe of county and fips info 
-    """
-    State_fips_Address = 'state-geocodes-v2018.xlsx'
-    County_fips_Address = 'all-geocodes-v2018.xlsx'
-    State_fips = pd.read_excel(State_fips_Address, skiprows = 5)
-    County_fips = pd.read_excel(County_fips_Address, skiprows = 4)
-    return State_fips, County_fips
-
-State_fips, County_fips = read_state_county_fips()
+    return CM_lagged
 
 
-def clean_state_county(State_fips, County_fips, FIPS_abm):
-    """ Reads in and returns the performance data as a dataframe.
+###### --------------------- Read Performance Data --------------------- ######
+## State_County fips Files 
+def clean_state_county(FIPS_abm):
+    """Maps each county in the census geocodes to its abm.
     
     Keyword arguments:
-        State_fips -- the dataframe of state and fips info
-        County_fips -- the dataframe of county and fips info
         FIPS_abm - the dataframe of all fips w.r.t abm and year
     Returns:
         State_County_abm -- the dataframe of state_county, fips and abm info
     """
+    State_County_fips = read_geocodes()
     
-    ## clean state files
-    # create a dictionary for state abbrev
-    us_state_abbrev = {
-    'Alabama': 'AL',
-    'Alaska': 'AK',
-    'American Samoa': 'AS',
-    'Arizona': 'AZ',
-    'Arkansas': 'AR',
-    'California': 'CA',
-    'Colorado': 'CO',
-    'Connecticut': 'CT',
-    'Delaware': 'DE',
-    'District of Columbia': 'DC',
-    'Florida': 'FL',
-    'Georgia': 'GA',
-    'Guam': 'GU',
-    'Hawaii': 'HI',
-    'Idaho': 'ID',
-    'Illinois': 'IL',
-    'Indiana': 'IN',
-    'Iowa': 'IA',
-    'Kansas': 'KS',
-    'Kentucky': 'KY',
-    'Louisiana': 'LA',
-    'Maine': 'ME',
-    'Maryland': 'MD',
-    'Massachusetts': 'MA',
-    'Michigan': 'MI',
-    'Minnesota': 'MN',
-    'Mississippi': 'MS',
-    'Missouri': 'MO',
-    'Montana': 'MT',
-    'Nebraska': 'NE',
-    'Nevada': 'NV',
-    'New Hampshire': 'NH',
-    'New Jersey': 'NJ',
-    'New Mexico': 'NM',
-    'New York': 'NY',
-    'North Carolina': 'NC',
-    'North Dakota': 'ND',
-    'Northern Mariana Islands':'MP',
-    'Ohio': 'OH',
-    'Oklahoma': 'OK',
-    'Oregon': 'OR',
-    'Pennsylvania': 'PA',
-    'Puerto Rico': 'PR',
-    'Rhode Island': 'RI',
-    'South Carolina': 'SC',
-    'South Dakota': 'SD',
-    'Tennessee': 'TN',
-    'Texas': 'TX',
-    'Utah': 'UT',
-    'Vermont': 'VT',
-    'Virgin Islands': 'VI',
-    'Virginia': 'VA',
-    'Washington': 'WA',
-    'West Virginia': 'WV',
-    'Wisconsin': 'WI',
-    'Wyoming': 'WY'
-    }
-    
-    # convert state full name to short abbrev, such as Illinois -> IL 
-    state_abbrev = []
-    for state in State_fips['Name']:
-        if state in us_state_abbrev:
-            state_abbrev.append(us_state_abbrev[state])
-        else:
-            state_abbrev.append("NA")
-            
-    # create the State variable to store state abbrev
-    State_fips['State'] = state_abbrev
-    
-    # drop missing value
-    State_fips = State_fips[State_fips['State'] != "NA"].reset_index()
-    
-    # select important columns and pad state fips codes: "1" -> "01"
-    State_fips = State_fips[['Name','State (FIPS)', 'State']]
-    State_fips['State (FIPS)'] = State_fips['State (FIPS)'].astype(str)
-    State_fips['State (FIPS)'] = State_fips['State (FIPS)'].str.pad(width=2, side='left', fillchar='0')
-    
-    
-    
-    ## clean county files 
-    # select important columns
-    County_fips = County_fips[[ 'State Code (FIPS)', 'County Code (FIPS)', 'Area Name (including legal/statistical area description)']]
-    
-    # select information only about county
-    Areas = County_fips['Area Name (including legal/statistical area description)']
-    County = []
-    isCounty = []
-    for area in Areas:
-        area_list = area.split(" ")
-        level = area_list[-1]
-        if level == "County":
-            isCounty.append("Y")
-        else:
-            isCounty.append("N")
-        area_modified = " ".join(area_list[:-1])
-        County.append(area_modified)
-    County_fips['County'] = County
-    County_fips['isCounty'] = isCounty
-    County_fips = County_fips[County_fips['isCounty'] == "Y"]
-    
-    # pad state and county fips codes and concatenate them together: "1" -> "01 (state) and "1" -> "001" (county) -> "01001"
-    County_fips['State Code (FIPS)'] = County_fips['State Code (FIPS)'].astype(str).str.pad(width=2, side='left', fillchar='0')
-    County_fips['County Code (FIPS)'] = County_fips['County Code (FIPS)'].astype(str).str.pad(width=3, side='left', fillchar='0')
-    County_fips['fips'] = County_fips['State Code (FIPS)'] + County_fips['County Code (FIPS)']
-    
-    # rename fips columns in order to merge state and county fips dataframe together
-    State_fips = State_fips.rename(columns = {'State (FIPS)':'State Code (FIPS)'})
-    State_County_fips = State_fips.merge(County_fips, how = "outer", on = ['State Code (FIPS)'])
-    State_County_fips = State_County_fips[['Name','State', 'County', 'fips']]
-    
-    # drop missing values
-    State_County_fips = State_County_fips.dropna(how = 'any')
-
-    # get abm level using fips
-    FIPS_abm['fips'] = FIPS_abm['fips'].astype(int)
-    FIPS_abm['year'] = FIPS_abm['year'].astype(str)
-    FIPS_abm['fips'] = FIPS_abm['fips'].astype(str).str.pad(width=5, side='left', fillchar='0')
-    State_County_abm = State_County_fips.merge(FIPS_abm, how = "left", on = ['fips'])
-    State_County_abm = State_County_abm.dropna(how = 'any')
+    # get abm level using fips, without changing the caller's FIPS_abm
+    fips_abm = FIPS_abm[['year', 'fips', 'abm']].dropna(how='any')
+    fips_abm = fips_abm.assign(fips=fips_abm['fips'].astype(np.int32))
+    State_County_abm = State_County_fips.merge(fips_abm, how='inner', on=['fips'])
     
     # rename Columns
-    State_County_abm = State_County_abm.rename(columns = {'Name':'state', 'State':'State_abbrev', 'County':'county'})
+    State_County_abm = State_County_abm.rename(columns={'state_abbrev': 'State_abbrev'})
     State_County_abm = State_County_abm[['state', 'State_abbrev', 'county', 'fips', 'abm']]
-    State_County_abm = State_County_abm.drop_duplicates()
+    State_County_abm['fips'] = format_fips(State_County_abm['fips'])
+    State_County_abm = State_County_abm.drop_duplicates().reset_index(drop=True)
     return State_County_abm
 
-State_County_abm = clean_state_county(State_fips, County_fips, FIPS_abm)
-df_save_path = 'State_County_abm.csv'
-State_County_abm.to_csv(df_save_path, index = False)
 # Get abm level using fips
 
 ## H2H Files
@@ -1822,131 +1222,6 @@ def Performance_with_yield_adv(df_performance):
     
     return Performance_abm
     
-def adv_in_trait(df):
-    """Aggregates the advantage feature for a given abm within the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_within_trait -- the dataframe with the mean yield advantage
-            within the abm and within a product's trait group
-    """
-    # in_trait: c_trait == o_trait
-    in_trait = df[df['c_trait'] == df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    in_trait_abbr = in_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_within_trait = in_trait_abbr.groupby(by=['year', 'abm', 'c_trait',
-                                                 'c_hybrid'], as_index=False).mean()
-    adv_within_trait = adv_within_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_by_trait_brand'})
-    
-    return adv_within_trait
-
-def adv_outof_trait(df):
-    """Aggregates the advantage feature for a given abm outside the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_outside_trait -- the dataframe with the mean yield advantage
-            within the abm and outside a product's trait group
-    """
-    
-    # outof_trait: c_trait != o_trait
-    outof_trait = df[df['c_trait'] != df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    outof_trait_abbr = outof_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_outof_trait = outof_trait_abbr.groupby(by=['year', 'abm', 'c_trait', 
-                                                   'c_hybrid'], as_index=False).mean()
-    adv_outof_trait = adv_outof_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_outof_trait_brand'})
-    
-    return adv_outof_trait
-
-def adv_overall(df):
-    """Aggregates the advantage feature within a given abm for a product.
-    
-    Keyword arguments:
-        df -- the dataframe  of the performance data
-    Returns:
-        adv_overall -- the dataframe with the mean yield advantage within the
-            abm
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_overall = adv_abbr.groupby(by=['year', 'abm', 'c_trait', 'c_hybrid'],
-                                   as_index=False).mean()
-    
-    adv_overall = adv_overall.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_with_abm_brand'})
-    
-    return adv_overall
-
-def yield_aggregation(df):
-    """Aggregates the yield by year/abm/hybrid.
-    
-    Keyword arguments:
-        df -- the dataframe with the yield data
-    Returns:
-        df_with_yield
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'c_yield']]
-    
-    df_with_yield = adv_abbr.groupby(by=['year', 'abm', 'c_hybrid', 'c_trait'],
-                                     as_index=False).mean()
-    df_with_yield = df_with_yield.rename(columns={'c_hybrid': 'hybrid',
-                                                  'c_trait': 'trait',
-                                                  'c_yield': 'yield'})
-    return df_with_yield
-
-def merge_advantages(df):
-    """Merge yield advantage features, both inside and outside the ABMs.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_df -- the dataframe of the average yield and yield advantages,
-            broken down by year, hybrid, trait, and abm. the trait is important
-            as we'll use that for imputation
-    """
-    # aggregate within the abm by trait, out of trait, and overall, mirroring 
-    # the df used for the previous years' models
-    # TODO find out if we need to aggregate by brand as well
-    Performance_yield_adv = df.copy()    
-    Performance_in_trait = adv_in_trait(Performance_yield_adv)
-    Performance_outof_trait = adv_outof_trait(Performance_yield_adv)
-    Performance_overall = adv_overall(Performance_yield_adv)
-    yield_overall = yield_aggregation(Performance_yield_adv)
-    
-    # merge the advantages together
-    adv_df = Performance_in_trait.merge(Performance_outof_trait,
-                                    on=['year', 'abm', 'trait', 'hybrid'])
-    adv_df = adv_df.merge(Performance_overall,
-                          on=['year', 'abm', 'trait', 'hybrid'])
-    adv_df = adv_df.merge(yield_overall,
-                          on=['year', 'abm', 'trait', 'hybrid'])
-            
-    return adv_df
-
 def clean_performance(df):
     """Modify the performance w.r.t year and trait 
     
@@ -1966,137 +1241,97 @@ def clean_performance(df):
     return df
     
 
-def create_imputation_frames(df):
-    """Creates dataframes at certain levels used to impute advantage features
-    in the main dataframe.
+def create_performance_adv(State_County_abm):
+    """Reads in the H2H performance data and creates the yield advantage
+    features, broken down by year, hybrid, trait and abm.
     
     Keyword arguments:
-        df -- the dataframe of advantage features
+        State_County_abm -- the dataframe mapping state and county to abm
     Returns:
-        product_abm_level -- the dataframe with a product/abm level 
-        trait_abm_year_level -- the dataframe with a trait/abm/year level 
-        abm_year_level -- the dataframe with an abm/year level 
-        year_level -- the dataframe with a year level 
+        Performance_adv -- the dataframe of the average yield and yield
+            advantages, with the year moved to the sales year
     """
+    # stream all H2H data, each file used for the next season, aggregating the
+    # advantages within the abm by trait, out of trait, and overall chunk by
+    # chunk, keeping the products that have both in and out of trait h2hs
+    # TODO find out if we need to aggregate by brand as well
+    Performance_adv = read_h2h_advantages(
+            path_template=DATA_DIR + H2H_DIR + 'Combined_H2H{year}.csv',
+            years=range(2011, 2022),
+            location_map=State_County_abm,
+            add_yield_adv=Performance_with_yield_adv,
+            year_offset=1,
+            how='inner')
+    Performance_adv = clean_performance(Performance_adv)
     
-    # create a product/abm level aggregation, as year-to-year variation is small
-    # rename columns for each level 
-    ABM_YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_AY',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_AY',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_AY',
-        'yield': 'yield_AY'}
-    
-    PRODUCT_ABM_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_PA',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_PA',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_PA',
-        'yield': 'yield_PA'}
-    
-    TRAIT_ABM_YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_TAY',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_TAY',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_TAY',
-        'yield': 'yield_TAY'}
-    
-    YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_Y',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_Y',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_Y',
-        'yield': 'yield_Y'}
-    df['year'] = df['year'].astype(str)
-    
-    # create a product/abm level aggregation, as year-to-year variation is small
-    product_abm_df = df.drop(columns=['year', 'trait'])
-    product_abm_level = product_abm_df.groupby(by=['hybrid', 'abm'],
-                                               as_index=False).mean()
-    product_abm_level = product_abm_level.rename(columns=PRODUCT_ABM_LVL_COLS)
-    
-    # create a trait/abm/year level aggregation for if product/abm is unavailable
-    trait_abm_year_df = df.drop(columns=['hybrid'])
-    trait_abm_year_level = trait_abm_year_df.groupby(by=['trait', 'abm', 'year'],
-                                                     as_index=False).mean()
-    trait_abm_year_level = trait_abm_year_level.rename(columns=TRAIT_ABM_YEAR_LVL_COLS)
-    
-    # create an abm/year level aggregation for products without a trait value
-    abm_year_df = df.drop(columns=['trait', 'hybrid'])
-    abm_year_level = abm_year_df.groupby(by=['abm', 'year'],
-                                         as_index=False).mean()
-    abm_year_level = abm_year_level.rename(columns=ABM_YEAR_LVL_COLS)
-    
-    # create a year level aggregation so we have values for when we don't have 
-    # data for a given abm in a given year
-    year_df = df.drop(columns=['trait', 'hybrid', 'abm'])
-    year_level = year_df.groupby(by=['year'], as_index=False).mean()
-    year_level = year_level.rename(columns=YEAR_LVL_COLS)
-    
-    return product_abm_level, trait_abm_year_level, abm_year_level, year_level
-
-def impute_h2h_data(df, product_abm_level, trait_abm_year_level, abm_year_level, year_level):
-    """Imputes missing h2h data using the previously aggregated dfs.
+    return Performance_adv
+
+
+def create_imputation_cube(df):
+    """Aggregates the advantage features used to impute the main dataframe
+    to the product/abm, trait/abm/year, abm/year and year levels, in one
+    pass over the advantage features.
+    
+    Keyword arguments:
+        df -- the dataframe of advantage features
+    Returns:
+        h2h_cube -- dict of the pa, tay, ay and y levels in order of
+            preference, as given by build_level_cube
+    """
+    # the product/abm level comes first, as year-to-year variation is small,
+    # then trait/abm/year for if product/abm is unavailable, abm/year for
+    # products without a trait value and year for when we don't have data for
+    # a given abm in a given year
+    h2h_cube = build_level_cube(df=df.rename(columns={'hybrid': 'Variety_Name'}),
+                                features=ADV_FEATURES,
+                                levels={'pa': ['Variety_Name', 'abm'],
+                                        'tay': ['trait', 'abm', 'year'],
+                                        'ay': ['abm', 'year'],
+                                        'y': ['year']})
+    
+    return h2h_cube
+
+def impute_h2h_data(df, h2h_cube):
+    """Imputes missing h2h data using the previously aggregated levels.
     
     Keyword arguments:
         df -- the dataframe with the h2h data merged
-        pa_level -- the values aggregated at the product/abm level for use when
-            we have missing years
-        tay_level -- the values aggregated at the trait/abm/year level for use when 
-            we have missing products in a given abm
-        ay_level -- the values aggregated at the abm/year level for when we don't have
-            trait information for a product in a given abm for a given year
-        y_level -- the values aggregated at the year level for when we don't have
-            information for an abm for a given year
+        h2h_cube -- the advantage features aggregated at the product/abm level
+            for use when we have missing years, the trait/abm/year level for
+            missing products in a given abm, the abm/year level for when we
+            don't have trait information for a product in a given abm for a
+            given year and the year level for when we don't have information
+            for an abm for a given year
     Returns:
         df_imputed -- the dataframe with imputed h2h data
+        h2h_levels -- the side dataframe of the year, Variety_Name and abm of
+            each row with an h2h_level column of the least specific level its
+            values came from: 0 none imputed, 1 pa, 2 tay, 3 ay, 4 y and -1
+            still missing, and a <feature>_level column with the same codes
+            for each adv feature, kept out of the features of the dataset
     """
-    # the idea is to merge the aggregated frames onto the df, then set the actual adv
-    # features to be a certain aggregated value based on the logic of what is missing:
-    # if we have product data for an abm for some years but not others, use pa_level,
-    # if we have the trait data for a given abm/year, tay_level values, etc. it's 
-    # an order of preference: pa -> tay -> ay -> y
-    H2H_AGG_LEVELS = ['_PA', '_TAY', '_AY', '_Y']
-    YIELD_ADV_FEATURES = ['yield_adv_within_abm_by_trait_brand',
-                      'yield_adv_within_abm_outof_trait_brand',
-                      'yield_adv_with_abm_brand',
-                      'yield']
-    
-    
-    product_abm_level = product_abm_level.rename(columns = {'hybrid': 'Variety_Name'})
-    df_with_pa = df.merge(product_abm_level, on=['abm', 'Variety_Name'], how='left')
-    
-    df_with_tay = df_with_pa.merge(trait_abm_year_level, on=['year', 'abm', 'trait'],
-                                   how='left')
-    
-    df_with_ay = df_with_tay.merge(abm_year_level, on=['year', 'abm'], how='left')
-
-    df_with_y = df_with_ay.merge(year_level, on=['year'], how='left')
-    
-    # the features we'll drop
-    agg_features_to_drop = []
-    
-    # iterate through the levels in the order pa -> tay -> ay -> y
-    for level in H2H_AGG_LEVELS:
-    # iterate through the features we're going to impute
-        for feature in YIELD_ADV_FEATURES:
-            # replace missing values with the level of aggregation if it's available
-            df_with_y.loc[((df_with_y[feature].isnull() == True) & 
-                           (df_with_y[feature + level].isnull() == False)),
-        feature] = df_with_y.loc[((df_with_y[feature].isnull() == True) & 
-               (df_with_y[feature + level].isnull() == False)), feature + level]
-        
-            # append the feature + level to drop
-            agg_features_to_drop.append(feature + level)
-    
-    print(agg_features_to_drop)
-    df_imputed = df_with_y.drop(columns=agg_features_to_drop)
-    
-    return df_imputed
+    # the idea is to fill each missing adv feature from the aggregated levels based
+    # on the logic of what is missing: if we have product data for an abm for some
+    # years but not others, use pa_level, if we have the trait data for a given
+    # abm/year, tay_level values, etc. it's an order of preference: pa -> tay -> ay -> y
+    df_imputed = impute_from_cube(df=df,
+                                  cube=h2h_cube,
+                                  features=ADV_FEATURES,
+                                  level_col='h2h_level',
+                                  feature_levels=True)
+    
+    level_cols = ['h2h_level'] + [feature + '_level' for feature in ADV_FEATURES]
+    h2h_levels = df_imputed[['year', 'Variety_Name', 'abm'] + level_cols]
+    df_imputed = df_imputed.drop(columns=level_cols)
+    
+    return df_imputed, h2h_levels
 
 ###### ---------------- Read Consensus Forecasting Data ---------------- ######
 
 def read_2022_CF_data():
     """
     """
-    big_cf_file = pd.read_csv(DATA_DIR + BIG_CF_FILE)
+    big_cf_file = read_source('cf_forecasts', DATA_DIR + BIG_CF_FILE)
     
     # grab the forecast year 2022 piece
     big_cf_file_2022 = big_cf_file[big_cf_file['FORECAST_YEAR'] == 2021].reset_index(drop=True)
@@ -2123,7 +1358,7 @@ def read_2023_CF_data():
     Returns:
         CF_2023 -- the y + 1 forecast for 2023
     """
-    cf_file = pd.read_csv(DATA_DIR + CF_2022_FILE)
+    cf_file = read_source('cf_forecasts', DATA_DIR + CF_2022_FILE)
     
     # grab the forecast year 2022 piece
     cf_file_2023 = cf_file[cf_file['FORECAST_YEAR'] == 2022].reset_index(drop=True)
@@ -2146,7 +1381,7 @@ def read_CY_CF_data():
     """Reads in the current year consensus data
     """
     # read in the file
-    big_cf_file = pd.read_csv(DATA_DIR + CF_2023_FILE)
+    big_cf_file = read_source('cf_forecasts', DATA_DIR + CF_2023_FILE)
     
     # subset relevant columns
     big_cf_file_subset = big_cf_file[['FORECAST_YEAR', 'TEAM_KEY', 'ACRONYM_NAME',
@@ -2172,8 +1407,8 @@ def read_concensus_forecasting():
     # read in data
     CF_2016_2020_Address = DATA_DIR + 'FY16_20_soybean.csv'
     CF_2021_Address = DATA_DIR + 'FY22_01_14_21.csv'
-    CF_2016_2020 = pd.read_csv(CF_2016_2020_Address)
-    CF_2021 = pd.read_csv(CF_2021_Address, encoding='UTF-8')
+    CF_2016_2020 = read_source('cf_forecasts', CF_2016_2020_Address)
+    CF_2021 = read_source('cf_forecasts', CF_2021_Address, encoding='UTF-8')
     
     # select required columns 
     selected_columns = ['FORECAST_YEAR', 'CROP_DESCR', 'BRAND_GROUP', 'ACRONYM_NAME',
@@ -2243,42 +1478,6 @@ def impute_CY_CF(df):
     return df_impute
 
 
-CF_2016_2021 = pd.read_csv('CF_2016_2022.csv')
-
-# drop 2021 data (it's in error, and add +1 to all years)
-CF_2016_2021 = CF_2016_2021[CF_2016_2021['year'] != 2021].reset_index(drop=True)
-CF_2016_2021['year'] = CF_2016_2021['year'] + 1
-
-CF_2022 = read_2022_CF_data()
-CF_2023 = read_2023_CF_data()
-CF_2016_2022 = pd.concat([CF_2016_2021, CF_2022])
-CF_2016_2023 = pd.concat([CF_2016_2022, CF_2023])
-
-#CF_2016_2022 = read_concensus_forecasting()
-# get the current year data and merge it
-CY_CF = read_CY_CF_data()
-CF_2016_2023 = CF_2016_2023.merge(CY_CF,
-                                  on=['year', 'Variety_Name', 'TEAM_KEY'],
-                                  how='outer')
-
-# impute the CY CF forecasts
-#CF_2016_2023 = impute_CY_CF(df=CF_2016_2023)
-
-# drop missing year, hybrid, abm values 
-CF_2016_2023 = CF_2016_2023[CF_2016_2023['year'].isnull() == False].reset_index(drop=True)
-CF_2016_2023 = CF_2016_2023[CF_2016_2023['Variety_Name'].isnull() == False].reset_index(drop=True)
-CF_2016_2023 = CF_2016_2023[CF_2016_2023['TEAM_KEY'].isnull() == False].reset_index(drop=True)
-
-CF_2016_2023 = CF_2016_2023.fillna(0)
-
-
-CF_2016_2023['year'] = CF_2016_2023['year'].astype(int).astype(str)
-    
-#print("Concensus Forecasting data's Structure: ", CF_2016_2022.info())
-#print("Checking the fraction of missing value: ", CF_2016_2022.isna().sum()/CF_2016_2022.shape[0])
-df_save_path = 'CF_2016_2023.csv'
-#CF_2016_2022.to_csv(df_save_path, index = False)
-
 def merge_cf_with_abm(df_cf, df_abm_key):
     """ Reads in and returns the abm and teamkey data as a dataframe.
     
@@ -2301,8 +1500,6 @@ def merge_cf_with_abm(df_cf, df_abm_key):
     
     return CF_abm
 
-CF_abm = merge_cf_with_abm(CF_2016_2023, abm_Teamkey)
-CF_abm['year'] = CF_abm['year'].astype(dtype='str', copy=False)
 
 ###### --------------------------- Read SRP  ------------------------- ######
 def read_SRP():
@@ -2314,22 +1511,11 @@ def read_SRP():
         SRP_2011_2020 -- the fully concatenated SRP values from 2011 to 2020
     """
     
-    # define a list to store all SRP data
-    dfs_path = []
-    
     # read in the historical data and concatenate each file from 2011 to 2019
-    for year in range(2011, 2020):
-        print("Read ", str(year), "SRP Data")
-        dfi_path = DATA_DIR + HISTORICAL_SRP + str(year) + '_SRP.csv'
-        
-        dfi = pd.read_csv(dfi_path)
-        
-        # set a year parameter to be the year 
-        dfi['year'] = year
-        dfs_path.append(dfi)
-    
-    # concatenate all dataframes    
-    SRP_2011_2019 = pd.concat(dfs_path).reset_index(drop=True)
+    SRP_2011_2019 = read_yearly_csvs(
+            path_template=DATA_DIR + HISTORICAL_SRP + '{year}_SRP.csv',
+            years=range(2011, 2020),
+            source='srp_history')
     
     # select required columns
     SRP_2011_2019 = SRP_2011_2019[['year', 'VARIETY', 'SRP']]
@@ -2396,7 +1582,6 @@ def read_SRP():
     
     return SRP_2011_2023
 
-read_SRP()
 
 def impute_SRP(df):
     """Imputes missing SRP values.
@@ -2440,89 +1625,33 @@ def impute_SRP(df):
     return df_imputed
 
 
-def impute_age_one_lagged(df):
-    """
+def impute_age_one_lagged(df, lags=(1, 2)):
+    """Imputes the lagged sales of the products too young to have been sold
+    that many years before, age one products for every lag and age two
+    products for the second.
+    
+    Keyword arguments:
+        df -- the dataframe of the sales with the lagged sales and ages
+        lags -- the lags to impute, in years
+    Returns:
+        df_imputed -- the dataframe with the lagged sales of the young
+            products imputed
     """
-    # grab relevant quantities
     # the logic is to find, for a given ABM, the trend for ORDERS TO DATE
-    # and the lagged quantity
-    lagged = df[['abm', 'age', 'year', 'orders_to_date',
-                 'nets_Q', 'order_Q_month_8', 'replant_Q', 'return_Q']]
-    
-    lagged = lagged.rename(columns={'order_Q_month_8': 'order_Q'})
-    lagged_agg = lagged.groupby(by=['abm', 'year'], as_index=False).sum()
-    
-    # create ratios
-    lagged_agg['nets_Q_ratio'] = lagged_agg['nets_Q'] / lagged_agg['orders_to_date']
-    lagged_agg['order_Q_ratio'] = lagged_agg['order_Q'] / lagged_agg['orders_to_date']
-    lagged_agg['return_Q_ratio'] = lagged_agg['return_Q'] / lagged_agg['orders_to_date']
-    lagged_agg['replant_Q_ratio'] = lagged_agg['replant_Q'] / lagged_agg['orders_to_date']
-    
-    # make two copies to deprecate the year in and merge
-    last_year_agg = lagged_agg.copy()
-    two_years_agg = lagged_agg.copy()
-    
-    last_year_agg['year'] = last_year_agg['year'].astype(int) + 1
-    two_years_agg['year'] = two_years_agg['year'].astype(int) + 2
-    
-    last_year_agg['year'] = last_year_agg['year'].astype(str)
-    two_years_agg['year'] = two_years_agg['year'].astype(str)
-    
-    last_year_agg = last_year_agg[['year', 'abm', 'nets_Q_ratio', 'order_Q_ratio',
-                                   'return_Q_ratio', 'replant_Q_ratio']]
-    two_years_agg = two_years_agg[['year', 'abm', 'nets_Q_ratio', 'order_Q_ratio',
-                                   'return_Q_ratio', 'replant_Q_ratio']]
-    
-    last_year_agg = last_year_agg.rename(
-            columns={'nets_Q_ratio': 'nets_Q_ratio_1',
-                     'order_Q_ratio': 'order_Q_ratio_1',
-                     'return_Q_ratio': 'return_Q_ratio_1',
-                     'replant_Q_ratio': 'replant_Q_ratio_1'})
-    two_years_agg = two_years_agg.rename(
-            columns={'nets_Q_ratio': 'nets_Q_ratio_2',
-                     'order_Q_ratio': 'order_Q_ratio_2',
-                     'return_Q_ratio': 'return_Q_ratio_2',
-                     'replant_Q_ratio': 'replant_Q_ratio_2'})
-    
-    # merge
-    df_merged = df.merge(last_year_agg, on=['year', 'abm'], how='left')
-    df_merged = df_merged.merge(two_years_agg, on=['year', 'abm'], how='left')
-    
-    # set the return/replant values for age one products based on the CURRENT year
-    # order to date
-    df_merged.loc[df_merged['age']==1, 'nets_Q_1'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'nets_Q_ratio_1'])
-    df_merged.loc[df_merged['age']==1, 'order_Q_1'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'order_Q_ratio_1'])
-    df_merged.loc[df_merged['age']==1, 'return_Q_1'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'return_Q_ratio_1'])
-    df_merged.loc[df_merged['age']==1, 'replant_Q_1'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'replant_Q_ratio_1'])
-    
-    df_merged.loc[df_merged['age']==1, 'nets_Q_2'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'nets_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==1, 'order_Q_2'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'order_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==1, 'return_Q_2'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'return_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==1, 'replant_Q_2'] = (
-            df_merged.loc[df_merged['age']==1, 'orders_to_date'] * df_merged.loc[df_merged['age']==1, 'replant_Q_ratio_2'])
-    
-    df_merged.loc[df_merged['age']==2, 'nets_Q_2'] = (
-            df_merged.loc[df_merged['age']==2, 'orders_to_date'] * df_merged.loc[df_merged['age']==2, 'nets_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==2, 'order_Q_2'] = (
-            df_merged.loc[df_merged['age']==2, 'orders_to_date'] * df_merged.loc[df_merged['age']==2, 'order_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==2, 'return_Q_2'] = (
-            df_merged.loc[df_merged['age']==2, 'orders_to_date'] * df_merged.loc[df_merged['age']==2, 'return_Q_ratio_2'])
-    df_merged.loc[df_merged['age']==2, 'replant_Q_2'] = (
-            df_merged.loc[df_merged['age']==2, 'orders_to_date'] * df_merged.loc[df_merged['age']==2, 'replant_Q_ratio_2'])
-    
-    # drop ratios
-    df_merged = df_merged.drop(
-            columns=['nets_Q_ratio_1', 'order_Q_ratio_1', 'return_Q_ratio_1', 'replant_Q_ratio_1',
-                     'nets_Q_ratio_2', 'order_Q_ratio_2', 'return_Q_ratio_2', 'replant_Q_ratio_2'])
+    # and the lagged quantity, and set the lagged values for the young products
+    # based on the CURRENT year order to date
+    df_imputed = impute_cohort_lags(df=df,
+                                    keys=['abm'],
+                                    time_col='year',
+                                    age_col='age',
+                                    base_col='orders_to_date',
+                                    value_cols={'nets_Q': 'nets_Q',
+                                                'order_Q_month_8': 'order_Q',
+                                                'return_Q': 'return_Q',
+                                                'replant_Q': 'replant_Q'},
+                                    lags=list(lags))
     
-    return df_merged
+    return df_imputed
 
 
 ###### --------------------------- Read trait map  ------------------------- ######
@@ -2540,21 +1669,33 @@ def read_soybean_trait_map():
     trait_map = trait_map.fillna(0)
     return trait_map
 
-trait_map = read_soybean_trait_map()
-SRP_2011_2019 = read_SRP()
 
 ###### ----------------------- Merge All Datasets ---------------------- ######
-def merge_all():
+def merge_all(Sale_all, Age_Trait, Weather_Flattened, CM_lagged, Performance_adv,
+              CF_abm, SRP_2011_2019):
     """ Reads in and returns the final combined dataframe.
     
     Keyword arguments:
-        None
+        Sale_all -- the dataframe of the sales data with the RM
+        Age_Trait -- the dataframe of the age and trait data
+        Weather_Flattened -- the dataframe of the flattened weather data
+        CM_lagged -- the dataframe of the lagged commodity price data
+        Performance_adv -- the dataframe of the yield advantages
+        CF_abm -- the dataframe of the CF data at the abm level
+        SRP_2011_2019 -- the dataframe of the SRP data
     Returns:
         Sale_HP_trait_weather_CM_Performance_CF -- the dataframe of sales, 
                                                     hot products, trait/age, 
                                                     weather, commoidty price, 
                                                     concensus forecasting data
     """
+    # join on integer key codes rather than strings, decoded again on the way out
+    key_dtypes = {col: Sale_all[col].dtype for col in ['year', 'abm', 'Variety_Name']}
+    key_dtypes['trait'] = Age_Trait['trait'].dtype
+    Sale_all, Age_Trait, Weather_Flattened, CM_lagged, Performance_adv, CF_abm, SRP_2011_2019 = [
+            encode_keys(df) for df in [Sale_all, Age_Trait, Weather_Flattened, CM_lagged,
+                                       Performance_adv, CF_abm, SRP_2011_2019]]
+    
     # ## Merge Sale with HP
     # print("Step 1: Merge Sale_2012_2019 with Hot Products......")
     # Sale_HP = Sale_2012_2019_lagged.merge(Hot_Products, how = 'left', on = ['year', 'Variety_Name'])
@@ -2589,37 +1730,25 @@ def merge_all():
     ## Merge Sale_HP_trait_weather_CM with the Performance
     print("Step 5: Merge Sale_HP_trait_weather_CM with Performance......")
 
-    Performance_abm = Performance_2011_2019.merge(State_County_abm, how = 'left', on = ['state', 'county'])
-    Performance_yield_adv = Performance_with_yield_adv(Performance_abm)
-    Performance_adv = merge_advantages(Performance_yield_adv)
-    Performance_adv = clean_performance(Performance_adv)
-    df_save_path = 'Performance_adv.csv'
-    Performance_adv.to_csv(df_save_path, index = False)
-    
-    product_abm_level, trait_abm_year_level, abm_year_level, year_level = create_imputation_frames(
-                df=Performance_adv)
+    h2h_cube = create_imputation_cube(df=Performance_adv)
     # rename hybrid columns
     Performance_adv1 = Performance_adv.rename(columns = {'hybrid': 'Variety_Name'})
     # drop trait columns
     Performance_adv1 = Performance_adv1.drop(columns=['trait'])
-    Performance_adv1['year'] = Performance_adv1['year'].astype(str)
     
     Sale_HP_trait_weather_CM_Performance = Sale_HP_trait_weather_CM.merge(Performance_adv1,
                                         on=['year', 'abm', 'Variety_Name'],
                                         how='left')
     # impute the missing value 
-    Sale_HP_trait_weather_CM_Performance = impute_h2h_data(Sale_HP_trait_weather_CM_Performance, 
-                                                            product_abm_level, trait_abm_year_level,
-                                                            abm_year_level, year_level)
+    Sale_HP_trait_weather_CM_Performance, h2h_levels = impute_h2h_data(
+            Sale_HP_trait_weather_CM_Performance, h2h_cube)
     
     # replace any blank trait values with "Conventional"
-    Sale_HP_trait_weather_CM_Performance['trait'] = Sale_HP_trait_weather_CM_Performance['trait'].fillna('Conventional')
+    Sale_HP_trait_weather_CM_Performance['trait'] = Sale_HP_trait_weather_CM_Performance['trait'].fillna(
+            encode_key(['Conventional'], 'trait')[0])
     print("Step 5: Sale_HP_trait_weather_CM's shape: ", Sale_HP_trait_weather_CM_Performance.shape)
     print("..................")
     
-    df_save_path = 'Sale_HP_trait_weather_CM_Performance.csv'
-    Sale_HP_trait_weather_CM_Performance.to_csv(df_save_path, index = False)
-    
     ## Merge Sale_HP_trait_weather_CM_Performance with Concensus Forecasting
     print("Step 6: Merge Sale_HP_trait_weather_CM with CF......")
     Sale_HP_trait_weather_CM_Performance_CF = Sale_HP_trait_weather_CM_Performance.merge(CF_abm, how = 'left', on = ['year','Variety_Name','abm'])
@@ -2639,14 +1768,20 @@ def merge_all():
     
     
     
+    # decode the keys for the export
+    Sale_HP_trait_weather_CM_Performance_CF_SRP = decode_keys(
+            Sale_HP_trait_weather_CM_Performance_CF_SRP, key_dtypes)
+    Sale_HP_trait_weather = decode_keys(Sale_HP_trait_weather, key_dtypes)
+    
     print("Saving Files.........")
     df_save_path = 'Sale_HP_trait_weather_CM_Performance_CF_SRP.csv'
     Sale_HP_trait_weather_CM_Performance_CF_SRP.to_csv(df_save_path, index = False)
+    
+    # the imputation levels of the h2h features, next to rather than in the dataset
+    decode_keys(h2h_levels, key_dtypes).to_csv('h2h_imputation_levels.csv', index = False)
 
     return Sale_HP_trait_weather_CM_Performance_CF_SRP, Sale_HP_trait_weather
 
-Sale_HP_trait_weather_CM_Performance_CF_SRP, Sale_HP_trait_weather = merge_all()
-
 
 def usda_acre_data(df, crop):
     """Merges the USDA county level yield data to the sales data.
@@ -2663,7 +1798,7 @@ def usda_acre_data(df, crop):
         ACRE_COUNTY_DATA = 'soybean_acres.csv'
     
     # read in the yield data
-    county_acres = pd.read_csv(DATA_DIR + ACRE_COUNTY_DATA, low_memory=False)
+    county_acres = read_source('usda_county', DATA_DIR + ACRE_COUNTY_DATA, low_memory=False)
     
     # make the Value column numeric
     county_acres['Value'] = county_acres['Value'].str.replace(',', '').astype(float)
@@ -2681,35 +1816,12 @@ def usda_acre_data(df, crop):
                                                     on=['Year', 'State ANSI'],
                                                     how='left')
     
-    # change the county and state ANSIs to strings
-    county_acres_subset['State ANSI'] = county_acres_subset['State ANSI'].astype(str)
-    county_acres_subset['County ANSI'] = county_acres_subset['County ANSI'].astype(str)
-    
-    # strip the trailing .0s
-    county_acres_subset[
-            'County ANSI'] = county_acres_subset['County ANSI'].str.replace(r'.0$', '')
-    
-    county_acres_subset['County ANSI'] = np.where(
-            county_acres_subset['County ANSI'].str.len() == 1,
-            '00' + county_acres_subset['County ANSI'],
-            county_acres_subset['County ANSI'])
-    
-    county_acres_subset['County ANSI'] = np.where(
-            county_acres_subset['County ANSI'].str.len() == 2,
-            '0' + county_acres_subset['County ANSI'],
-            county_acres_subset['County ANSI'])
-    
-    county_acres_subset['fips'] = (county_acres_subset['State ANSI'] +
-                       county_acres_subset['County ANSI'])
-    
-    # drop rows where county_yield_subset has nan
-    nans = county_acres_subset[
-            county_acres_subset['fips'].str.contains('nan')].index
-    
-    county_acres_subset = county_acres_subset.drop(nans).reset_index(drop=True)
-    
-    # make the county_yield_subset shipping fips numeric and merge with the sales df
-    county_acres_subset['fips'] = pd.to_numeric(county_acres_subset['fips'])
+    # combine the state and county ANSIs into the fips, dropping the rows
+    # without a county
+    county_acres_subset['fips'] = combine_fips(county_acres_subset['State ANSI'],
+                                               county_acres_subset['County ANSI'])
+    county_acres_subset = county_acres_subset[
+            county_acres_subset['fips'] != MISSING_FIPS].reset_index(drop=True)
     
     county_acres_subset = county_acres_subset[
             ['Year', 'Value', 'avg_' + crop +'_acres', 'fips']]
@@ -2721,7 +1833,7 @@ def usda_acre_data(df, crop):
     
     # read in the abm map
     #abm_map = pd.read_csv(DATA_DIR + ABM_FIPS_MAP)
-    abm_map = pd.read_csv(YEARLY_ABM_FIPS_MAP)
+    abm_map = read_source('abm_fips_map', YEARLY_ABM_FIPS_MAP)
     
     abm_map = abm_map[['year', 'fips', 'abm']]
     
@@ -2759,7 +1871,7 @@ def usda_yield_data(df):
         df_w_yield -- the dataframe with the yield data added
     """
     # read in the yield data
-    county_yield = pd.read_csv(DATA_DIR + YIELD_COUNTY_DATA, low_memory=False)
+    county_yield = read_source('usda_county', DATA_DIR + YIELD_COUNTY_DATA, low_memory=False)
     
     # grab the year, values, state and county ANSIs
     county_yield_subset = county_yield[['Year', 'State ANSI', 'County ANSI', 'Value']]
@@ -2773,35 +1885,12 @@ def usda_yield_data(df):
                                                     on=['Year', 'State ANSI'],
                                                     how='left')
     
-    # change the county and state ANSIs to strings
-    county_yield_subset['State ANSI'] = county_yield_subset['State ANSI'].astype(str)
-    county_yield_subset['County ANSI'] = county_yield_subset['County ANSI'].astype(str)
-    
-    # strip the trailing .0s
-    county_yield_subset[
-            'County ANSI'] = county_yield_subset['County ANSI'].str.replace(r'.0$', '')
-    
-    county_yield_subset['County ANSI'] = np.where(
-            county_yield_subset['County ANSI'].str.len() == 1,
-            '00' + county_yield_subset['County ANSI'],
-            county_yield_subset['County ANSI'])
-    
-    county_yield_subset['County ANSI'] = np.where(
-            county_yield_subset['County ANSI'].str.len() == 2,
-            '0' + county_yield_subset['County ANSI'],
-            county_yield_subset['County ANSI'])
-    
-    county_yield_subset['fips'] = (county_yield_subset['State ANSI'] +
-                       county_yield_subset['County ANSI'])
-    
-    # drop rows where county_yield_subset has nan
-    nans = county_yield_subset[
-            county_yield_subset['fips'].str.contains('nan')].index
-    
-    county_yield_subset = county_yield_subset.drop(nans).reset_index(drop=True)
-    
-    # make the county_yield_subset shipping fips numeric and merge with the sales df
-    county_yield_subset['fips'] = pd.to_numeric(county_yield_subset['fips'])
+    # combine the state and county ANSIs into the fips, dropping the rows
+    # without a county
+    county_yield_subset['fips'] = combine_fips(county_yield_subset['State ANSI'],
+                                               county_yield_subset['County ANSI'])
+    county_yield_subset = county_yield_subset[
+            county_yield_subset['fips'] != MISSING_FIPS].reset_index(drop=True)
     
     county_yield_subset = county_yield_subset[
             ['Year', 'Value', 'avg_yield', 'fips']]
@@ -2812,7 +1901,7 @@ def usda_yield_data(df):
     county_yield_subset = county_yield_subset.drop_duplicates().reset_index(drop=True)
     
     # read in the abm map
-    abm_map = pd.read_csv(DATA_DIR + ABM_FIPS_MAP)
+    abm_map = read_source('abm_fips_map', DATA_DIR + ABM_FIPS_MAP)
     abm_map = abm_map[['fips', 'abm']]
     
     # merge on abm
@@ -2840,68 +1929,300 @@ def usda_yield_data(df):
     return df_w_yield
 
 
-# encoding trait
-print("Step 8: Encoding trait")
-Final_df = Sale_HP_trait_weather_CM_Performance_CF_SRP.merge(trait_map, how = 'left', on = ['trait']) 
+def build_sales():
+    """Reads in the sales data and creates the lagged and monthly sales
+    features with the RM of each product.
+    
+    Keyword arguments:
+        None
+    Returns:
+        Sale_all -- the dataframe of the sales data with the RM
+    """
+    Sale_2012_2020, clean_Sale = read_sales_filepath()
+    Sale_2012_2020_lagged = create_lagged_sales(Sale_2012_2020)
+    Sale_all = create_monthly_sales(Sale_2012_2020_lagged, clean_Sale).reset_index(drop=True)
+
+    Sale_all, digies = get_RM(df=Sale_all)
+
+    print("Sale's Structure: ", Sale_all.info())
+    df_save_path = 'output/Sale_all.csv'
+    Sale_all.to_csv(df_save_path, index = False)
+    print("Check the fraction of missing values in Sales data: ", Sale_all.isna().sum())
+    print("Sale's shape: ", Sale_all.shape)
+    
+    return Sale_all
+
+
+def read_age_trait():
+    """Reads in the age/trait map.
+    
+    Keyword arguments:
+        None
+    Returns:
+        Age_Trait -- the dataframe of the age and trait data
+    """
+    Age_Trait = pd.read_csv('Age_Trait_23_fixed.csv')
+    Age_Trait['year'] = Age_Trait['year'].astype(dtype='str',copy=False)
+    print("Check the fraction of missing values in Age & Trait data: ", Age_Trait.isna().sum())
+    print("Age Trait's shape: ", Age_Trait.shape)
+    
+    return Age_Trait
+
+
+def build_weather():
+    """Reads in the Blizzard data and flattens it to a column per month
+    and feature.
+    
+    Keyword arguments:
+        None
+    Returns:
+        Weather_Flattened -- the dataframe of the flattened weather data
+        FIPS_abm -- the dataframe of all fips w.r.t abm and year
+    """
+    Weather, County_Location, FIPS_abm = cached_stage(
+            'weather', read_weather_filepath,
+            input_files=[BLIZZARD_DIR, YEARLY_ABM_FIPS_MAP],
+            config_values={'WEATHER_FIPS_TOLERANCE': WEATHER_FIPS_TOLERANCE},
+            code=[weather_prep, source_schemas, yearly_reader])
+    print("Weather's Structure: ", Weather.info())
+    print("County_Location's Structure: ", County_Location.info())
+    print("FIPS_abm's Structure: ", FIPS_abm.info())
+
+    Weather_Flattened = cached_stage(
+            'weather_flattened', flatten_monthly_weather, args=[Weather],
+            config_values={'WEATHER_FEATURES': WEATHER_FEATURES})
+    print("Flattened Weather's Structure: ", Weather_Flattened.info())
+    print("Check the fraction of missing value in weather data: ", Weather_Flattened.isnull().sum())
+    print("Flattened Weather's shape: ", Weather_Flattened.shape)
+    
+    return Weather_Flattened, FIPS_abm
+
+
+def build_commodity():
+    """Creates the lagged commodity features.
+    
+    Keyword arguments:
+        None
+    Returns:
+        CM_lagged -- the dataframe of the lagged commodity features by year
+    """
+    CM_lagged = cached_stage(
+            'commodity_lagged', read_commodity_lagged,
+            input_files=[DATA_DIR + CM_DIR],
+            config_values={'CM_UPDATE_MONTHS': CM_UPDATE_MONTHS,
+                           'CM_CONTRACT_MONTHS': CM_CONTRACT_MONTHS},
+            code=[read_commodity_corn_soybean, commodity_prep, create_lagged_features])
+    print("Flattened Commodity_Price's Structure: ", CM_lagged.shape)
+    
+    return CM_lagged
+
+
+def build_state_county(FIPS_abm):
+    """Creates the map of state and county to abm.
+    
+    Keyword arguments:
+        FIPS_abm -- the dataframe of all fips w.r.t abm and year
+    Returns:
+        State_County_abm -- the dataframe mapping state and county to abm
+    """
+    State_County_abm = clean_state_county(FIPS_abm)
+    df_save_path = 'State_County_abm.csv'
+    State_County_abm.to_csv(df_save_path, index = False)
+    
+    return State_County_abm
+
+
+def build_performance(State_County_abm):
+    """Creates the H2H yield advantage features.
+    
+    Keyword arguments:
+        State_County_abm -- the dataframe mapping state and county to abm
+    Returns:
+        Performance_adv -- the dataframe of the yield advantages
+    """
+    Performance_adv = cached_stage(
+            'performance_adv', create_performance_adv, args=[State_County_abm],
+            input_files=[DATA_DIR + H2H_DIR],
+            code=[Performance_with_yield_adv, yield_advantages, clean_performance,
+                  source_schemas, yearly_reader, geography])
+    
+    return Performance_adv
+
+
+def build_CF():
+    """Reads in the consensus forecasting data at the abm level.
+    
+    Keyword arguments:
+        None
+    Returns:
+        CF_abm -- the dataframe of the CF data at the abm level
+    """
+    CF_2016_2021 = pd.read_csv('CF_2016_2022.csv')
+
+    # drop 2021 data (it's in error, and add +1 to all years)
+    CF_2016_2021 = CF_2016_2021[CF_2016_2021['year'] != 2021].reset_index(drop=True)
+    CF_2016_2021['year'] = CF_2016_2021['year'] + 1
+
+    CF_2022 = read_2022_CF_data()
+    CF_2023 = read_2023_CF_data()
+    CF_2016_2022 = pd.concat([CF_2016_2021, CF_2022])
+    CF_2016_2023 = pd.concat([CF_2016_2022, CF_2023])
+
+    #CF_2016_2022 = read_concensus_forecasting()
+    # get the current year data and merge it
+    CY_CF = read_CY_CF_data()
+    CF_2016_2023 = CF_2016_2023.merge(CY_CF,
+                                      on=['year', 'Variety_Name', 'TEAM_KEY'],
+                                      how='outer')
+
+    # impute the CY CF forecasts
+    #CF_2016_2023 = impute_CY_CF(df=CF_2016_2023)
+
+    # drop missing year, hybrid, abm values
+    CF_2016_2023 = CF_2016_2023[CF_2016_2023['year'].isnull() == False].reset_index(drop=True)
+    CF_2016_2023 = CF_2016_2023[CF_2016_2023['Variety_Name'].isnull() == False].reset_index(drop=True)
+    CF_2016_2023 = CF_2016_2023[CF_2016_2023['TEAM_KEY'].isnull() == False].reset_index(drop=True)
+
+    CF_2016_2023 = CF_2016_2023.fillna(0)
+
+    CF_2016_2023['year'] = CF_2016_2023['year'].astype(int).astype(str)
+
+    #print("Concensus Forecasting data's Structure: ", CF_2016_2022.info())
+    #print("Checking the fraction of missing value: ", CF_2016_2022.isna().sum()/CF_2016_2022.shape[0])
+    df_save_path = 'CF_2016_2023.csv'
+    #CF_2016_2022.to_csv(df_save_path, index = False)
+
+    CF_abm = merge_cf_with_abm(CF_2016_2023, read_abm_teamkey_file())
+    CF_abm['year'] = CF_abm['year'].astype(dtype='str', copy=False)
+    
+    return CF_abm
+
+
+def build_SRP():
+    """Reads in the SRP data.
+    
+    Keyword arguments:
+        None
+    Returns:
+        SRP_2011_2019 -- the dataframe of the SRP data
+    """
+    SRP_2011_2019 = cached_stage('SRP', read_SRP, input_files=[DATA_DIR + HISTORICAL_SRP],
+                                 code=[source_schemas, yearly_reader])
+    
+    return SRP_2011_2019
+
+
+# the branches of the pipeline, each run as soon as its inputs are ready and
+# merged together by run
+PIPELINE_STAGES = [
+        {'name': 'sales', 'function': build_sales,
+         'inputs': [], 'outputs': ['Sale_all']},
+        {'name': 'age_trait', 'function': read_age_trait,
+         'inputs': [], 'outputs': ['Age_Trait']},
+        {'name': 'weather', 'function': build_weather,
+         'inputs': [], 'outputs': ['Weather_Flattened', 'FIPS_abm']},
+        {'name': 'commodity', 'function': build_commodity,
+         'inputs': [], 'outputs': ['CM_lagged']},
+        {'name': 'state_county', 'function': build_state_county,
+         'inputs': ['FIPS_abm'], 'outputs': ['State_County_abm']},
+        {'name': 'performance', 'function': build_performance,
+         'inputs': ['State_County_abm'], 'outputs': ['Performance_adv']},
+        {'name': 'CF', 'function': build_CF,
+         'inputs': [], 'outputs': ['CF_abm']},
+        {'name': 'SRP', 'function': build_SRP,
+         'inputs': [], 'outputs': ['SRP_2011_2019']},
+        {'name': 'trait_map', 'function': read_soybean_trait_map,
+         'inputs': [], 'outputs': ['trait_map']}]
+
+
+def run(config=RUN_CONFIG):
+    """Builds the full dataset, reading every source and writing the
+    intermediate and final csvs. Nothing is read or written on import. The
+    independent branches run in parallel, see PIPELINE_STAGES.
+    
+    Keyword arguments:
+        config -- dict with the settings of the run, output_file being the
+            path the final dataset is written to and max_workers the number
+            of processes the branches run in
+    Returns:
+        Final_df_acreage -- the final dataset
+    """
+    frames = run_stage_graph(PIPELINE_STAGES, max_workers=config['max_workers'])
+
+    Sale_HP_trait_weather_CM_Performance_CF_SRP, Sale_HP_trait_weather = merge_all(
+            Sale_all=frames['Sale_all'], Age_Trait=frames['Age_Trait'],
+            Weather_Flattened=frames['Weather_Flattened'], CM_lagged=frames['CM_lagged'],
+            Performance_adv=frames['Performance_adv'], CF_abm=frames['CF_abm'],
+            SRP_2011_2019=frames['SRP_2011_2019'])
+
+    # encoding trait
+    print("Step 8: Encoding trait")
+    Final_df = Sale_HP_trait_weather_CM_Performance_CF_SRP.merge(frames['trait_map'], how = 'left', on = ['trait'])
+
+    # add county yield data
+    #sales_w_county_yield = usda_yield_data(df=Final_df)
+
+    # add the USDA acreage data
+    #sales_w_corn_acreage = usda_acre_data(df=sales_w_county_yield, crop='corn')
+    #sales_w_soybean_acreage = usda_acre_data(df=sales_w_corn_acreage, crop='soybean')
+
+    #sales_w_soybean_acreage = sales_w_soybean_acreage.replace(-np.inf, 0)
+    #sales_w_soybean_acreage = sales_w_soybean_acreage.replace(np.inf, 0)
+    #sales_w_soybean_acreage = sales_w_soybean_acreage.fillna(0)
 
-# add county yield data
-#sales_w_county_yield = usda_yield_data(df=Final_df)
+    #Final_df_acreage = sales_w_soybean_acreage.drop(columns = ['trait'])
 
-# add the USDA acreage data
-#sales_w_corn_acreage = usda_acre_data(df=sales_w_county_yield, crop='corn')
-#sales_w_soybean_acreage = usda_acre_data(df=sales_w_corn_acreage, crop='soybean')
+    Final_df_acreage = Final_df.replace(-np.inf, 0)
+    Final_df_acreage = Final_df_acreage.replace(np.inf, 0)
+    Final_df_acreage = Final_df_acreage.fillna(0)
 
-#sales_w_soybean_acreage = sales_w_soybean_acreage.replace(-np.inf, 0)
-#sales_w_soybean_acreage = sales_w_soybean_acreage.replace(np.inf, 0)
-#sales_w_soybean_acreage = sales_w_soybean_acreage.fillna(0)
+    # fill age 0 products with age 1
+    Final_df_acreage['age'] = Final_df_acreage['age'].replace(0, 1)
 
-#Final_df_acreage = sales_w_soybean_acreage.drop(columns = ['trait'])
+    # drop any UNKNOWNs
+    Final_df_acreage = Final_df_acreage.rename(columns={'Variety_Name': 'hybrid'})
+    Final_df_acreage = Final_df_acreage[
+            Final_df_acreage['hybrid'] != 'UNKNOWN'].reset_index(drop=True)
 
-Final_df_acreage = Final_df.replace(-np.inf, 0)
-Final_df_acreage = Final_df_acreage.replace(np.inf, 0)
-Final_df_acreage = Final_df_acreage.fillna(0)
+    # rename and drop monthly columns
+    Final_df_acreage = Final_df_acreage.rename(columns={'order_Q_month_8': 'order_Q'})
+    Final_df_acreage = Final_df_acreage.drop(
+            columns=['order_Q_month_1', 'order_Q_month_2', 'order_Q_month_3',
+                     'order_Q_month_4', 'order_Q_month_5', 'order_Q_month_6',
+                     'order_Q_month_7', 'order_Q_month_9', 'order_Q_month_10',
+                     'order_Q_month_11', 'order_Q_month_12'])
 
-# fill age 0 products with age 1
-Final_df_acreage['age'] = Final_df_acreage['age'].replace(0, 1)
+    df_save_path = config['output_file']
+    Final_df_acreage.to_csv(df_save_path, index = False)
 
-# drop any UNKNOWNs
-Final_df_acreage = Final_df_acreage.rename(columns={'Variety_Name': 'hybrid'})
-Final_df_acreage = Final_df_acreage[
-        Final_df_acreage['hybrid'] != 'UNKNOWN'].reset_index(drop=True)
+    Final_df_acreage_hybrids_abm_2023 = Final_df_acreage[['hybrid', 'abm', 'year', 'SRP']].copy()
+    Final_df_acreage_hybrids_abm_2023 = Final_df_acreage[
+            Final_df_acreage['year'] == '2023'].reset_index(drop=True)
 
-# rename and drop monthly columns
-Final_df_acreage = Final_df_acreage.rename(columns={'order_Q_month_8': 'order_Q'})
-Final_df_acreage = Final_df_acreage.drop(
-        columns=['order_Q_month_1', 'order_Q_month_2', 'order_Q_month_3',
-                 'order_Q_month_4', 'order_Q_month_5', 'order_Q_month_6',
-                 'order_Q_month_7', 'order_Q_month_9', 'order_Q_month_10',
-                 'order_Q_month_11', 'order_Q_month_12'])
+    print(Final_df_acreage_hybrids_abm_2023[
+            Final_df_acreage_hybrids_abm_2023.duplicated() == True])
 
-df_save_path = 'r_r_yunxuan_2023_nov28_agefix_daily_lagfix_D1MS_CY.csv'
-Final_df_acreage.to_csv(df_save_path, index = False)
+    df_save_path_no_fcst = 'r_r_yunxuan_2023_nov28_agefix_daily_lagfix_D1MS_no_CY.csv'
+    Final_df_acreage_no_FCST = Final_df_acreage[
+            (Final_df_acreage['TEAM_Y1_FCST_1'] != 0) & (Final_df_acreage['TEAM_FCST_QTY_10'] != 0)].reset_index(
+            drop=True)
 
-Final_df_acreage_hybrids_abm_2023 = Final_df_acreage[['hybrid', 'abm', 'year', 'SRP']].copy()
-Final_df_acreage_hybrids_abm_2023 = Final_df_acreage[
-        Final_df_acreage['year'] == '2023'].reset_index(drop=True)
+    Final_df_acreage_no_FCST.to_csv(df_save_path_no_fcst, index=False)
 
-print(Final_df_acreage_hybrids_abm_2023[
-        Final_df_acreage_hybrids_abm_2023.duplicated() == True])
+    Final_df_acreage_hybrids_abm_2023[
+            ['hybrid', 'SRP']].groupby(by=['hybrid'], as_index=False).mean().to_csv('SRP_2023s_tim.csv', index=False)
 
-df_save_path_no_fcst = 'r_r_yunxuan_2023_nov28_agefix_daily_lagfix_D1MS_no_CY.csv'
-Final_df_acreage_no_FCST = Final_df_acreage[
-        (Final_df_acreage['TEAM_Y1_FCST_1'] != 0) & (Final_df_acreage['TEAM_FCST_QTY_10'] != 0)].reset_index(
-        drop=True)
+    seventeen_on = Final_df_acreage[
+            Final_df_acreage['year'].isin(['2017', '2018', '2019', '2020', '2021', '2022', '2023'])]
+    seventeen_on_subset = seventeen_on[['year', 'orders_to_date', 'TEAM_FCST_QTY_10']]
 
-Final_df_acreage_no_FCST.to_csv(df_save_path_no_fcst, index=False)
+    seventeen_on_grouped = seventeen_on_subset.groupby(by=['year'],as_index = False).sum()
 
-Final_df_acreage_hybrids_abm_2023[
-        ['hybrid', 'SRP']].groupby(by=['hybrid'], as_index=False).mean().to_csv('SRP_2023s_tim.csv', index=False)
+    seventeen_on_grouped['ratio'] = (
+            seventeen_on_grouped['orders_to_date'] / seventeen_on_grouped['TEAM_FCST_QTY_10'])
 
-seventeen_on = Final_df_acreage[
-        Final_df_acreage['year'].isin(['2017', '2018', '2019', '2020', '2021', '2022', '2023'])]
-seventeen_on_subset = seventeen_on[['year', 'orders_to_date', 'TEAM_FCST_QTY_10']]
+    return Final_df_acreage
 
-seventeen_on_grouped = seventeen_on_subset.groupby(by=['year'],as_index = False).sum()
 
-seventeen_on_grouped['ratio'] = (
-        seventeen_on_grouped['orders_to_date'] / seventeen_on_grouped['TEAM_FCST_QTY_10'])
\ No newline at end of file
+if __name__ == '__main__':
+    run(RUN_CONFIG)
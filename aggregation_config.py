@@ -18,8 +18,35 @@ CF_2023_FILE_Y1 = 'FY23_Soy_011923.xlsx'
 
 BLIZZARD_DIR = '../NA-soy-pricing/dataframe_construction_r_r/blizzard/county_data/'
 
+# largest distance, in degrees, a blizzard grid point that doesn't match a county
+# location once rounded can be from the closest county location and still be used
+WEATHER_FIPS_TOLERANCE = 0.02
+
+# the blizzard features that get a column per month in the flattened weather
+WEATHER_FEATURES = ['precipitation', 'total_solar_radiation', 'minimum_temperature',
+                    'maximum_temperature']
+
+# number of blizzard years read at the same time, every one of them holding a
+# full year of grid data in memory until it is reduced to its monthly sums
+WEATHER_READ_WORKERS = 1
+
 CM_DIR = 'CM_prep/'
 
+# the months of the quotes the commodity features are taken from, and the
+# months of each crop's contracts for the next year they quote
+CM_UPDATE_MONTHS = [1, 2, 3, 4, 5, 6, 7]
+CM_CONTRACT_MONTHS = {'soybean': [7, 8, 9, 11], 'corn': [7, 9, 12]}
+
+# parquet store of the commodity quotes by crop and update year, with their
+# monthly sums, so a price refresh only rewrites the years it has quotes in
+CM_STORE_DIR = 'CM_parquet/'
+
+# the census geocode spreadsheets, and the parquet cache of the county table
+# parsed from them
+STATE_GEOCODES = 'state-geocodes-v2018.xlsx'
+COUNTY_GEOCODES = 'all-geocodes-v2018.xlsx'
+GEOCODES_CACHE_DIR = 'geocodes_parquet/'
+
 # the data directory
 DATA_DIR = '../NA-soy-pricing/data/'
 
@@ -48,6 +75,23 @@ SALES_2021_W_DATE = 'D1_MS_21_product_location_202110281734.csv'
 
 SALES_DIR = 'sales_data/'
 
+# parquet copy of the yearly sales csvs, rebuilt whenever a csv changes
+SALES_CACHE_DIR = 'sales_data_parquet/'
+
+# parquet copies of the pipeline stage results, keyed by their inputs, config and code
+STAGE_CACHE_DIR = 'stage_cache/'
+
+# number of results kept for each stage, so the pipelines sharing a stage name
+# with different inputs don't evict each other's entries
+STAGE_CACHE_ENTRIES = 4
+
+# number of processes the independent pipeline branches run in, each holding
+# its intermediate frames in memory until they are sent back to be merged
+STAGE_GRAPH_WORKERS = 2
+
+# parquet copy of the digits parsed from every product name, for the RMs
+RM_CACHE_DIR = 'RM_parquet/'
+
 OLD_2020 = '2020_old.csv'
 
 YIELD_COUNTY_DATA = 'county_soybean_yield.csv'
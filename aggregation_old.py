@@ -7,18 +7,29 @@ Created on Mon Jul 26 13:58:06 2021
 """
 
 import pandas as pd 
-from functools import reduce 
+from functools import lru_cache, reduce
 import numpy as np
 from calendar import monthrange
 import datetime as dt
-from pandasql import sqldf
 
 from aggregation_config import(ABM_TABLE, DATA_DIR, OLD_2020, SALES_DIR)
+from commodity_prep import create_commodity_features
+from geography import format_fips, read_geocodes
+from level_imputation import build_level_cube, impute_from_cube
+from sales_lags import create_lag_features
+from yearly_reader import read_yearly_csvs
+from yield_advantages import ADV_FEATURES, aggregate_advantages
+
+
+# the settings used when the module is run as a script
+RUN_CONFIG = {'output_file': r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Final_order_df_2012_2020.csv'}
 
 
 ###### --------------------- Read ABM & Teamkey Map  ------------------- ######
+@lru_cache(maxsize=None)
 def read_abm_teamkey_file():
-    """ Reads in and returns the abm and teamkey data as a dataframe.
+    """ Reads in and returns the abm and teamkey data as a dataframe. The file
+    is only read once and later calls share the cached dataframe.
     
     Keyword arguments:
         None
@@ -36,14 +47,13 @@ def read_abm_teamkey_file():
     # selcted required columns 
     abm_Teamkey = abm_Teamkey[['abm','TEAM_KEY']]
     return abm_Teamkey
-abm_Teamkey = read_abm_teamkey_file()
 
 ###### ---------------------- Read Sales Data ------------------------ ######
 def Preprocess_2020_sale():
     df2020_path = DATA_DIR + SALES_DIR + OLD_2020
     dfsale_2020 = pd.read_csv(df2020_path)
     dfsale_2020 = dfsale_2020.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
-    dfsale_2020 = dfsale_2020.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
+    dfsale_2020 = dfsale_2020.merge(read_abm_teamkey_file(), how = 'left', on = ['TEAM_KEY'])
     dfsale_2020 = dfsale_2020.rename(columns = {'abm':'SLS_LVL_2_ID'})
     
     df2020_path_new = DATA_DIR + SALES_DIR + '2020.csv'
@@ -143,19 +153,15 @@ def create_lagged_sales(df):
     
     df = df.rename(columns = {'Variety_Name':'hybrid'})
     df['year'] = df['year'].astype(int)
-    sales_all = df.copy()
-
+    sales_all = df[['year', 'abm', 'hybrid', 'nets_Q', 'order_Q', 'return_Q', 'replant_Q']]
 
-    # define the selection criteria as strings to use in the sqldf commmand
-    # this is principally just for readability
-    current_year_q = "select a.year, a.abm, a.hybrid, a.nets_Q, a.order_Q, a.return_Q, a.replant_Q, "
-    last_year_q = "b.nets_Q as nets_Q_1, b.order_Q as order_Q_1, b.return_Q as return_Q_1, b.replant_Q as replant_Q_1, "
-    two_years_q = "c.nets_Q as nets_Q_2, c.order_Q as order_Q_2, c.return_Q as return_Q_2 from sales_all "
-    join_last_year = "a left join sales_all b on a.hybrid = b.hybrid and a.abm = b.abm and a.year = b.year + 1 "
-    join_two_years = "left join sales_all c on a.hybrid = c.hybrid and a.abm = c.abm and a.year = c.year + 2"
- 
-    sales_with_lag = sqldf(current_year_q + last_year_q + two_years_q + 
-                           join_last_year + join_two_years)
+    # look up each product's sales in the ABM one and two years before
+    sales_with_lag = create_lag_features(df=sales_all,
+                                         keys=['abm', 'hybrid'],
+                                         time_col='year',
+                                         value_cols=['nets_Q', 'order_Q', 'return_Q', 'replant_Q'],
+                                         lags=[1, 2])
+    sales_with_lag = sales_with_lag.drop(columns=['replant_Q_2'])
     
     # impute, replacing the NaNs with zeros
     for feature in LAGGED_FEATURES:
@@ -232,16 +238,6 @@ def create_monthly_sales(Sale_2012_2020_lagged, clean_Sale):
     
     return  Sale_all
 
-Sale_2012_2020, clean_Sale = read_sales_filepath()
-Sale_2012_2020_lagged = create_lagged_sales(Sale_2012_2020)
-Sale_all = create_monthly_sales(Sale_2012_2020_lagged, clean_Sale)
-print("Sale's Structure: ", Sale_all.info())
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Sale_all.csv'
-Sale_all.to_csv(df_save_path, index = False)
-print("Check the fraction of missing values in Sales data: ", Sale_all.isna().sum())
-print("Sale's shape: ", Sale_all.shape)
-
-
 
 ###### --------------------- Read Age & Trait Data -------------------- ######
 def read_age_trait_filepath():
@@ -264,12 +260,6 @@ def read_age_trait_filepath():
     Age_Trait['year'] = Age_Trait['year'].astype(str)
     return Age_Trait
 
-Age_Trait = read_age_trait_filepath()
-print("Age Trait's Structure: ", Age_Trait.info())
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Age_Trait.csv'
-Age_Trait.to_csv(df_save_path, index = False)
-print("Check the fraction of missing values in Age & Trait data: ", Age_Trait.isna().sum())
-print("Age Trait's shape: ", Age_Trait.shape)
 
 ###### -------- Read Weather & County Location & FIPS_abm Data --------- ######
 def read_weather_filepath():
@@ -315,11 +305,6 @@ def read_weather_filepath():
     
     return Weather_2012_2020, County_Location, FIPS_abm
 
-Weather_2012_2020, County_Location, FIPS_abm = read_weather_filepath()
-print("Weather's Structure: ", Weather_2012_2020.info())
-print("County_Location's Structure: ", County_Location.info())
-print("FIPS_abm's Structure: ", FIPS_abm.info())
-
 
 def clean_Weather(df_weather, df_county_locations, df_fips):
     """Adds the FIPS code to the Blizzard data, merging on the latitude and 
@@ -334,7 +319,7 @@ def clean_Weather(df_weather, df_county_locations, df_fips):
     Returns:
         Weather_w_abm -- the dataframe aggregated to the abm level
     """   
-    Weather = Weather_2012_2020.copy()
+    Weather = df_weather.copy()
     Weather = df_weather.copy()
     County_Locations = df_county_locations.copy()
     
@@ -364,8 +349,6 @@ def clean_Weather(df_weather, df_county_locations, df_fips):
     
     return Weather
    
-Weather = clean_Weather(Weather_2012_2020, County_Location, FIPS_abm) 
-print("Weather's Structure: ", Weather.info())
 
 def flatten_monthly_weather(df_weather):
     """Flattens the commodity dataframe in such a way that each month in a year
@@ -403,13 +386,6 @@ def flatten_monthly_weather(df_weather):
     weather_flattened = reduce(lambda df1,df2: pd.merge(df1,df2,how = 'left', on=['year', 'abm']), dfs_flattened)
     return weather_flattened
 
-Weather_Flattened = flatten_monthly_weather(Weather)
-
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Flattened_Weather_abm_fips.csv'
-Weather_Flattened.to_csv(df_save_path, index = False)
-print("Flattened Weather's Structure: ", Weather_Flattened.info())
-print("Check the fraction of missing value in weather data: ", Weather_Flattened.isnull().sum())
-print("Flattened Weather's shape: ", Weather_Flattened.shape)
 
 ###### ------------------- Read Commodity Price Data ------------------ ######
 def read_commodity_corn_soybean():
@@ -430,7 +406,6 @@ def read_commodity_corn_soybean():
     
     return Commodity_Corn, Commodity_Soybean
 
-Commodity_Corn, Commodity_Soybean = read_commodity_corn_soybean()
 
 def clean_commodity(df_soy, df_corn):
     """Cleans the soy and corn commodity data and combines them into a single
@@ -479,71 +454,6 @@ def clean_commodity(df_soy, df_corn):
     
     return corn_soybean 
     
-Commodity_Corn_Soybean = clean_commodity(Commodity_Corn, Commodity_Soybean)
-
-def create_commodity_features(df, crop_type):
-    """Creates the commodity price features.
-    
-    Keyword arguments:
-        df -- the dataframe of the corn/soy data
-        crop_type -- the crop we're creating features for
-        
-    Returns:
-        Commodity_crop -- the dataframe with the newly created commodity features
-                          from 1980 to 2022
-    """
-    # define a list to store all cm dataframes
-    dfs_commodity = []
-    
-    # define the months we will iterate over
-    update_months = [1, 2, 3, 4, 5, 6, 7]
-    if crop_type == 'soybean':
-        contract_months = [7, 8, 9, 11]
-    elif crop_type == 'corn':
-        contract_months = [7, 9, 12]
-        
-    # iterate over the contract and update months
-    for update_month in update_months:
-        for contract_month in contract_months:
-            
-            # grab the data for the relevant crop 
-            df_crop = df[df['Crop'] == crop_type].reset_index(drop = True)
-            
-            # match the years
-            df_commodity = df_crop[
-                ((df_crop['uYr'] + 1 == df_crop['cYr']) & 
-                 (df_crop['uMn'] == update_month) & 
-                 (df_crop['cMn'] == contract_month))].reset_index(drop = True)
-            
-            # create a timing feature
-            df_commodity['timing'] = ('CMprice_' + crop_type + '_' + str(update_month) + 
-                      '_' + str(contract_month))
-            
-            # rename the price feature to include crop name
-            df_commodity = df_commodity.rename(columns={'Price': 'CMprice_' + crop_type})
-            
-            # select relevant columns and rename it 
-            df_commodity = df_commodity[['cYr', 'timing', 'CMprice_' + crop_type]]
-            df_commodity = df_commodity.rename(columns={'cYr': 'year'})
-            dfs_commodity.append(df_commodity)
-    
-    # concatenate all modified cm dataframes
-    Commodity_crop = pd.concat(dfs_commodity)
-    
-    # reshape the commodity data
-    Commodity_crop = Commodity_crop.pivot(index='year', columns='timing', values='CMprice_' + crop_type)
-    
-    # reset the index to make the year value a column and set all values to be floats
-    Commodity_crop = Commodity_crop.reset_index().astype('float64')
-    
-    Commodity_crop['year'] = Commodity_crop['year'].astype('int32').astype(str)
-    return Commodity_crop
-
-
-CM_Soybean = create_commodity_features(Commodity_Corn_Soybean, 'soybean')
-CM_Corn = create_commodity_features(Commodity_Corn_Soybean, 'corn')
-# concatenate crops together
-CM_Soybean_Corn = CM_Soybean.merge(CM_Corn, on=['year'])
 
 def create_lagged_features(df_cm):
     """Creates the lagged commodity features in the dataframe that can then be
@@ -577,10 +487,6 @@ def create_lagged_features(df_cm):
     df_corn_soy_lag['year'] = df_corn_soy_lag['year'].astype(str)
     return df_corn_soy_lag
 
-CM_lagged = create_lagged_features(CM_Soybean_Corn)
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/CM_Soybean_Corn_Lagged.csv'
-CM_lagged.to_csv(df_save_path, index = False)
-print("Flattened Commodity_Price's Structure: ", CM_lagged.shape)
 
 ###### --------------------- Read Performance Data --------------------- ######
 ## State_County fips Files 
@@ -593,183 +499,36 @@ def read_performance():
         Peformance_2011_2019 -- the dataframe of the performance data from 2011 to 2019
     """
     
-    # create a list to store all H2H data
-    dfs_path = []
-    for i in range(2011, 2021):
-        print("Read ", str(i), "H2H Data")
-        dfi_path = r'/Users/gmtxy/OneDrive - Bayer/Performance/Combined_H2H{year}.csv'.format(year = i)
-        dfi = pd.read_csv(dfi_path)
-        
-        # set a year parameter to be the year
-        dfi['year'] = i
-        dfs_path.append(dfi)
-        
-    # concatenate all H2H data
-    Performance_2011_2019 = pd.concat(dfs_path)
+    # read all H2H data, several files at a time
+    Performance_2011_2019 = read_yearly_csvs(
+            path_template=r'/Users/gmtxy/OneDrive - Bayer/Performance/Combined_H2H{year}.csv',
+            years=range(2011, 2021))
     return Performance_2011_2019
-Performance_2011_2019 = read_performance()
 
-def read_state_county_fips():
-    """ Reads in and returns the performance data as a dataframe.
+def clean_state_county(FIPS_abm):
+    """Maps each county in the census geocodes to its abm.
     
     Keyword arguments:
-        None
-    Returns:
-        State_fips -- the dataframe of state and fips info
-        County_fips -- the dataframe of county and fips info 
-    """
-    State_fips_Address = r'/Users/gmtxy/OneDrive - Bayer/Performance/state-geocodes-v2018.xlsx'
-    County_fips_Address = r'/Users/gmtxy/OneDrive - Bayer/Performance/all-geocodes-v2018.xlsx'
-    State_fips = pd.read_excel(State_fips_Address, skiprows = 5)
-    County_fips = pd.read_excel(County_fips_Address, skiprows = 4)
-    return State_fips, County_fips
-
-State_fips, County_fips = read_state_county_fips()
-
-
-def clean_state_county(State_fips, County_fips, FIPS_abm):
-    """ Reads in and returns the performance data as a dataframe.
-    
-    Keyword arguments:
-        State_fips -- the dataframe of state and fips info
-        County_fips -- the dataframe of county and fips info
         FIPS_abm - the dataframe of all fips w.r.t abm and year
     Returns:
         State_County_abm -- the dataframe of state_county, fips and abm info
     """
+    State_County_fips = read_geocodes(
+            state_path=r'/Users/gmtxy/OneDrive - Bayer/Performance/state-geocodes-v2018.xlsx',
+            county_path=r'/Users/gmtxy/OneDrive - Bayer/Performance/all-geocodes-v2018.xlsx')
     
-    ## clean state files
-    # create a dictionary for state abbrev
-    us_state_abbrev = {
-    'Alabama': 'AL',
-    'Alaska': 'AK',
-    'American Samoa': 'AS',
-    'Arizona': 'AZ',
-    'Arkansas': 'AR',
-    'California': 'CA',
-    'Colorado': 'CO',
-    'Connecticut': 'CT',
-    'Delaware': 'DE',
-    'District of Columbia': 'DC',
-    'Florida': 'FL',
-    'Georgia': 'GA',
-    'Guam': 'GU',
-    'Hawaii': 'HI',
-    'Idaho': 'ID',
-    'Illinois': 'IL',
-    'Indiana': 'IN',
-    'Iowa': 'IA',
-    'Kansas': 'KS',
-    'Kentucky': 'KY',
-    'Louisiana': 'LA',
-    'Maine': 'ME',
-    'Maryland': 'MD',
-    'Massachusetts': 'MA',
-    'Michigan': 'MI',
-    'Minnesota': 'MN',
-    'Mississippi': 'MS',
-    'Missouri': 'MO',
-    'Montana': 'MT',
-    'Nebraska': 'NE',
-    'Nevada': 'NV',
-    'New Hampshire': 'NH',
-    'New Jersey': 'NJ',
-    'New Mexico': 'NM',
-    'New York': 'NY',
-    'North Carolina': 'NC',
-    'North Dakota': 'ND',
-    'Northern Mariana Islands':'MP',
-    'Ohio': 'OH',
-    'Oklahoma': 'OK',
-    'Oregon': 'OR',
-    'Pennsylvania': 'PA',
-    'Puerto Rico': 'PR',
-    'Rhode Island': 'RI',
-    'South Carolina': 'SC',
-    'South Dakota': 'SD',
-    'Tennessee': 'TN',
-    'Texas': 'TX',
-    'Utah': 'UT',
-    'Vermont': 'VT',
-    'Virgin Islands': 'VI',
-    'Virginia': 'VA',
-    'Washington': 'WA',
-    'West Virginia': 'WV',
-    'Wisconsin': 'WI',
-    'Wyoming': 'WY'
-    }
-    
-    # convert state full name to short abbrev, such as Illinois -> IL 
-    state_abbrev = []
-    for state in State_fips['Name']:
-        if state in us_state_abbrev:
-            state_abbrev.append(us_state_abbrev[state])
-        else:
-            state_abbrev.append("NA")
-            
-    # create the State variable to store state abbrev
-    State_fips['State'] = state_abbrev
-    
-    # drop missing value
-    State_fips = State_fips[State_fips['State'] != "NA"].reset_index()
-    
-    # select important columns and pad state fips codes: "1" -> "01"
-    State_fips = State_fips[['Name','State (FIPS)', 'State']]
-    State_fips['State (FIPS)'] = State_fips['State (FIPS)'].astype(str)
-    State_fips['State (FIPS)'] = State_fips['State (FIPS)'].str.pad(width=2, side='left', fillchar='0')
-    
-    
-    
-    ## clean county files 
-    # select important columns
-    County_fips = County_fips[[ 'State Code (FIPS)', 'County Code (FIPS)', 'Area Name (including legal/statistical area description)']]
-    
-    # select information only about county
-    Areas = County_fips['Area Name (including legal/statistical area description)']
-    County = []
-    isCounty = []
-    for area in Areas:
-        area_list = area.split(" ")
-        level = area_list[-1]
-        if level == "County":
-            isCounty.append("Y")
-        else:
-            isCounty.append("N")
-        area_modified = " ".join(area_list[:-1])
-        County.append(area_modified)
-    County_fips['County'] = County
-    County_fips['isCounty'] = isCounty
-    County_fips = County_fips[County_fips['isCounty'] == "Y"]
-    
-    # pad state and county fips codes and concatenate them together: "1" -> "01 (state) and "1" -> "001" (county) -> "01001"
-    County_fips['State Code (FIPS)'] = County_fips['State Code (FIPS)'].astype(str).str.pad(width=2, side='left', fillchar='0')
-    County_fips['County Code (FIPS)'] = County_fips['County Code (FIPS)'].astype(str).str.pad(width=3, side='left', fillchar='0')
-    County_fips['fips'] = County_fips['State Code (FIPS)'] + County_fips['County Code (FIPS)']
-    
-    # rename fips columns in order to merge state and county fips dataframe together
-    State_fips = State_fips.rename(columns = {'State (FIPS)':'State Code (FIPS)'})
-    State_County_fips = State_fips.merge(County_fips, how = "outer", on = ['State Code (FIPS)'])
-    State_County_fips = State_County_fips[['Name','State', 'County', 'fips']]
-    
-    # drop missing values
-    State_County_fips = State_County_fips.dropna(how = 'any')
-
-    # get abm level using fips
-    FIPS_abm['fips'] = FIPS_abm['fips'].astype(int)
-    FIPS_abm['year'] = FIPS_abm['year'].astype(str)
-    FIPS_abm['fips'] = FIPS_abm['fips'].astype(str).str.pad(width=5, side='left', fillchar='0')
-    State_County_abm = State_County_fips.merge(FIPS_abm, how = "left", on = ['fips'])
-    State_County_abm = State_County_abm.dropna(how = 'any')
+    # get abm level using fips, without changing the caller's FIPS_abm
+    fips_abm = FIPS_abm[['year', 'fips', 'abm']].dropna(how='any')
+    fips_abm = fips_abm.assign(fips=fips_abm['fips'].astype(np.int32))
+    State_County_abm = State_County_fips.merge(fips_abm, how='inner', on=['fips'])
     
     # rename Columns
-    State_County_abm = State_County_abm.rename(columns = {'Name':'state', 'State':'State_abbrev', 'County':'county'})
+    State_County_abm = State_County_abm.rename(columns={'state_abbrev': 'State_abbrev'})
     State_County_abm = State_County_abm[['state', 'State_abbrev', 'county', 'fips', 'abm']]
-    State_County_abm = State_County_abm.drop_duplicates()
+    State_County_abm['fips'] = format_fips(State_County_abm['fips'])
+    State_County_abm = State_County_abm.drop_duplicates().reset_index(drop=True)
     return State_County_abm
 
-State_County_abm = clean_state_county(State_fips, County_fips, FIPS_abm)
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/State_County_abm.csv'
-State_County_abm.to_csv(df_save_path, index = False)
 # Get abm level using fips
 
 ## H2H Files
@@ -791,102 +550,6 @@ def Performance_with_yield_adv(df_performance):
     
     return Performance_abm
     
-def adv_in_trait(df):
-    """Aggregates the advantage feature for a given abm within the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_within_trait -- the dataframe with the mean yield advantage
-            within the abm and within a product's trait group
-    """
-    # in_trait: c_trait == o_trait
-    in_trait = df[df['c_trait'] == df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    in_trait_abbr = in_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_within_trait = in_trait_abbr.groupby(by=['year', 'abm', 'c_trait',
-                                                 'c_hybrid'], as_index=False).mean()
-    adv_within_trait = adv_within_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_by_trait_brand'})
-    
-    return adv_within_trait
-
-def adv_outof_trait(df):
-    """Aggregates the advantage feature for a given abm outside the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_outside_trait -- the dataframe with the mean yield advantage
-            within the abm and outside a product's trait group
-    """
-    
-    # outof_trait: c_trait != o_trait
-    outof_trait = df[df['c_trait'] != df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    outof_trait_abbr = outof_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_outof_trait = outof_trait_abbr.groupby(by=['year', 'abm', 'c_trait', 
-                                                   'c_hybrid'], as_index=False).mean()
-    adv_outof_trait = adv_outof_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_outof_trait_brand'})
-    
-    return adv_outof_trait
-
-def adv_overall(df):
-    """Aggregates the advantage feature within a given abm for a product.
-    
-    Keyword arguments:
-        df -- the dataframe  of the performance data
-    Returns:
-        adv_overall -- the dataframe with the mean yield advantage within the
-            abm
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_overall = adv_abbr.groupby(by=['year', 'abm', 'c_trait', 'c_hybrid'],
-                                   as_index=False).mean()
-    
-    adv_overall = adv_overall.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_with_abm_brand'})
-    
-    return adv_overall
-
-def yield_aggregation(df):
-    """Aggregates the yield by year/abm/hybrid.
-    
-    Keyword arguments:
-        df -- the dataframe with the yield data
-    Returns:
-        df_with_yield
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'c_yield']]
-    
-    df_with_yield = adv_abbr.groupby(by=['year', 'abm', 'c_hybrid', 'c_trait'],
-                                     as_index=False).mean()
-    df_with_yield = df_with_yield.rename(columns={'c_hybrid': 'hybrid',
-                                                  'c_trait': 'trait',
-                                                  'c_yield': 'yield'})
-    return df_with_yield
-
 def merge_advantages(df):
     """Merge yield advantage features, both inside and outside the ABMs.
     
@@ -898,21 +561,10 @@ def merge_advantages(df):
             as we'll use that for imputation
     """
     # aggregate within the abm by trait, out of trait, and overall, mirroring 
-    # the df used for the previous years' models
+    # the df used for the previous years' models, keeping the products that 
+    # have both in and out of trait h2hs
     # TODO find out if we need to aggregate by brand as well
-    Performance_yield_adv = df.copy()    
-    Performance_in_trait = adv_in_trait(Performance_yield_adv)
-    Performance_outof_trait = adv_outof_trait(Performance_yield_adv)
-    Performance_overall = adv_overall(Performance_yield_adv)
-    yield_overall = yield_aggregation(Performance_yield_adv)
-    
-    # merge the advantages together
-    adv_df = Performance_in_trait.merge(Performance_outof_trait,
-                                    on=['year', 'abm', 'trait', 'hybrid'])
-    adv_df = adv_df.merge(Performance_overall,
-                          on=['year', 'abm', 'trait', 'hybrid'])
-    adv_df = adv_df.merge(yield_overall,
-                          on=['year', 'abm', 'trait', 'hybrid'])
+    adv_df = aggregate_advantages(df=df, how='inner')
             
     return adv_df
 
@@ -935,130 +587,66 @@ def clean_performance(df):
     return df
     
 
-def create_imputation_frames(df):
-    """Creates dataframes at certain levels used to impute advantage features
-    in the main dataframe.
+def create_imputation_cube(df):
+    """Aggregates the advantage features used to impute the main dataframe
+    to the product/abm, trait/abm/year, abm/year and year levels, in one
+    pass over the advantage features.
     
     Keyword arguments:
         df -- the dataframe of advantage features
     Returns:
-        product_abm_level -- the dataframe with a product/abm level 
-        trait_abm_year_level -- the dataframe with a trait/abm/year level 
-        abm_year_level -- the dataframe with an abm/year level 
-        year_level -- the dataframe with a year level 
+        h2h_cube -- dict of the pa, tay, ay and y levels in order of
+            preference, as given by build_level_cube
     """
-    
-    # create a product/abm level aggregation, as year-to-year variation is small
-    # rename columns for each level 
-    ABM_YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_AY',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_AY',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_AY',
-        'yield': 'yield_AY'}
-    
-    PRODUCT_ABM_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_PA',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_PA',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_PA',
-        'yield': 'yield_PA'}
-    
-    TRAIT_ABM_YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_TAY',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_TAY',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_TAY',
-        'yield': 'yield_TAY'}
-    
-    YEAR_LVL_COLS = {
-        'yield_adv_within_abm_by_trait_brand': 'yield_adv_within_abm_by_trait_brand_Y',
-        'yield_adv_within_abm_outof_trait_brand': 'yield_adv_within_abm_outof_trait_brand_Y',
-        'yield_adv_with_abm_brand': 'yield_adv_with_abm_brand_Y',
-        'yield': 'yield_Y'}
     df['year'] = df['year'].astype(str)
     
-    # create a product/abm level aggregation, as year-to-year variation is small
-    product_abm_df = df.drop(columns=['year', 'trait'])
-    product_abm_level = product_abm_df.groupby(by=['hybrid', 'abm'],
-                                               as_index=False).mean()
-    product_abm_level = product_abm_level.rename(columns=PRODUCT_ABM_LVL_COLS)
-    
-    # create a trait/abm/year level aggregation for if product/abm is unavailable
-    trait_abm_year_df = df.drop(columns=['hybrid'])
-    trait_abm_year_level = trait_abm_year_df.groupby(by=['trait', 'abm', 'year'],
-                                                     as_index=False).mean()
-    trait_abm_year_level = trait_abm_year_level.rename(columns=TRAIT_ABM_YEAR_LVL_COLS)
+    # the product/abm level comes first, as year-to-year variation is small,
+    # then trait/abm/year for if product/abm is unavailable, abm/year for
+    # products without a trait value and year for when we don't have data for
+    # a given abm in a given year
+    h2h_cube = build_level_cube(df=df.rename(columns={'hybrid': 'Variety_Name'}),
+                                features=ADV_FEATURES,
+                                levels={'pa': ['Variety_Name', 'abm'],
+                                        'tay': ['trait', 'abm', 'year'],
+                                        'ay': ['abm', 'year'],
+                                        'y': ['year']})
     
-    # create an abm/year level aggregation for products without a trait value
-    abm_year_df = df.drop(columns=['trait', 'hybrid'])
-    abm_year_level = abm_year_df.groupby(by=['abm', 'year'],
-                                         as_index=False).mean()
-    abm_year_level = abm_year_level.rename(columns=ABM_YEAR_LVL_COLS)
-    
-    # create a year level aggregation so we have values for when we don't have 
-    # data for a given abm in a given year
-    year_df = df.drop(columns=['trait', 'hybrid', 'abm'])
-    year_level = year_df.groupby(by=['year'], as_index=False).mean()
-    year_level = year_level.rename(columns=YEAR_LVL_COLS)
-    
-    return product_abm_level, trait_abm_year_level, abm_year_level, year_level
+    return h2h_cube
 
-def impute_h2h_data(df, product_abm_level, trait_abm_year_level, abm_year_level, year_level):
-    """Imputes missing h2h data using the previously aggregated dfs.
+def impute_h2h_data(df, h2h_cube):
+    """Imputes missing h2h data using the previously aggregated levels.
     
     Keyword arguments:
         df -- the dataframe with the h2h data merged
-        pa_level -- the values aggregated at the product/abm level for use when
-            we have missing years
-        tay_level -- the values aggregated at the trait/abm/year level for use when 
-            we have missing products in a given abm
-        ay_level -- the values aggregated at the abm/year level for when we don't have
-            trait information for a product in a given abm for a given year
-        y_level -- the values aggregated at the year level for when we don't have
-            information for an abm for a given year
+        h2h_cube -- the advantage features aggregated at the product/abm level
+            for use when we have missing years, the trait/abm/year level for
+            missing products in a given abm, the abm/year level for when we
+            don't have trait information for a product in a given abm for a
+            given year and the year level for when we don't have information
+            for an abm for a given year
     Returns:
         df_imputed -- the dataframe with imputed h2h data
+        h2h_levels -- the side dataframe of the year, Variety_Name and abm of
+            each row with an h2h_level column of the least specific level its
+            values came from: 0 none imputed, 1 pa, 2 tay, 3 ay, 4 y and -1
+            still missing, and a <feature>_level column with the same codes
+            for each adv feature, kept out of the features of the dataset
     """
-    # the idea is to merge the aggregated frames onto the df, then set the actual adv
-    # features to be a certain aggregated value based on the logic of what is missing:
-    # if we have product data for an abm for some years but not others, use pa_level,
-    # if we have the trait data for a given abm/year, tay_level values, etc. it's 
-    # an order of preference: pa -> tay -> ay -> y
-    H2H_AGG_LEVELS = ['_PA', '_TAY', '_AY', '_Y']
-    YIELD_ADV_FEATURES = ['yield_adv_within_abm_by_trait_brand',
-                      'yield_adv_within_abm_outof_trait_brand',
-                      'yield_adv_with_abm_brand',
-                      'yield']
-    
-    
-    product_abm_level = product_abm_level.rename(columns = {'hybrid': 'Variety_Name'})
-    df_with_pa = df.merge(product_abm_level, on=['abm', 'Variety_Name'], how='left')
-    
-    df_with_tay = df_with_pa.merge(trait_abm_year_level, on=['year', 'abm', 'trait'],
-                                   how='left')
-    
-    df_with_ay = df_with_tay.merge(abm_year_level, on=['year', 'abm'], how='left')
-
-    df_with_y = df_with_ay.merge(year_level, on=['year'], how='left')
-    
-    # the features we'll drop
-    agg_features_to_drop = []
-    
-    # iterate through the levels in the order pa -> tay -> ay -> y
-    for level in H2H_AGG_LEVELS:
-    # iterate through the features we're going to impute
-        for feature in YIELD_ADV_FEATURES:
-            # replace missing values with the level of aggregation if it's available
-            df_with_y.loc[((df_with_y[feature].isnull() == True) & 
-                           (df_with_y[feature + level].isnull() == False)),
-        feature] = df_with_y.loc[((df_with_y[feature].isnull() == True) & 
-               (df_with_y[feature + level].isnull() == False)), feature + level]
-        
-            # append the feature + level to drop
-            agg_features_to_drop.append(feature + level)
-    
-    print(agg_features_to_drop)
-    df_imputed = df_with_y.drop(columns=agg_features_to_drop)
-    
-    return df_imputed
+    # the idea is to fill each missing adv feature from the aggregated levels based
+    # on the logic of what is missing: if we have product data for an abm for some
+    # years but not others, use pa_level, if we have the trait data for a given
+    # abm/year, tay_level values, etc. it's an order of preference: pa -> tay -> ay -> y
+    df_imputed = impute_from_cube(df=df,
+                                  cube=h2h_cube,
+                                  features=ADV_FEATURES,
+                                  level_col='h2h_level',
+                                  feature_levels=True)
+    
+    level_cols = ['h2h_level'] + [feature + '_level' for feature in ADV_FEATURES]
+    h2h_levels = df_imputed[['year', 'Variety_Name', 'abm'] + level_cols]
+    df_imputed = df_imputed.drop(columns=level_cols)
+    
+    return df_imputed, h2h_levels
 
 ###### ---------------- Read Consensus Forecasting Data ---------------- ######
 
@@ -1104,11 +692,6 @@ def read_concensus_forecasting():
     CF_2016_2022 = CF_2016_2022.dropna(how = 'any')
     return CF_2016_2022
 
-CF_2016_2022 = read_concensus_forecasting()
-print("Concensus Forecasting data's Structure: ", CF_2016_2022.info())
-print("Checking the fraction of missing value: ", CF_2016_2022.isna().sum()/CF_2016_2022.shape[0])
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/CF_2016_2022.csv'
-CF_2016_2022.to_csv(df_save_path, index = False)
 
 def merge_cf_with_abm(df_cf, df_abm_key):
     """ Reads in and returns the abm and teamkey data as a dataframe.
@@ -1130,7 +713,6 @@ def merge_cf_with_abm(df_cf, df_abm_key):
     
     return CF_abm
 
-CF_abm = merge_cf_with_abm(CF_2016_2022, abm_Teamkey)
 
 ###### --------------------------- Read SRP  ------------------------- ######
 def read_SRP():
@@ -1142,22 +724,11 @@ def read_SRP():
         SRP_2011_2020 -- the fully concatenated SRP values from 2011 to 2020
     """
     
-    # define a list to store all SRP data
-    dfs_path = []
-    
     # read in the historical data and concatenate each file from 2011 to 2019
-    for year in range(2011, 2020):
-        print("Read ", str(year), "SRP Data")
-        dfi_path = r'/Users/gmtxy/OneDrive - Bayer/SRP/historical_SRP/{year}_SRP.csv'.format(year = year)
-        
-        dfi = pd.read_csv(dfi_path)
-        
-        # set a year parameter to be the year 
-        dfi['year'] = year
-        dfs_path.append(dfi)
-    
-    # concatenate all dataframes    
-    SRP_2011_2019 = pd.concat(dfs_path).reset_index(drop=True)
+    SRP_2011_2019 = read_yearly_csvs(
+            path_template=r'/Users/gmtxy/OneDrive - Bayer/SRP/historical_SRP/{year}_SRP.csv',
+            years=range(2011, 2020),
+            source='srp_history')
     
     # select required columns
     SRP_2011_2019 = SRP_2011_2019[['year', 'VARIETY', 'SRP']]
@@ -1194,7 +765,6 @@ def read_SRP():
     
     return SRP_2011_2020
 
-read_SRP()
 
 def impute_SRP(df):
     """Imputes missing SRP values.
@@ -1252,15 +822,21 @@ def read_soybean_trait_map():
     trait_map = trait_map.fillna(0)
     return trait_map
 
-trait_map = read_soybean_trait_map()
-SRP_2011_2019 = read_SRP()
 
 ###### ----------------------- Merge All Datasets ---------------------- ######
-def merge_all():
+def merge_all(Sale_all, Age_Trait, Weather_Flattened, CM_lagged,
+              Performance_2011_2019, State_County_abm, CF_abm, SRP_2011_2019):
     """ Reads in and returns the final combined dataframe.
     
     Keyword arguments:
-        None
+        Sale_all -- the dataframe of the sales data with the RM
+        Age_Trait -- the dataframe of the age and trait data
+        Weather_Flattened -- the dataframe of the flattened weather data
+        CM_lagged -- the dataframe of the lagged commodity price data
+        Performance_2011_2019 -- the dataframe of the performance data
+        State_County_abm -- the dataframe mapping state and county to abm
+        CF_abm -- the dataframe of the CF data at the abm level
+        SRP_2011_2019 -- the dataframe of the SRP data
     Returns:
         Sale_HP_trait_weather_CM_Performance_CF -- the dataframe of sales, 
                                                     hot products, trait/age, 
@@ -1306,8 +882,7 @@ def merge_all():
     df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Performance_adv.csv'
     Performance_adv.to_csv(df_save_path, index = False)
     
-    product_abm_level, trait_abm_year_level, abm_year_level, year_level = create_imputation_frames(
-                df=Performance_adv)
+    h2h_cube = create_imputation_cube(df=Performance_adv)
     # rename hybrid columns
     Performance_adv1 = Performance_adv.rename(columns = {'hybrid': 'Variety_Name'})
     # drop trait columns
@@ -1318,9 +893,8 @@ def merge_all():
                                         on=['year', 'abm', 'Variety_Name'],
                                         how='left')
     # impute the missing value 
-    Sale_HP_trait_weather_CM_Performance = impute_h2h_data(Sale_HP_trait_weather_CM_Performance, 
-                                                            product_abm_level, trait_abm_year_level,
-                                                            abm_year_level, year_level)
+    Sale_HP_trait_weather_CM_Performance, h2h_levels = impute_h2h_data(
+            Sale_HP_trait_weather_CM_Performance, h2h_cube)
     
     # replace any blank trait values with "Conventional"
     Sale_HP_trait_weather_CM_Performance['trait'] = Sale_HP_trait_weather_CM_Performance['trait'].fillna('Conventional')
@@ -1330,6 +904,10 @@ def merge_all():
     df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Sale_HP_trait_weather_CM_Performance.csv'
     Sale_HP_trait_weather_CM_Performance.to_csv(df_save_path, index = False)
     
+    # the imputation levels of the h2h features, next to rather than in the dataset
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/h2h_imputation_levels.csv'
+    h2h_levels.to_csv(df_save_path, index = False)
+    
     ## Merge Sale_HP_trait_weather_CM_Performance with Concensus Forecasting
     print("Step 6: Merge Sale_HP_trait_weather_CM with CF......")
     Sale_HP_trait_weather_CM_Performance_CF = Sale_HP_trait_weather_CM_Performance.merge(CF_abm, how = 'left', on = ['year','Variety_Name','abm'])
@@ -1355,17 +933,93 @@ def merge_all():
 
     return Sale_HP_trait_weather_CM_Performance_CF_SRP
 
-Sale_HP_trait_weather_CM_Performance_CF_SRP = merge_all()
 
-# encoding trait
-print("Step 8: Encoding trait")
-Final_df = Sale_HP_trait_weather_CM_Performance_CF_SRP.merge(trait_map, how = 'left', on = ['trait']) 
-Final_df = Final_df.drop(columns = ['trait'])
-df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Final_order_df_2012_2020.csv'
-Final_df.to_csv(df_save_path, index = False)
-Final_df.isna().sum()
+def run(config=RUN_CONFIG):
+    """Builds the full dataset, reading every source and writing the
+    intermediate and final csvs. Nothing is read or written on import.
+    
+    Keyword arguments:
+        config -- dict with the settings of the run, output_file being the
+            path the final dataset is written to
+    Returns:
+        Final_df -- the final dataset
+    """
+    Sale_2012_2020, clean_Sale = read_sales_filepath()
+    Sale_2012_2020_lagged = create_lagged_sales(Sale_2012_2020)
+    Sale_all = create_monthly_sales(Sale_2012_2020_lagged, clean_Sale)
+    print("Sale's Structure: ", Sale_all.info())
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Sale_all.csv'
+    Sale_all.to_csv(df_save_path, index = False)
+    print("Check the fraction of missing values in Sales data: ", Sale_all.isna().sum())
+    print("Sale's shape: ", Sale_all.shape)
+
+    Age_Trait = read_age_trait_filepath()
+    print("Age Trait's Structure: ", Age_Trait.info())
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Age_Trait.csv'
+    Age_Trait.to_csv(df_save_path, index = False)
+    print("Check the fraction of missing values in Age & Trait data: ", Age_Trait.isna().sum())
+    print("Age Trait's shape: ", Age_Trait.shape)
+
+    Weather_2012_2020, County_Location, FIPS_abm = read_weather_filepath()
+    print("Weather's Structure: ", Weather_2012_2020.info())
+    print("County_Location's Structure: ", County_Location.info())
+    print("FIPS_abm's Structure: ", FIPS_abm.info())
+
+    Weather = clean_Weather(Weather_2012_2020, County_Location, FIPS_abm)
+    print("Weather's Structure: ", Weather.info())
+
+    Weather_Flattened = flatten_monthly_weather(Weather)
+
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/Flattened_Weather_abm_fips.csv'
+    Weather_Flattened.to_csv(df_save_path, index = False)
+    print("Flattened Weather's Structure: ", Weather_Flattened.info())
+    print("Check the fraction of missing value in weather data: ", Weather_Flattened.isnull().sum())
+    print("Flattened Weather's shape: ", Weather_Flattened.shape)
+
+    Commodity_Corn, Commodity_Soybean = read_commodity_corn_soybean()
+
+    Commodity_Corn_Soybean = clean_commodity(Commodity_Corn, Commodity_Soybean)
+
+    # both crops' features together
+    CM_Soybean_Corn = create_commodity_features(Commodity_Corn_Soybean)
+
+    CM_lagged = create_lagged_features(CM_Soybean_Corn)
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/CM_Soybean_Corn_Lagged.csv'
+    CM_lagged.to_csv(df_save_path, index = False)
+    print("Flattened Commodity_Price's Structure: ", CM_lagged.shape)
+
+    Performance_2011_2019 = read_performance()
+
+    State_County_abm = clean_state_county(FIPS_abm)
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/State_County_abm.csv'
+    State_County_abm.to_csv(df_save_path, index = False)
+
+    CF_2016_2022 = read_concensus_forecasting()
+    print("Concensus Forecasting data's Structure: ", CF_2016_2022.info())
+    print("Checking the fraction of missing value: ", CF_2016_2022.isna().sum()/CF_2016_2022.shape[0])
+    df_save_path = r'/Users/gmtxy/OneDrive - Bayer/Model_Aggregation_0726/CF_2016_2022.csv'
+    CF_2016_2022.to_csv(df_save_path, index = False)
+
+    CF_abm = merge_cf_with_abm(CF_2016_2022, read_abm_teamkey_file())
+
+    trait_map = read_soybean_trait_map()
+    SRP_2011_2019 = read_SRP()
+
+    Sale_HP_trait_weather_CM_Performance_CF_SRP = merge_all(
+            Sale_all=Sale_all, Age_Trait=Age_Trait, Weather_Flattened=Weather_Flattened,
+            CM_lagged=CM_lagged, Performance_2011_2019=Performance_2011_2019,
+            State_County_abm=State_County_abm, CF_abm=CF_abm, SRP_2011_2019=SRP_2011_2019)
+
+    # encoding trait
+    print("Step 8: Encoding trait")
+    Final_df = Sale_HP_trait_weather_CM_Performance_CF_SRP.merge(trait_map, how = 'left', on = ['trait'])
+    Final_df = Final_df.drop(columns = ['trait'])
+    df_save_path = config['output_file']
+    Final_df.to_csv(df_save_path, index = False)
+    print("Check the fraction of missing values in the final data: ", Final_df.isna().sum().sum())
 
-Final_df.isna().sum().sum()
+    return Final_df
 
 
-Final_df
+if __name__ == '__main__':
+    run(RUN_CONFIG)
@@ -6,8 +6,7 @@ Created on Tue Jul 18 12:58:49 2023
 @author: epnzv
 """
 
-from y1_macro import (clean_commodity, clean_weather,
-                      create_commodity_features_merged,
+from y1_macro import (create_commodity_features,
                       create_lagged_CM_features, flatten_monthly_weather,
                       read_commodity_corn_soybean, read_weather_filepath)
 from y1_products import (get_RM, read_age_trait)
@@ -25,17 +24,13 @@ Sale_all, digies = get_RM(df=Sale_all)
 
 Age_Trait = read_age_trait()
 
-Weather_2012_2020, County_Location, FIPS_abm = read_weather_filepath()
-
-Weather = clean_weather(Weather_2012_2020, County_Location, FIPS_abm) 
+Weather, County_Location, FIPS_abm = read_weather_filepath()
 
 Weather_Flattened = flatten_monthly_weather(Weather)
 
-Commodity_Corn, Commodity_Soybean = read_commodity_corn_soybean()
-
-Commodity_Corn_Soybean = clean_commodity(Commodity_Corn, Commodity_Soybean)
+Commodity_Corn_Soybean = read_commodity_corn_soybean()
 
-CM_Soybean_Corn = create_commodity_features_merged(Commodity_Corn_Soybean)
+CM_Soybean_Corn = create_commodity_features(Commodity_Corn_Soybean)
 
 CM_lagged = create_lagged_CM_features(CM_Soybean_Corn)
 
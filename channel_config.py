@@ -24,6 +24,9 @@ CHANNEL_SALES_YEARS = [2009, 2010, 2011, 2012, 2013, 2014, 2015, 2016, 2017, 201
 
 CURRENT_BANK = False
 
+# the sales years the daily abm ratio map is built from
+DATE_RATIO_YEARS = [2016, 2017, 2018, 2019, 2020]
+
 EFFECTIVE_DATE = {'month': 10,
                   'day': 20}
 
@@ -13,86 +13,8 @@ from channel_config import (CORN_H2H_DIR, CORN_MPI_HIST_COLS, CORN_MPI_NEW_COLS,
                             CORN_MPI_FEATURE_NAMES, DATA_DIR, MPI_DIR, PERFORMANCE_COLS,
                             SOYBEAN_H2H_DIR, SOYBEAN_MPI_HIST_COLS,
                             SOYBEAN_MPI_FEATURE_NAMES)
-
-
-def adv_in_trait(df):
-    """Aggregates the advantage feature for a given abm within the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_within_trait -- the dataframe with the mean yield advantage
-            within the abm and within a product's trait group
-    """
-    # in_trait: c_trait == o_trait
-    in_trait = df[df['c_trait'] == df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    in_trait_abbr = in_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_within_trait = in_trait_abbr.groupby(by=['year', 'abm', 'c_trait',
-                                                 'c_hybrid'], as_index=False).mean()
-    adv_within_trait = adv_within_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_by_trait_brand'})
-    
-    return adv_within_trait
-
-
-def adv_outof_trait(df):
-    """Aggregates the advantage feature for a given abm outside the trait group
-    of each product.
-    
-    Keyword arguments:
-        df -- the dataframe of the performance data
-    Returns:
-        adv_outside_trait -- the dataframe with the mean yield advantage
-            within the abm and outside a product's trait group
-    """
-    
-    # outof_trait: c_trait != o_trait
-    outof_trait = df[df['c_trait'] != df['o_trait']].reset_index(drop=True)
-    
-    # selected required columns
-    outof_trait_abbr = outof_trait[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_outof_trait = outof_trait_abbr.groupby(by=['year', 'abm', 'c_trait', 
-                                                   'c_hybrid'], as_index=False).mean()
-    adv_outof_trait = adv_outof_trait.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_within_abm_outof_trait_brand'})
-    
-    return adv_outof_trait
-
-
-def adv_overall(df):
-    """Aggregates the advantage feature within a given abm for a product.
-    
-    Keyword arguments:
-        df -- the dataframe  of the performance data
-    Returns:
-        adv_overall -- the dataframe with the mean yield advantage within the
-            abm
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'yield_adv']]
-    
-    # get the average yield_adv for each abm, year, and product
-    adv_overall = adv_abbr.groupby(by=['year', 'abm', 'c_trait', 'c_hybrid'],
-                                   as_index=False).mean()
-    
-    adv_overall = adv_overall.rename(
-            columns={'c_trait': 'trait',
-                     'c_hybrid': 'hybrid',
-                     'yield_adv': 'yield_adv_with_abm_brand'})
-    
-    return adv_overall
+from level_imputation import build_level_cube, impute_from_cube
+from yield_advantages import read_h2h_advantages
 
 
 def corn_trait_processing(df):
@@ -125,43 +47,19 @@ def corn_trait_processing(df):
     return df_w_processed_traits
 
 
-def generate_adv(df):
-    """Generates yield advantage features from raw performance data.
+def add_yield_adv(df):
+    """Adds the yield advantage of each head to head, the difference between
+    the yields of the two products.
     
     Keyword arguments:
-        df -- the performance data with the abm feature added
+        df -- the performance data
     Returns:
-        performance_w_adv -- the performance dataframe with all the advantage features
+        df -- the performance data with the yield_adv column added in place
     """
-    # generate advantages
     df['yield_adv'] = (
             df['c_yield'] - df['o_yield'])
     
-    performance_channel_abm_subset = df[[
-            'year', 'abm', 'c_trait', 'o_trait', 'c_hybrid', 'c_yield', 'yield_adv']]
-    
-    # aggregate advantages accordingly
-    performance_channel_yield = yield_aggregation(df=performance_channel_abm_subset)
-    
-    performance_channel_in_trait = adv_in_trait(df=performance_channel_abm_subset)
-    
-    performance_channel_out_of_trait = adv_outof_trait(df=performance_channel_abm_subset)
-    
-    performance_channel_overall = adv_overall(df=performance_channel_abm_subset)
-    
-    # merge them all together
-    performance_w_adv = performance_channel_yield.merge(performance_channel_in_trait,
-                                                        on=['year', 'abm', 'trait', 'hybrid'],
-                                                        how='left')
-    performance_w_adv = performance_w_adv.merge(performance_channel_out_of_trait,
-                                                on=['year', 'abm', 'trait', 'hybrid'],
-                                                how='left')
-    
-    performance_w_adv = performance_w_adv.merge(performance_channel_overall,
-                                                on=['year', 'abm', 'trait', 'hybrid'],
-                                                how='left')
-
-    return performance_w_adv
+    return df
 
 
 def generate_age_trait_RM(df, crop, RM=False):
@@ -391,40 +289,34 @@ def merge_performance_data(df, abm_map, crop):
     elif crop == 'CORN':
         h2h_dir = CORN_H2H_DIR
         
-    dfs_path = []    
-    for i in range(2011, 2023):
-        print("Read ", str(i), "H2H Data")
-        dfi_path = DATA_DIR + h2h_dir + 'Combined_H2H'+ str(i) + '.csv'
-        dfi = pd.read_csv(dfi_path)
-        dfi['year'] = i + 1
-        
-        # grab just the channel data
-        dfi = dfi[dfi['c_brand'] == 'CHANNEL'].reset_index(drop=True)
-
-        dfs_path.append(dfi)
-            
-    # 2024 data 
-    dfi_24 = dfi.copy()
-    dfi['year'] = dfi['year'] + 1
-    dfs_path.append(dfi_24)
-    
-    # concatenate all H2H data
-    performance_channel = pd.concat(dfs_path)
-    
-    # merge abm 
+    # map the H2H locations to abms
     fips_county_map = pd.read_csv('State_County_abm.csv')
     fips_county_map = fips_county_map[['state', 'county', 'fips']]
     
-    performance_channel_fips = performance_channel.merge(fips_county_map,
-                                                        on=['state', 'county'],
-                                                        how='left')
-    
-    performance_channel_abm = performance_channel_fips.merge(abm_map,
-                                                             on=['fips'],
-                                                             how='left')
-    
-    # generate advantages
-    performance_w_adv = generate_adv(df=performance_channel_abm)
+    county_abm_map = fips_county_map.merge(abm_map, on=['fips'], how='left')
+    
+    # stream the H2H data several files at a time, grabbing just the channel 
+    # data and aggregating the advantages of every product chunk by chunk
+    performance_w_adv = read_h2h_advantages(
+            path_template=DATA_DIR + h2h_dir + 'Combined_H2H{year}.csv',
+            years=range(2011, 2023),
+            location_map=county_abm_map,
+            add_yield_adv=add_yield_adv,
+            year_offset=1,
+            filters={'c_brand': 'CHANNEL'},
+            how='left')
+    
+    # 2024 data, a copy of the 2023 data
+    performance_24 = performance_w_adv[performance_w_adv['year'] == 2023].copy()
+    performance_24['year'] = 2024
+    
+    # concatenate all H2H data, ordered by product
+    performance_w_adv = pd.concat([performance_w_adv, performance_24])
+    performance_w_adv = performance_w_adv.sort_values(
+            by=['year', 'abm', 'hybrid', 'trait'])[
+            ['year', 'abm', 'hybrid', 'trait', 'yield', 'yield_adv_within_abm_by_trait_brand',
+             'yield_adv_within_abm_outof_trait_brand',
+             'yield_adv_with_abm_brand']].reset_index(drop=True)
     
     # merge with main df
     df_w_performance = df.merge(performance_w_adv.drop(columns=['trait']),
@@ -455,65 +347,16 @@ def performance_imputation(df, crop):
     
     non_nan = df_imputed.dropna().reset_index(drop=True)
     
-    performance_subset = non_nan[
-            ['abm', 'year', 'trait', 'TEAM_Y1_FCST_2'] + PERFORMANCE_COLS]
-    
-    for col in PERFORMANCE_COLS:
-        performance_subset[col + '_weighted'] = (
-                performance_subset[col] * performance_subset['TEAM_Y1_FCST_2'])
-    
-    # group by relevant agg levels
-    performance_subset_tay = performance_subset.groupby(by=['year', 'abm', 'trait']).sum()
-    performance_subset_ay = performance_subset.groupby(by=['year', 'abm']).sum()
-    performance_subset_y = performance_subset.groupby(by=['year']).sum()
+    # forecast weighted averages at the relevant agg levels, imputed in
+    # tay -> ay -> y preferential order
+    performance_cube = build_level_cube(df=non_nan,
+                                        features=PERFORMANCE_COLS,
+                                        levels={'tay': ['year', 'abm', 'trait'],
+                                                'ay': ['year', 'abm'],
+                                                'y': ['year']},
+                                        weight_col='TEAM_Y1_FCST_2')
     
-    # calculate the weighted averages and drop the weighted columns
-    for col in PERFORMANCE_COLS:
-        performance_subset_tay[col + '_tay'] =  (
-                performance_subset_tay[col + '_weighted'] / performance_subset_tay['TEAM_Y1_FCST_2'])
-        performance_subset_ay[col + '_ay'] =  (
-                performance_subset_ay[col + '_weighted'] / performance_subset_ay['TEAM_Y1_FCST_2'])
-        performance_subset_y[col + '_y'] = (
-                performance_subset_y[col + '_weighted'] / performance_subset_y['TEAM_Y1_FCST_2'])
-        
-        performance_subset_tay = performance_subset_tay.drop(columns=[col, col + '_weighted'])
-        performance_subset_ay = performance_subset_ay.drop(columns=[col, col + '_weighted'])
-        performance_subset_y = performance_subset_y.drop(columns=[col, col + '_weighted'])
-    
-    performance_subset_tay = performance_subset_tay.drop(columns=['TEAM_Y1_FCST_2'])
-    performance_subset_ay = performance_subset_ay.drop(columns=['TEAM_Y1_FCST_2'])
-    performance_subset_y = performance_subset_y.drop(columns=['TEAM_Y1_FCST_2'])
-    
-    df_imputed = df_imputed.merge(performance_subset_tay, on=['year', 'abm', 'trait'], how='left')
-    df_imputed = df_imputed.merge(performance_subset_ay, on=['year', 'abm'], how='left')
-    df_imputed = df_imputed.merge(performance_subset_y, on=['year'], how='left')
-    
-    # assignment statements in tay -> ay -> y preferential order
-    for col in PERFORMANCE_COLS:
-        df_imputed.loc[df_imputed[col].isna(), col] = df_imputed.loc[df_imputed[col].isna(), col + '_tay']
-        df_imputed.loc[df_imputed[col].isna(), col] = df_imputed.loc[df_imputed[col].isna(), col + '_ay']
-        df_imputed.loc[df_imputed[col].isna(), col] = df_imputed.loc[df_imputed[col].isna(), col + '_y']
-        
-        df_imputed = df_imputed.drop(columns=[col + '_tay', col + '_ay', col + '_y'])
+    df_imputed = impute_from_cube(df=df_imputed, cube=performance_cube,
+                                  features=PERFORMANCE_COLS)
     
     return df_imputed
-
-
-def yield_aggregation(df):
-    """Aggregates the yield by year/abm/hybrid.
-    
-    Keyword arguments:
-        df -- the dataframe with the yield data
-    Returns:
-        df_with_yield
-    """
-    
-    # selected required columns
-    adv_abbr = df[['year', 'abm', 'c_hybrid', 'c_trait', 'c_yield']]
-    
-    df_with_yield = adv_abbr.groupby(by=['year', 'abm', 'c_hybrid', 'c_trait'],
-                                     as_index=False).mean()
-    df_with_yield = df_with_yield.rename(columns={'c_hybrid': 'hybrid',
-                                                  'c_trait': 'trait',
-                                                  'c_yield': 'yield'})
-    return df_with_yield
\ No newline at end of file
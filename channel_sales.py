@@ -12,6 +12,8 @@ import pandas as pd
 from channel_config import (CHANNEL_DATE_RATIOS, CHANNEL_DIR, CHANNEL_SALES_YEARS,
                             CORN_CF_DATA, CURRENT_BANK, DATA_DIR, EFFECTIVE_DATE,
                             FORECAST_COLS, FORECAST_CY_COLS, SOYBEAN_CF_DATA)
+from sales_lags import create_lag_features
+from yearly_reader import read_yearly_csvs
 
 
 def create_lagged_sales(df):
@@ -22,29 +24,14 @@ def create_lagged_sales(df):
     Returns: 
         df_w_lag -- the dataframe with lagged sales data
     """
-    df_copy_1 = df.copy()
-    df_copy_2 = df.copy()
-    
-    # add to the year values and rename columns
-    df_copy_1['year'] = df_copy_1['year'] + 1
-    df_copy_2['year'] = df_copy_2['year'] + 2
-    
-    df_copy_1 = df_copy_1.rename(columns={'nets_Q': 'nets_Q_1',
-                                          'shipped_Q': 'shipped_Q_1',
-                                          'order_Q': 'order_Q_1',
-                                          'orders_to_date': 'orders_to_date_1',
-                                          'return_Q': 'return_Q_1',
-                                          'replant_Q': 'replant_Q_1'})
-    
-    df_copy_2 = df_copy_2.rename(columns={'nets_Q': 'nets_Q_2',
-                                          'shipped_Q': 'shipped_Q_2',
-                                          'order_Q': 'order_Q_2',
-                                          'orders_to_date': 'orders_to_date_2',
-                                          'return_Q': 'return_Q_2',
-                                          'replant_Q': 'replant_Q_2'})
-    
-    df_w_lag = df.merge(df_copy_1, on=['year', 'abm', 'hybrid'], how='left')
-    df_w_lag = df_w_lag.merge(df_copy_2, on=['year', 'abm', 'hybrid'], how='left')
+    # lag every sales quantity by one and two years
+    quantities = [col for col in df.columns if col not in ['year', 'abm', 'hybrid']]
+
+    df_w_lag = create_lag_features(df=df,
+                                   keys=['abm', 'hybrid'],
+                                   time_col='year',
+                                   value_cols=quantities,
+                                   lags=[1, 2])
     
     # fill missing lagged features with 0
     df_w_lag = df_w_lag.fillna(0)
@@ -133,27 +120,13 @@ def read_channel_sales(crop, abm_map):
     Returns:
         sales -- the dataframe of the concatenated sales data.
     """
-    # set up a df 
-    dfs = []
-    
-    for year in CHANNEL_SALES_YEARS:
-        print('Reading ' + str(year) + ' sales data...')
-        
-        dfi_path = DATA_DIR + CHANNEL_DIR + str(year) + '_CH.csv'
-        
-        # read in an individual year
-        dfi = pd.read_csv(dfi_path)
-        
-        # grab the data for the requested crop
-        dfi = dfi[dfi['SPECIE_DESCR'] == crop].reset_index(drop=True)
-        dfi['year'] = year
-        
-        # convert the date to datetime format
-        dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
-        dfs.append(dfi)
-        
-    sales = pd.concat(dfs).reset_index(drop=True)
+    # read the years several at a time, keeping only the requested crop and
+    # the columns used below
+    sales = read_yearly_csvs(path_template=DATA_DIR + CHANNEL_DIR + '{year}_CH.csv',
+                             years=CHANNEL_SALES_YEARS,
+                             source='channel_sales',
+                             filters={'SPECIE_DESCR': crop},
+                             date_columns=['EFFECTIVE_DATE'])
     
     
     # grab relevant columns
@@ -292,27 +265,13 @@ def read_channel_sales_imputeD1MS(crop, abm_map):
     Returns:
         sales -- the dataframe of the concatenated sales data.
     """
-    # set up a df 
-    dfs = []
-    
-    for year in CHANNEL_SALES_YEARS:
-        print('Reading ' + str(year) + ' sales data...')
-        
-        dfi_path = DATA_DIR + CHANNEL_DIR + str(year) + '_CH.csv'
-        
-        # read in an individual year
-        dfi = pd.read_csv(dfi_path)
-        
-        # grab the data for the requested crop
-        dfi = dfi[dfi['SPECIE_DESCR'] == crop].reset_index(drop=True)
-        dfi['year'] = year
-        
-        # convert the date to datetime format
-        dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
-        dfs.append(dfi)
-        
-    sales = pd.concat(dfs).reset_index(drop=True)
+    # read the years several at a time, keeping only the requested crop and
+    # the columns used below
+    sales = read_yearly_csvs(path_template=DATA_DIR + CHANNEL_DIR + '{year}_CH.csv',
+                             years=CHANNEL_SALES_YEARS,
+                             source='channel_sales',
+                             filters={'SPECIE_DESCR': crop},
+                             date_columns=['EFFECTIVE_DATE'])
     
     # grab relevant columns
     sales = sales[
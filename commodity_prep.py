@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:51:09 2026
+
+@author: epnzv
+"""
+
+import os
+
+import pandas as pd
+
+from aggregation_config import CM_CONTRACT_MONTHS, CM_STORE_DIR, CM_UPDATE_MONTHS, DATA_DIR
+from sales_cache import is_partition_stale, read_manifest, write_manifest
+
+
+# the columns the monthly prices are averaged over
+CM_MONTH_KEYS = ['Crop', 'uYr', 'uMn', 'cYr', 'cMn']
+
+# the columns identifying a quote, a later snapshot's quote with the same ones
+# restates it
+CM_QUOTE_KEYS = ['Crop', 'Update Date', 'Contract Date']
+
+# columns the store of quotes is partitioned on, in directory order, every
+# crop's quotes of an update year being kept in one file
+CM_STORE_PARTITION_COLS = ['Crop', 'uYr']
+
+# name of the file in each partition directory holding its quotes
+CM_STORE_QUOTES = 'quotes.parquet'
+
+# name of the file holding the sums and counts of each month's prices, the
+# leading underscore keeping it apart from the partition directories
+CM_STORE_SUMS = '_monthly_sums.parquet'
+
+
+def parse_commodity_quotes(df):
+    """Keeps the commodity quotes with a price and a contract date, and adds
+    the year and month of their contract and update dates.
+    
+    Keyword arguments:
+        df -- the dataframe of the quotes, as read from a quote csv
+    Returns:
+        quotes -- the dataframe of the parsed quotes
+    """
+    # only get those rows that have a real valued Price and a real Contract Date
+    quotes = df.loc[df['Price'].notnull() & df['Contract Date'].notnull(),
+                    ['Crop', 'Update Date', 'Contract Date', 'Price']].reset_index(drop=True)
+    
+    # create datetime format
+    quotes['Contract Date'] = pd.to_datetime(quotes['Contract Date'])
+    quotes['Update Date'] = pd.to_datetime(quotes['Update Date'])
+    
+    # create new features for the month and year for the contract and update
+    quotes['cYr'] = quotes['Contract Date'].dt.year
+    quotes['cMn'] = quotes['Contract Date'].dt.month
+    
+    quotes['uYr'] = quotes['Update Date'].dt.year
+    quotes['uMn'] = quotes['Update Date'].dt.month
+    
+    return quotes
+
+
+def commodity_month_sums(quotes):
+    """Sums up the prices of the quotes by crop, update month and contract
+    month. Sums of separate batches of quotes can be added together before
+    taking the means.
+    
+    Keyword arguments:
+        quotes -- the dataframe of the parsed quotes
+    Returns:
+        month_sums -- the dataframe of the sum and count of the prices
+    """
+    month_sums = quotes.groupby(by=CM_MONTH_KEYS, as_index=False).agg(
+            Price_sum=('Price', 'sum'), Price_count=('Price', 'count'))
+    
+    return month_sums
+
+
+def write_store_file(path, df):
+    """Writes a file of the commodity store, replacing the old one atomically.
+    
+    Keyword arguments:
+        path -- the path of the parquet file
+        df -- the dataframe to write
+    Returns:
+        None
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    
+    # one temporary file per process, as pipeline stages can write at once
+    tmp_path = path + '.' + str(os.getpid()) + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    
+    os.replace(tmp_path, path)
+
+
+def partition_path(store_dir, crop, year):
+    """Returns the path of the file holding a crop's quotes of an update year.
+    
+    Keyword arguments:
+        store_dir -- the root directory of the commodity store
+        crop -- the crop of the quotes
+        year -- the (int) update year of the quotes
+    Returns:
+        path -- the path of the partition's parquet file
+    """
+    return os.path.join(store_dir, 'Crop=' + str(crop), 'uYr=' + str(year), CM_STORE_QUOTES)
+
+
+def read_partition(store_dir, crop, year):
+    """Reads in a crop's quotes of an update year from the store.
+    
+    Keyword arguments:
+        store_dir -- the root directory of the commodity store
+        crop -- the crop of the quotes
+        year -- the (int) update year of the quotes
+    Returns:
+        quotes -- the dataframe of the stored quotes, None if there are none
+    """
+    path = partition_path(store_dir, crop, year)
+    if not os.path.exists(path):
+        return None
+    
+    quotes = pd.read_parquet(path)
+    quotes.insert(0, 'Crop', crop)
+    quotes['uYr'] = year
+    
+    return quotes
+
+
+def list_partitions(store_dir):
+    """Lists the partitions of the store.
+    
+    Keyword arguments:
+        store_dir -- the root directory of the commodity store
+    Returns:
+        partitions -- list of the (crop, int year) of every partition
+    """
+    partitions = []
+    for crop_dir in sorted(os.listdir(store_dir)):
+        if not crop_dir.startswith('Crop='):
+            continue
+        for year_dir in sorted(os.listdir(os.path.join(store_dir, crop_dir))):
+            crop = crop_dir[len('Crop='):]
+            year = int(year_dir[len('uYr='):])
+            if os.path.exists(partition_path(store_dir, crop, year)):
+                partitions.append((crop, year))
+    
+    return partitions
+
+
+def merge_partitions(store_dir, quotes):
+    """Merges a batch of quotes with the partitions of the store they fall in.
+    A quote already in the store is replaced by the batch's when the batch's
+    snapshot is as recent or more, so restated prices take the place of the
+    old ones whatever order the snapshots are ingested in. Partitions the
+    batch neither adds to nor restates are left out.
+    
+    Keyword arguments:
+        store_dir -- the root directory of the commodity store
+        quotes -- the dataframe of the parsed quotes, with the as_of date of
+            the snapshot they come from
+    Returns:
+        merged_partitions -- dict of the (crop, year) of every changed
+            partition to the dataframe of its merged quotes
+    """
+    merged_partitions = {}
+    for (crop, year), batch in quotes.groupby(CM_STORE_PARTITION_COLS):
+        stored = read_partition(store_dir, crop, year)
+        
+        batch = batch.drop_duplicates(subset=CM_QUOTE_KEYS, keep='last')
+        if stored is not None:
+            unchanged = stored.merge(batch[CM_QUOTE_KEYS + ['Price']],
+                                     on=CM_QUOTE_KEYS + ['Price'], how='inner')
+            if len(unchanged) == len(batch):
+                continue
+        
+        merged = pd.concat([stored, batch]).sort_values(by='as_of', kind='stable')
+        merged = merged.drop_duplicates(subset=CM_QUOTE_KEYS, keep='last')
+        merged_partitions[(crop, year)] = merged.sort_values(
+                by=['Update Date', 'Contract Date']).reset_index(drop=True)
+    
+    return merged_partitions
+
+
+def rebuild_month_sums(store_dir):
+    """Sums up the prices of every partition of the store again, for when
+    the sums file is missing.
+    
+    Keyword arguments:
+        store_dir -- the root directory of the commodity store
+    Returns:
+        month_sums -- the dataframe of the sum and count of the prices
+    """
+    month_sums = [commodity_month_sums(read_partition(store_dir, crop, year))
+                  for crop, year in list_partitions(store_dir)]
+    if len(month_sums) == 0:
+        return pd.DataFrame(columns=CM_MONTH_KEYS + ['Price_sum', 'Price_count'])
+    
+    return pd.concat(month_sums, ignore_index=True)
+
+
+def update_commodity_store(quote_paths, store_dir=None):
+    """Ingests the quote csvs into the commodity store, kept by crop and update
+    year. Only the csvs that are new or have changed are read, and of those
+    only the partitions they add quotes to or restate quotes of are merged,
+    summed up again and rewritten, so a weekly refresh of the prices,
+    whatever its file is called, rewrites the latest year rather than
+    regrouping the whole history.
+    
+    Every write can be redone. The sums of the changed partitions are
+    replaced in the sums file first, then the partitions and last the
+    manifest, so a crash at any point leaves the csv to be ingested again,
+    and the partitions not yet written to be merged, summed and written
+    again to the same contents.
+    
+    Keyword arguments:
+        quote_paths -- list of the paths of the quote csvs
+        store_dir -- the root directory of the commodity store
+    Returns:
+        month_sums -- the dataframe of the sum and count of the prices of
+            every month in the store
+        as_of -- dict of each crop in the csvs to the last update date in them
+    """
+    if store_dir is None:
+        store_dir = DATA_DIR + CM_STORE_DIR
+    
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = read_manifest(store_dir)
+    files = manifest.get('files', {})
+    files_as_of = manifest.get('as_of', {})
+    
+    sums_path = os.path.join(store_dir, CM_STORE_SUMS)
+    if os.path.exists(sums_path):
+        month_sums = pd.read_parquet(sums_path)
+    else:
+        month_sums = rebuild_month_sums(store_dir)
+    
+    as_of = {}
+    for path in quote_paths:
+        stale, entry = is_partition_stale(path, files.get(path))
+        
+        if stale or path not in files_as_of:
+            print("Read ", path)
+            quotes = parse_commodity_quotes(pd.read_csv(path))
+            
+            # every quote carries the date of the snapshot it came from
+            quotes['as_of'] = quotes.groupby('Crop')['Update Date'].transform('max')
+            
+            merged_partitions = {}
+            if len(quotes) > 0:
+                merged_partitions = merge_partitions(store_dir, quotes)
+            
+            if len(merged_partitions) > 0:
+                partition_sums = pd.concat([commodity_month_sums(merged) for merged
+                                            in merged_partitions.values()], ignore_index=True)
+                
+                # swap the sums of the changed partitions for the new ones
+                changed = pd.MultiIndex.from_tuples(list(merged_partitions))
+                unchanged = ~pd.MultiIndex.from_frame(
+                        month_sums[CM_STORE_PARTITION_COLS]).isin(changed)
+                month_sums = pd.concat([month_sums[unchanged], partition_sums], ignore_index=True)
+                write_store_file(sums_path, month_sums)
+                
+                for (crop, year), merged in merged_partitions.items():
+                    write_store_file(partition_path(store_dir, crop, year),
+                                     merged.drop(columns=CM_STORE_PARTITION_COLS))
+            
+            files_as_of[path] = {crop: update_date.isoformat() for crop, update_date
+                                 in quotes.groupby('Crop')['Update Date'].max().items()}
+        
+        for crop, update_date in files_as_of[path].items():
+            as_of[crop] = max(as_of.get(crop, update_date), update_date)
+        
+        # record the entry even when only the mtime moved, to skip the hash next time
+        if stale or files.get(path) != entry:
+            files[path] = entry
+            write_manifest(store_dir, {'files': files, 'as_of': files_as_of})
+    
+    as_of = {crop: pd.Timestamp(update_date) for crop, update_date in as_of.items()}
+    
+    return month_sums, as_of
+
+
+def read_commodity_monthly(quote_paths, store_dir=None):
+    """Brings the commodity store up to date with the quote csvs and takes the
+    mean price of each crop, update month and contract month from its sums.
+    Only the crops of the csvs are kept, and a crop whose store goes on past
+    the last update in the csvs, a newer snapshot having been ingested for
+    another pipeline, is summed up again from its quotes up to that date.
+    
+    Keyword arguments:
+        quote_paths -- list of the paths of the quote csvs
+        store_dir -- the root directory of the commodity store
+    Returns:
+        corn_soybean -- the dataframe of the mean prices of both crops
+    """
+    if store_dir is None:
+        store_dir = DATA_DIR + CM_STORE_DIR
+    
+    month_sums, as_of = update_commodity_store(quote_paths, store_dir=store_dir)
+    
+    crop_sums = []
+    for crop, update_date in as_of.items():
+        sums = month_sums[month_sums['Crop'] == crop]
+        
+        last_year = sums['uYr'].max()
+        if read_partition(store_dir, crop, last_year)['Update Date'].max() > update_date:
+            quotes = pd.concat([read_partition(store_dir, crop, year)
+                                for store_crop, year in list_partitions(store_dir)
+                                if store_crop == crop and year <= update_date.year])
+            sums = commodity_month_sums(quotes[quotes['Update Date'] <= update_date])
+        
+        crop_sums.append(sums)
+    
+    month_sums = pd.concat(crop_sums).sort_values(by=CM_MONTH_KEYS).reset_index(drop=True)
+    
+    corn_soybean = month_sums[CM_MONTH_KEYS].copy()
+    corn_soybean['Price'] = month_sums['Price_sum'] / month_sums['Price_count']
+    
+    return corn_soybean
+
+
+def create_commodity_features(df, update_months=CM_UPDATE_MONTHS,
+                              contract_months=CM_CONTRACT_MONTHS):
+    """Creates the commodity price features of every crop at once. The quotes
+    of next year's contracts are filtered out of the monthly prices once,
+    labelled CMprice_<crop>_<update month>_<contract month> and pivoted into
+    a single wide table, rather than filtering the prices again for every
+    crop, update month and contract month.
+    
+    Keyword arguments:
+        df -- the dataframe of the monthly corn/soy prices, as given by
+            read_commodity_monthly
+        update_months -- list of the months of the quotes to use
+        contract_months -- dict of each crop to the list of the months of its
+            contracts to use, in the order the crops' features are given
+    Returns:
+        CM_Soybean_Corn -- the dataframe of the commodity features by year,
+            the years every crop has features for
+    """
+    # the pairs of crop and contract month a feature is created for
+    crop_contracts = pd.MultiIndex.from_tuples(
+            [(crop, month) for crop, months in contract_months.items() for month in months])
+    
+    # match the years
+    df_commodity = df[
+            (df['uYr'] + 1 == df['cYr']) &
+            df['uMn'].isin(update_months) &
+            pd.MultiIndex.from_frame(df[['Crop', 'cMn']]).isin(crop_contracts)]
+    
+    # create a timing feature
+    timing = ('CMprice_' + df_commodity['Crop'] + '_' + df_commodity['uMn'].astype(str) +
+              '_' + df_commodity['cMn'].astype(str))
+    
+    # reshape the commodity data, with the contract year as the year
+    CM_Soybean_Corn = df_commodity.assign(timing=timing).pivot(
+            index='cYr', columns='timing', values='Price')
+    
+    # group the features by crop and keep the years with features for every crop
+    crop_columns = [[col for col in CM_Soybean_Corn.columns
+                     if col.startswith('CMprice_' + crop + '_')] for crop in contract_months]
+    has_every_crop = pd.concat(
+            [CM_Soybean_Corn[cols].notna().any(axis=1) for cols in crop_columns], axis=1).all(axis=1)
+    CM_Soybean_Corn = CM_Soybean_Corn.loc[has_every_crop, sum(crop_columns, [])]
+    
+    # make the year value a column and set all values to be floats
+    CM_Soybean_Corn = CM_Soybean_Corn.rename_axis(index='year')
+    CM_Soybean_Corn = CM_Soybean_Corn.reset_index().astype('float64')
+    
+    CM_Soybean_Corn['year'] = CM_Soybean_Corn['year'].astype('int32').astype(str)
+    
+    return CM_Soybean_Corn
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 13 14:02:31 2026
+
+@author: epnzv
+"""
+
+from calendar import monthrange
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from aggregation_config import ORDER_DATE
+
+
+# the months of the marketing year, in order, starting in september of year - 1
+MARKETING_MONTHS = [9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
+
+SALES_KEYS = ['year', 'Variety_Name', 'abm']
+
+
+def marketing_month_ends(year):
+    """Returns the date masks for the end of each month of a marketing year,
+    from the end of september of year - 1 to the end of august of year.
+
+    Keyword arguments:
+        year -- the (int or str) marketing year
+    Returns:
+        month_ends -- list of datetimes, in MARKETING_MONTHS order
+    """
+    month_ends = []
+    for month in MARKETING_MONTHS:
+        if month > 8:
+            mask_year = int(year) - 1
+        else:
+            mask_year = int(year)
+
+        month_ends.append(dt.datetime(year=mask_year, month=month,
+                                      day=monthrange(mask_year, month)[1]))
+
+    return month_ends
+
+
+def cumulative_to_date(df, keys, date_col, value_col, cutoffs, labels=None):
+    """Sums a quantity up to each of a list of cutoff dates for every key.
+    Each row is put, with a single searchsorted, in the first cutoff it is on
+    or before, so one groupby and a cumsum along the cutoffs gives the same
+    totals as masking date_col <= cutoff and grouping once per cutoff.
+
+    Keyword arguments:
+        df -- the dataframe with the keys, dates and quantity
+        keys -- list of the columns to group by, rows with missing keys are
+            dropped as in a groupby
+        date_col -- the datetime column to compare against the cutoffs
+        value_col -- the quantity to sum
+        cutoffs -- list of cutoff dates, in any order
+        labels -- list of the column names for each cutoff, defaults to the
+            cutoffs themselves
+    Returns:
+        df_to_date -- the dataframe with the keys and one cumulative column per
+            cutoff, in the order the cutoffs were given
+    """
+    if labels is None:
+        labels = list(cutoffs)
+
+    cutoffs = pd.to_datetime(pd.Series(cutoffs)).values
+    order = np.argsort(cutoffs, kind='stable')
+    sorted_cutoffs = cutoffs[order]
+
+    # position of the first cutoff on or after each date, rows after the last
+    # cutoff (or without a date) don't count towards any of them
+    dates = df[date_col].values
+    sorted_cutoffs = sorted_cutoffs.astype(dates.dtype)
+    bucket = np.searchsorted(sorted_cutoffs, dates, side='left')
+    in_range = (bucket < len(sorted_cutoffs)) & df[date_col].notna().values
+
+    df_bucketed = df.loc[in_range, keys + [value_col]].assign(bucket=bucket[in_range])
+
+    df_to_date = df_bucketed.groupby(by=keys + ['bucket'])[value_col].sum()
+    df_to_date = df_to_date.unstack('bucket', fill_value=0).reindex(
+            columns=range(len(sorted_cutoffs)), fill_value=0).cumsum(axis=1)
+
+    # put the columns back in the order the cutoffs came in
+    df_to_date = df_to_date.iloc[:, np.argsort(order)]
+    df_to_date.columns = labels
+
+    df_to_date = df_to_date.reset_index()
+
+    return df_to_date
+
+
+def create_monthly_order_features(df_keys, clean_Sale, years, monthly=True,
+                                  order_date=ORDER_DATE, order_date_year_offset=0):
+    """Creates the cumulative monthly orders and the orders to date for every
+    year, variety and abm. The end of each marketing month and the orders to
+    date cutoff of a year are summed up to in one cumulative_to_date pass,
+    which gives the same totals as masking EFFECTIVE_DATE at each cutoff.
+
+    Keyword arguments:
+        df_keys -- the dataframe with the year, Variety_Name and abm rows the
+            features are wanted for
+        clean_Sale -- the dataframe of clean sales data with effective date
+        years -- list of the (str) years to create the features for
+        monthly -- whether to create the order_Q_month_* columns, or only
+            the orders to date
+        order_date -- dict with the month and day of the orders to date cutoff
+        order_date_year_offset -- the year of the orders to date cutoff,
+            relative to the marketing year
+    Returns:
+        Sales_monthly -- the dataframe of df_keys rows in years with the
+            order_Q_month_* and orders_to_date columns, missing values as 0
+    """
+    clean_Sale = clean_Sale.loc[clean_Sale['year'].isin(years),
+                                ['EFFECTIVE_DATE'] + SALES_KEYS + ['order_Q']]
+
+    labels = []
+    if monthly:
+        labels = ['order_Q_month_' + str(month) for month in MARKETING_MONTHS]
+    labels.append('orders_to_date')
+
+    features = []
+    for year in years:
+        # grab the orders to date cutoff along with the month ends
+        cutoffs = []
+        if monthly:
+            cutoffs = marketing_month_ends(year)
+        cutoffs.append(dt.datetime(year=int(year) + order_date_year_offset,
+                                   month=order_date['month'],
+                                   day=order_date['day']))
+
+        features.append(cumulative_to_date(df=clean_Sale[clean_Sale['year'] == year],
+                                           keys=SALES_KEYS,
+                                           date_col='EFFECTIVE_DATE',
+                                           value_col='order_Q',
+                                           cutoffs=cutoffs,
+                                           labels=labels))
+
+    df_features = pd.concat(features, ignore_index=True)
+
+    # line the features up with the requested rows, grouped by year in the
+    # order the years were given
+    year_order = {year: i for i, year in enumerate(years)}
+    Sales_monthly = df_keys.loc[df_keys['year'].isin(years), SALES_KEYS]
+    Sales_monthly = Sales_monthly.sort_values(by='year', key=lambda s: s.map(year_order),
+                                              kind='stable').reset_index(drop=True)
+    Sales_monthly = Sales_monthly.merge(df_features, on=SALES_KEYS, how='left')
+
+    Sales_monthly = Sales_monthly.fillna(0)
+
+    return Sales_monthly
@@ -11,11 +11,11 @@ from functools import reduce
 import numpy as np
 from calendar import monthrange
 import datetime as dt
-from pandasql import sqldf
 
 from aggregation_config import(ABM_FIPS_MAP, ABM_TABLE, BLIZZARD_DIR, CM_DIR,
                                DATA_DIR, H2H_DIR, HISTORICAL_SRP, OLD_2020,
                                SALES_2021, SALES_DIR, YIELD_COUNTY_DATA)
+from sales_lags import create_lag_features
 
 
 ###### --------------------- Read ABM & Teamkey Map  ------------------- ######
@@ -170,19 +170,15 @@ def create_lagged_sales(df):
     
     df = df.rename(columns = {'Variety_Name':'hybrid'})
     df['year'] = df['year'].astype(int)
-    sales_all = df.copy()
+    sales_all = df[['year', 'abm', 'hybrid', 'nets_Q', 'order_Q', 'return_Q', 'replant_Q']]
 
-
-    # define the selection criteria as strings to use in the sqldf commmand
-    # this is principally just for readability
-    current_year_q = "select a.year, a.abm, a.hybrid, a.nets_Q, a.order_Q, a.return_Q, a.replant_Q, "
-    last_year_q = "b.nets_Q as nets_Q_1, b.order_Q as order_Q_1, b.return_Q as return_Q_1, b.replant_Q as replant_Q_1, "
-    two_years_q = "c.nets_Q as nets_Q_2, c.order_Q as order_Q_2, c.return_Q as return_Q_2 from sales_all "
-    join_last_year = "a left join sales_all b on a.hybrid = b.hybrid and a.abm = b.abm and a.year = b.year + 1 "
-    join_two_years = "left join sales_all c on a.hybrid = c.hybrid and a.abm = c.abm and a.year = c.year + 2"
- 
-    sales_with_lag = sqldf(current_year_q + last_year_q + two_years_q + 
-                           join_last_year + join_two_years)
+    # look up each product's sales in the ABM one and two years before
+    sales_with_lag = create_lag_features(df=sales_all,
+                                         keys=['abm', 'hybrid'],
+                                         time_col='year',
+                                         value_cols=['nets_Q', 'order_Q', 'return_Q', 'replant_Q'],
+                                         lags=[1, 2])
+    sales_with_lag = sales_with_lag.drop(columns=['replant_Q_2'])
     
     # impute, replacing the NaNs with zeros
     for feature in LAGGED_FEATURES:
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 21:34:52 2026
+
+@author: epnzv
+"""
+
+from functools import lru_cache
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregation_config import COUNTY_GEOCODES, DATA_DIR, GEOCODES_CACHE_DIR, STATE_GEOCODES
+from sales_cache import is_partition_stale, read_manifest, write_manifest
+
+
+# the abbreviation of each state, and the territories, by its full name
+US_STATE_ABBREV = {
+    'Alabama': 'AL',
+    'Alaska': 'AK',
+    'American Samoa': 'AS',
+    'Arizona': 'AZ',
+    'Arkansas': 'AR',
+    'California': 'CA',
+    'Colorado': 'CO',
+    'Connecticut': 'CT',
+    'Delaware': 'DE',
+    'District of Columbia': 'DC',
+    'Florida': 'FL',
+    'Georgia': 'GA',
+    'Guam': 'GU',
+    'Hawaii': 'HI',
+    'Idaho': 'ID',
+    'Illinois': 'IL',
+    'Indiana': 'IN',
+    'Iowa': 'IA',
+    'Kansas': 'KS',
+    'Kentucky': 'KY',
+    'Louisiana': 'LA',
+    'Maine': 'ME',
+    'Maryland': 'MD',
+    'Massachusetts': 'MA',
+    'Michigan': 'MI',
+    'Minnesota': 'MN',
+    'Mississippi': 'MS',
+    'Missouri': 'MO',
+    'Montana': 'MT',
+    'Nebraska': 'NE',
+    'Nevada': 'NV',
+    'New Hampshire': 'NH',
+    'New Jersey': 'NJ',
+    'New Mexico': 'NM',
+    'New York': 'NY',
+    'North Carolina': 'NC',
+    'North Dakota': 'ND',
+    'Northern Mariana Islands': 'MP',
+    'Ohio': 'OH',
+    'Oklahoma': 'OK',
+    'Oregon': 'OR',
+    'Pennsylvania': 'PA',
+    'Puerto Rico': 'PR',
+    'Rhode Island': 'RI',
+    'South Carolina': 'SC',
+    'South Dakota': 'SD',
+    'Tennessee': 'TN',
+    'Texas': 'TX',
+    'Utah': 'UT',
+    'Vermont': 'VT',
+    'Virgin Islands': 'VI',
+    'Virginia': 'VA',
+    'Washington': 'WA',
+    'West Virginia': 'WV',
+    'Wisconsin': 'WI',
+    'Wyoming': 'WY'}
+
+# the column of the census area names, and the description ending a county's
+COUNTY_AREA_COL = 'Area Name (including legal/statistical area description)'
+COUNTY_SUFFIX = ' County'
+
+# the fips code given to a row without one
+MISSING_FIPS = -1
+
+# name of the parquet file of the county table in the cache directory
+GEOCODES_CACHE_FILE = 'geocodes.parquet'
+
+
+def combine_fips(state_codes, county_codes):
+    """Combines state and county codes, e.g. the FIPS or ANSI codes of the
+    census or the USDA, into the five digit fips code as an integer.
+
+    Keyword arguments:
+        state_codes -- series of the state codes, numbers or strs of numbers
+        county_codes -- series of the county codes, numbers or strs of numbers
+    Returns:
+        fips -- int32 array of the fips codes, MISSING_FIPS where either code
+            is missing
+    """
+    state_codes = pd.to_numeric(pd.Series(state_codes)).to_numpy(dtype=np.float64, na_value=np.nan)
+    county_codes = pd.to_numeric(pd.Series(county_codes)).to_numpy(dtype=np.float64, na_value=np.nan)
+
+    fips = state_codes * 1000 + county_codes
+
+    return np.where(np.isnan(fips), MISSING_FIPS, fips).astype(np.int32)
+
+
+def format_fips(fips):
+    """Turns integer fips codes into their five character strs, e.g. 1001 ->
+    "01001".
+
+    Keyword arguments:
+        fips -- series of the integer fips codes
+    Returns:
+        fips_str -- series of the padded fips codes
+    """
+    return pd.Series(fips).astype(np.int64).astype(str).str.zfill(5)
+
+
+def parse_geocodes(State_fips, County_fips):
+    """Parses the census geocode spreadsheets into a table of the counties of
+    every state with an abbreviation.
+
+    Keyword arguments:
+        State_fips -- the dataframe of state and fips info
+        County_fips -- the dataframe of county and fips info
+    Returns:
+        geocodes -- the dataframe of the state, state_abbrev, county and int32
+            fips of each county, ordered by state
+    """
+    # the states, leaving out the regions and divisions
+    states = pd.DataFrame({'state': State_fips['Name'],
+                           'state_abbrev': State_fips['Name'].map(US_STATE_ABBREV),
+                           'state_code': pd.to_numeric(State_fips['State (FIPS)'])})
+    states = states.dropna(how='any')
+
+    # the areas that are counties, named without the description
+    areas = County_fips[COUNTY_AREA_COL]
+    is_county = areas.str.endswith(COUNTY_SUFFIX, na=False).to_numpy()
+    County_fips = County_fips[is_county]
+
+    counties = pd.DataFrame({
+            'state_code': pd.to_numeric(County_fips['State Code (FIPS)']),
+            'county': County_fips[COUNTY_AREA_COL].str[:-len(COUNTY_SUFFIX)],
+            'fips': combine_fips(County_fips['State Code (FIPS)'],
+                                 County_fips['County Code (FIPS)'])})
+    counties = counties[counties['fips'] != MISSING_FIPS]
+
+    geocodes = counties.merge(states, on='state_code', how='inner')
+    geocodes = geocodes.sort_values(by='state_code', kind='stable')
+    geocodes = geocodes[['state', 'state_abbrev', 'county', 'fips']].reset_index(drop=True)
+
+    return geocodes
+
+
+def write_geocodes(cache_path, geocodes):
+    """Writes the cached county table, replacing the old one atomically.
+
+    Keyword arguments:
+        cache_path -- the path of the parquet file
+        geocodes -- the dataframe of the counties
+    Returns:
+        None
+    """
+    # one temporary file per process, as pipeline stages can write at once
+    tmp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+    geocodes.to_parquet(tmp_path, index=False)
+
+    os.replace(tmp_path, cache_path)
+
+
+@lru_cache(maxsize=None)
+def load_geocodes(state_path, county_path, cache_dir):
+    """Loads the table of the counties of every state, from the parquet cache
+    unless either spreadsheet has changed. Later calls in the session share
+    the dataframe, so it is only handed out through read_geocodes.
+
+    Keyword arguments:
+        state_path -- the path of the census state geocodes spreadsheet
+        county_path -- the path of the census geocodes spreadsheet
+        cache_dir -- the directory of the parquet cache
+    Returns:
+        geocodes -- the shared dataframe of the counties
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = read_manifest(cache_dir)
+    cache_path = os.path.join(cache_dir, GEOCODES_CACHE_FILE)
+
+    # the cache is only used if it was parsed from these very spreadsheets
+    sources = []
+    updated = False
+    for path in [state_path, county_path]:
+        stale, entry = is_partition_stale(path, manifest.get(path))
+        if manifest.get(path) != entry:
+            manifest[path] = entry
+            updated = True
+        sources.append(entry['sha1'])
+
+    if os.path.exists(cache_path) and manifest.get(GEOCODES_CACHE_FILE) == sources:
+        geocodes = pd.read_parquet(cache_path)
+    else:
+        print("Read ", county_path)
+        geocodes = parse_geocodes(pd.read_excel(state_path, skiprows=5),
+                                  pd.read_excel(county_path, skiprows=4))
+        write_geocodes(cache_path, geocodes)
+        manifest[GEOCODES_CACHE_FILE] = sources
+        updated = True
+
+    if updated:
+        write_manifest(cache_dir, manifest)
+
+    return geocodes
+
+
+def read_geocodes(state_path=STATE_GEOCODES, county_path=COUNTY_GEOCODES,
+                  cache_dir=None):
+    """Reads in the table of the counties of every state. The spreadsheets are
+    only parsed again when either of them changes, the table being kept as
+    parquet in between, and later calls in the session get a copy of the
+    table read the first time.
+
+    Keyword arguments:
+        state_path -- the path of the census state geocodes spreadsheet
+        county_path -- the path of the census geocodes spreadsheet
+        cache_dir -- the directory of the parquet cache
+    Returns:
+        geocodes -- the dataframe of the state, state_abbrev, county and int32
+            fips of each county
+    """
+    if cache_dir is None:
+        cache_dir = DATA_DIR + GEOCODES_CACHE_DIR
+
+    return load_geocodes(state_path, county_path, cache_dir).copy()
+
+
+def lookup_fips(states, counties, state_col='state', geocodes=None):
+    """Finds the fips code of each pair of state and county names.
+
+    Keyword arguments:
+        states -- series of the states, by full name or by abbreviation
+        counties -- series of the county names, without the " County"
+        state_col -- 'state' if the states are full names, 'state_abbrev' if
+            they are abbreviations
+        geocodes -- the county table to look them up in, None to read it in
+    Returns:
+        fips -- int32 array of the fips codes, MISSING_FIPS where the county
+            isn't known
+    """
+    if geocodes is None:
+        geocodes = read_geocodes()
+
+    # a name shared by two counties of a state takes the first one's fips
+    geocodes = geocodes.drop_duplicates(subset=[state_col, 'county'])
+
+    county_index = pd.MultiIndex.from_frame(geocodes[[state_col, 'county']])
+    positions = county_index.get_indexer(pd.MultiIndex.from_arrays(
+            [np.asarray(states, dtype=object), np.asarray(counties, dtype=object)]))
+
+    fips = geocodes['fips'].to_numpy()[positions]
+
+    return np.where(positions >= 0, fips, MISSING_FIPS).astype(np.int32)
@@ -8,9 +8,17 @@ Created on Tue Nov  8 10:10:08 2022
 
 import numpy as np
 import pandas as pd
-import datetime as dt
 from calendar import monthrange 
-from aggregation_config import (ABM_TABLE, DATA_DIR, SALES_DIR)
+from aggregation_config import (ABM_TABLE, DATA_DIR)
+from sales_cache import read_sales_years
+
+
+FRACTIONS_FILE = 'historical_daily_fractions_all_features.csv'
+
+# the abm that gets the average of the other abms' fractions
+FALLBACK_ABM = '9Z01'
+
+QUANTS = ['order', 'nets', 'return', 'replant']
 
 
 def read_abm_teamkey_file():
@@ -34,163 +42,140 @@ def read_abm_teamkey_file():
     return abm_Teamkey
 
 
-abm_Teamkey = read_abm_teamkey_file()
+def read_fraction_sales(abm_Teamkey, years=range(2012, 2021)):
+    """Reads in the soybean sales with the abm, month and day of each order.
+
+    Keyword arguments:
+        abm_Teamkey -- the dataframe of mapping teamkey to abm
+        years -- the sales years to read
+    Returns:
+        df_clean_sale -- the dataframe of the sales quantities by abm, month
+            and day, with missing values dropped
+    """
+    SALES_COLUMNS = ['SLS_LVL_2_ID', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE',
+                     'ORDER_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
+                     'REPLANT_QTY_TO_DATE']
+
+    Sale_2012_2020 = read_sales_years(years=years,
+                                      species=['SOYBEAN'],
+                                      brand_families=['NATIONAL'],
+                                      columns=SALES_COLUMNS)
 
-dfs_path = []
-    
-# read in the data by year 
-for year in range(2012, 2021):
-    print("Read ", str(year), " Sales Data")
-    dfi_path = DATA_DIR + SALES_DIR + str(year) + '.csv'
-    dfi = pd.read_csv(dfi_path)
-        
-    dfi = dfi[dfi['SPECIE_DESCR'] == 'SOYBEAN'].reset_index(drop=True)
-        
-    # set a year parameter to be the year 
-    dfi['year'] = year
-        
-    # convert the effective date to a datetime format in order to set the mask 
-    dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
     # set 2020 abms to old format
-    if year == 2020:
-        dfi = dfi.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
-        dfi = dfi.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
-        dfi = dfi.rename(columns = {'abm':'SLS_LVL_2_ID'})
-        dfi = dfi.drop(columns=['TEAM_KEY'])
-
-        
-    # add modified dataframe to the list 
-    dfs_path.append(dfi)
-     
-# concate all dataframes  
-Sale_2012_2020 = pd.concat(dfs_path).reset_index(drop=True)
-    
-# rename the columns 
-SALES_COLUMN_NAMES = {'year': 'year', 'SPECIE_DESCR': 'crop',
-                      'SLS_LVL_2_ID': 'abm', 'VARIETY_NAME': 'Variety_Name',
-                      'NET_SALES_QTY_TO_DATE': 'nets_Q',
-                      'ORDER_QTY_TO_DATE': 'order_Q',
-                      'RETURN_QTY_TO_DATE': 'return_Q',
-                      'REPLANT_QTY_TO_DATE': 'replant_Q'}
-    
-Sale_2012_2020 = Sale_2012_2020.rename(columns = SALES_COLUMN_NAMES)
-    
-# select the soybean crop 
-Sale_2012_2020 = Sale_2012_2020[
-        Sale_2012_2020['BRAND_FAMILY_DESCR'] == 'NATIONAL'].reset_index(drop=True)
-    
-# set year as str
-Sale_2012_2020['year'] = Sale_2012_2020['year'].astype(str)
-    
-# create a clean sales data for monthly calculation
-df_clean_sale = Sale_2012_2020.copy()
-    
-# drop unnecessary columns
-SALES_COLUMNS_TO_DROP_Monthly = ['BRAND_FAMILY_DESCR', 
-                                 'DEALER_ACCOUNT_CY_BRAND_FAMILY',
-                                 'SHIPPING_STATE_CODE', 'SHIPPING_COUNTY',
-                                 'SHIPPING_FIPS_CODE', 'SLS_LVL_1_ID', 'CUST_ID',
-                                 'ACCT_ID', 'NET_SHIPPED_QTY_TO_DATE', 
-                                 'Variety_Name', 'crop']
-    
-df_clean_sale = df_clean_sale.drop(columns=SALES_COLUMNS_TO_DROP_Monthly)
-    
-months=[9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
+    Sale_2020 = Sale_2012_2020[Sale_2012_2020['year'] == 2020]
+    Sale_2020 = Sale_2020.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
+    Sale_2020 = Sale_2020.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
+    Sale_2020 = Sale_2020.rename(columns = {'abm':'SLS_LVL_2_ID'})
+    Sale_2020 = Sale_2020.drop(columns=['TEAM_KEY'])
 
-df_clean_sale['month'] = pd.DatetimeIndex(df_clean_sale['EFFECTIVE_DATE']).month
-df_clean_sale['day'] = pd.DatetimeIndex(df_clean_sale['EFFECTIVE_DATE']).day
+    Sale_2012_2020 = pd.concat([Sale_2012_2020[Sale_2012_2020['year'] != 2020],
+                                Sale_2020]).reset_index(drop=True)
 
-df_clean_sale = df_clean_sale[['abm', 'month', 'day', 'order_Q', 'nets_Q',
-                               'return_Q', 'replant_Q']]
+    # rename the columns
+    SALES_COLUMN_NAMES = {'SLS_LVL_2_ID': 'abm',
+                          'NET_SALES_QTY_TO_DATE': 'nets_Q',
+                          'ORDER_QTY_TO_DATE': 'order_Q',
+                          'RETURN_QTY_TO_DATE': 'return_Q',
+                          'REPLANT_QTY_TO_DATE': 'replant_Q'}
 
-df_clean_sale = df_clean_sale.dropna().reset_index(drop=True)
+    df_clean_sale = Sale_2012_2020.rename(columns = SALES_COLUMN_NAMES)
 
-fractions_df = pd.DataFrame(columns=['abm', 'month', 'day', 'order_fraction', 
-                                     'nets_fraction', 'return_fraction',
-                                     'replant_fraction'])
+    df_clean_sale['month'] = df_clean_sale['EFFECTIVE_DATE'].dt.month
+    df_clean_sale['day'] = df_clean_sale['EFFECTIVE_DATE'].dt.day
 
-abm_col = []
-month_col = []
-day_col = []
-for abm in df_clean_sale['abm'].unique():
+    df_clean_sale = df_clean_sale[['abm', 'month', 'day', 'order_Q', 'nets_Q',
+                                   'return_Q', 'replant_Q']]
+
+    df_clean_sale = df_clean_sale.dropna().reset_index(drop=True)
+
+    return df_clean_sale
+
+
+def fiscal_calendar():
+    """Returns every (month, day) of the marketing year in order, september
+    to august, using a leap year so february 29th is included.
+
+    Keyword arguments:
+        None
+    Returns:
+        calendar_df -- the dataframe of the month and day of each fiscal day
+    """
+    months = [9, 10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8]
+
+    month_col = []
+    day_col = []
     for month in months:
         for day in range(1, monthrange(2020, month)[1] + 1):
-            abm_col.append(abm)
             month_col.append(month)
             day_col.append(day)
-            
-fractions_df['abm'] = abm_col
-fractions_df['month'] = month_col
-fractions_df['day'] = day_col
 
+    calendar_df = pd.DataFrame({'month': month_col, 'day': day_col})
 
-quants = ['order', 'nets', 'return', 'replant']
+    return calendar_df
 
 
-for quantity in quants:
-    percent_done = 0
-    for abm in fractions_df['abm'].unique():
-        
-        feature = quantity + '_Q'
-        fraction = quantity + '_fraction'
-        
-        print(str(percent_done / len(fractions_df)) + ' % done with ' + quantity)
-        single_abm = df_clean_sale[df_clean_sale['abm'] == abm].reset_index(drop=True)
-        single_abm_total = np.sum(single_abm[feature])
-    
-        for i in range(0, len(months)):
-            this_month = months[i]
-            prior_months = months[:i]
-        
-            quantity_this_month = single_abm[single_abm['month'] == this_month]
-            if len(prior_months) != 0:
-                quantity_prior_months = single_abm[
-                        single_abm['month'].isin(prior_months)]
-                prior_quantity_total = np.sum(quantity_prior_months[feature])
-            else:
-                prior_quantity_total = 0
-        
-            days_in_month = [*range(1, monthrange(2020, this_month)[1]+1, 1)]
-        
-            for j in range(0, len(days_in_month)):
-                today = days_in_month[j]
-                days_before_today = days_in_month[:j]
-            
-                quantity_today = quantity_this_month[quantity_this_month['day'] == today]
-                quantity_before_today = quantity_this_month[
-                        quantity_this_month['day'].isin(days_before_today)]
-            
-                if len(quantity_before_today) != 0:
-                    quantity_before_today_total = np.sum(quantity_before_today[feature])
-                else:
-                    quantity_before_today_total = 0
-                
-                quantity_today_total = np.sum(quantity_today[feature])
-            
-                quantity_to_date = prior_quantity_total + quantity_before_today_total + quantity_today_total
-            
-                fractions_df.loc[
-                        (fractions_df['abm'] == abm) & 
-                        (fractions_df['month'] == this_month) &
-                        (fractions_df['day'] == today), fraction] = (
-                            quantity_to_date / single_abm_total)
-    
-                percent_done += 1
-    
-fractions_df = fractions_df[fractions_df['abm'] != 'UNK']
+def create_daily_fractions(df_clean_sale):
+    """Creates the fraction of each abm's total quantities that had come in
+    by each day of the marketing year. The quantities are summed once by
+    (abm, month, day), laid out on the fiscal calendar, cumulatively summed
+    and divided by the abm totals. The fallback abm gets the average of the
+    other abms' fractions on the same day.
+
+    Keyword arguments:
+        df_clean_sale -- the dataframe of the sales quantities by abm, month
+            and day
+    Returns:
+        fractions_df -- the dataframe of the daily fractions of each quantity
+            for each abm
+    """
+    features = [quantity + '_Q' for quantity in QUANTS]
+    fractions = [quantity + '_fraction' for quantity in QUANTS]
 
-imputed_abm_orders = fractions_df[fractions_df['abm'] != '9Z01'].drop(columns=['abm'])
+    calendar_df = fiscal_calendar()
+    abms = df_clean_sale['abm'].unique()
 
-for quantity in quants:
-    imputed_abm_orders[quantity + '_fraction'] = imputed_abm_orders[quantity + '_fraction'].astype(float)
+    # the full abm x fiscal day grid, in the order the rows are written out
+    fiscal_index = pd.MultiIndex.from_arrays(
+            [np.repeat(abms, len(calendar_df)),
+             np.tile(calendar_df['month'].values, len(abms)),
+             np.tile(calendar_df['day'].values, len(abms))],
+            names=['abm', 'month', 'day'])
 
-imputed_abm_orders = imputed_abm_orders.groupby(by=['month', 'day'], as_index=False).mean()
+    daily_totals = df_clean_sale.groupby(by=['abm', 'month', 'day'])[features].sum()
+    daily_totals = daily_totals.reindex(fiscal_index, fill_value=0)
 
-for quantity in quants:
-    fractions_df.loc[fractions_df['abm'] == '9Z01', quantity + '_fraction'] = imputed_abm_orders[
-            quantity + '_fraction'].values
-    
-    fractions_df[quantity + '_fraction'] = fractions_df[quantity + '_fraction'].astype(float)
+    abm_totals = df_clean_sale.groupby(by=['abm'])[features].sum()
+
+    # cumulate within each abm along the fiscal days, then divide by the total
+    quantity_to_date = daily_totals.groupby(level='abm', sort=False).cumsum()
+    fractions_df = quantity_to_date.div(
+            abm_totals.reindex(fiscal_index.get_level_values('abm')).values)
+
+    fractions_df.columns = fractions
+    fractions_df = fractions_df.reset_index()
+
+    fractions_df = fractions_df[fractions_df['abm'] != 'UNK'].reset_index(drop=True)
+
+    # give the fallback abm the average of the other abms, lined up by day
+    is_fallback = fractions_df['abm'] == FALLBACK_ABM
+    if is_fallback.any():
+        imputed_abm_orders = fractions_df[~is_fallback].groupby(
+                by=['month', 'day'], as_index=False)[fractions].mean()
+
+        fallback_days = fractions_df.loc[is_fallback, ['month', 'day']]
+        fractions_df.loc[is_fallback, fractions] = fallback_days.merge(
+                imputed_abm_orders, on=['month', 'day'], how='left')[fractions].values
+
+    fractions_df[fractions] = fractions_df[fractions].astype(float)
+
+    return fractions_df
+
+
+if __name__ == '__main__':
+    abm_Teamkey = read_abm_teamkey_file()
+
+    df_clean_sale = read_fraction_sales(abm_Teamkey=abm_Teamkey)
+
+    fractions_df = create_daily_fractions(df_clean_sale=df_clean_sale)
 
-fractions_df.to_csv('historical_daily_fractions_all_features.csv', index=False)
\ No newline at end of file
+    fractions_df.to_csv(FRACTIONS_FILE, index=False)
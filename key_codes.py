@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:52:40 2026
+
+@author: epnzv
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# the join keys that get integer codes, year is kept as an int16 instead
+KEY_COLUMNS = ['year', 'abm', 'Variety_Name', 'hybrid', 'trait']
+
+# keys that share the codes of another key
+KEY_ALIASES = {'hybrid': 'Variety_Name'}
+
+# the values of each key seen so far in this session, the position of a value
+# being its code, so codes are stable for as long as the session runs
+KEY_DICTIONARIES = {}
+
+
+def encode_key(values, key):
+    """Gives each value of a key its integer code, adding the values that
+    haven't been seen before to the key's dictionary.
+
+    Keyword arguments:
+        values -- series of the key's values
+        key -- the name of the key, e.g. abm
+    Returns:
+        codes -- int32 array of the codes, -1 for missing values
+    """
+    key = KEY_ALIASES.get(key, key)
+    dictionary = KEY_DICTIONARIES.get(key, pd.Index([], dtype=object))
+
+    values = pd.Series(values)
+    new_values = values[values.notna() & ~values.isin(dictionary)].unique()
+    if len(new_values) > 0:
+        dictionary = dictionary.append(pd.Index(new_values, dtype=object))
+        KEY_DICTIONARIES[key] = dictionary
+
+    codes = dictionary.get_indexer(values).astype(np.int32)
+
+    return codes
+
+
+def decode_key(codes, key):
+    """Turns the codes of a key back into its values.
+
+    Keyword arguments:
+        codes -- array of the codes, -1 for missing values
+        key -- the name of the key, e.g. abm
+    Returns:
+        values -- object array of the values, NaN where the code is missing
+    """
+    key = KEY_ALIASES.get(key, key)
+    dictionary = np.asarray(KEY_DICTIONARIES.get(key, pd.Index([], dtype=object)),
+                            dtype=object)
+
+    codes = np.asarray(codes, dtype=np.int64)
+
+    values = np.full(len(codes), np.nan, dtype=object)
+    present = codes >= 0
+    values[present] = dictionary[codes[present]]
+
+    return values
+
+
+def encode_keys(df, columns=None):
+    """Replaces the join keys of a dataframe with their integer codes, and the
+    year with an int16, so the merges on them are integer hash joins. Missing
+    keys become NA, which groupbys drop and merges match just as they do NaN.
+
+    Keyword arguments:
+        df -- the dataframe to encode
+        columns -- list of the key columns to encode, None for every column
+            of KEY_COLUMNS the dataframe has
+    Returns:
+        df_encoded -- a copy of the dataframe with encoded keys
+    """
+    if columns is None:
+        columns = [col for col in KEY_COLUMNS if col in df.columns]
+
+    df_encoded = df.copy()
+    for col in columns:
+        if col == 'year':
+            df_encoded[col] = pd.to_numeric(df_encoded[col]).astype(np.int16)
+        else:
+            codes = encode_key(df_encoded[col], col)
+            df_encoded[col] = pd.arrays.IntegerArray(codes, codes < 0)
+
+    return df_encoded
+
+
+def decode_keys(df, dtypes):
+    """Turns the encoded keys of a dataframe back into their values.
+
+    Keyword arguments:
+        df -- the dataframe with encoded keys
+        dtypes -- dict of each encoded column to the dtype it is decoded to
+    Returns:
+        df_decoded -- a copy of the dataframe with the key values
+    """
+    df_decoded = df.copy()
+    for col, dtype in dtypes.items():
+        if col not in df_decoded.columns:
+            continue
+
+        if col == 'year':
+            # the years of an object column are strs too, astype(object)
+            # alone would leave them as ints
+            if dtype == object or pd.api.types.is_string_dtype(dtype):
+                df_decoded[col] = df_decoded[col].astype(str)
+            df_decoded[col] = df_decoded[col].astype(dtype)
+        else:
+            codes = df_decoded[col].fillna(-1).to_numpy(dtype=np.int64)
+            df_decoded[col] = pd.Series(decode_key(codes, col),
+                                        index=df_decoded.index).astype(dtype)
+
+    return df_decoded
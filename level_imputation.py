@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:27:44 2026
+
+@author: epnzv
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# the code of the level a row's imputed values came from, above the codes of
+# the levels themselves (1 for the first level, 2 for the second, ...)
+OBSERVED_LEVEL = 0
+MISSING_LEVEL = -1
+
+
+def build_level_cube(df, features, levels, weight_col=None):
+    """Aggregates features to a hierarchy of levels in one pass. The sum and
+    count of each feature are taken once at the finest level, the cells of
+    every key of every level, and each level is then rolled up from those
+    cells rather than regrouping the full dataframe. A row's missing keys are
+    kept in the cells so the levels that don't use those keys still count it.
+
+    Keyword arguments:
+        df -- the dataframe to aggregate
+        features -- list of the feature columns to aggregate
+        levels -- dict of each level's name to the list of its keys, in order
+            of preference, from the most specific level to the least
+        weight_col -- the column to weight the means by, None for plain means
+    Returns:
+        cube -- dict of each level's name to a dataframe indexed by its keys,
+            holding the weighted sum of each feature as feature + '_sum' and
+            the weight of its values, the count for plain means, as
+            feature + '_weight'
+    """
+    finest_keys = []
+    for keys in levels.values():
+        finest_keys += [key for key in keys if key not in finest_keys]
+
+    values = df[features].to_numpy(dtype=np.float64, na_value=np.nan)
+    if weight_col is None:
+        weights = np.ones(len(df))
+    else:
+        weights = df[weight_col].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    # the missing values of a feature add nothing to its sum or its weight
+    present = ~np.isnan(values)
+    sums = {}
+    for i, feature in enumerate(features):
+        sums[feature + '_sum'] = np.where(present[:, i], values[:, i] * weights, 0.0)
+        sums[feature + '_weight'] = np.where(present[:, i], weights, 0.0)
+
+    cells = df[finest_keys].reset_index(drop=True).assign(**sums)
+    cells = cells.groupby(by=finest_keys, dropna=False).sum()
+
+    cube = {name: cells.groupby(level=keys).sum() for name, keys in levels.items()}
+
+    return cube
+
+
+def level_means(level, features):
+    """Turns the sums of a level of a cube into the mean of each feature.
+
+    Keyword arguments:
+        level -- the dataframe of one level of a cube, as given by
+            build_level_cube
+        features -- list of the features to take the means of
+    Returns:
+        means -- the dataframe of the means, indexed by the level's keys, NaN
+            where a feature has no values
+    """
+    means = pd.DataFrame(index=level.index)
+    for feature in features:
+        means[feature] = level[feature + '_sum'] / level[feature + '_weight']
+
+    return means
+
+
+def lookup_level_rows(df, level):
+    """Finds the row of an aggregated level that matches each row of a
+    dataframe.
+
+    Keyword arguments:
+        df -- the dataframe to look the rows up for
+        level -- the aggregated dataframe, indexed by the keys it is
+            aggregated by with one row per value of the keys
+    Returns:
+        positions -- int array of the position of each row's match in the
+            level, -1 where it has none
+    """
+    keys = list(level.index.names)
+    if len(keys) == 1:
+        return level.index.get_indexer(df[keys[0]])
+
+    return level.index.get_indexer(pd.MultiIndex.from_frame(df[keys]))
+
+
+def coalesce_levels(df, features, levels, level_col=None, feature_levels=False):
+    """Fills the missing values of features from a list of aggregated levels,
+    taking each value from the first level that has one. Every level is
+    looked up once by its keys and the features are filled together as one
+    array, rather than merging the levels on and masking the frame once per
+    level and feature.
+
+    Keyword arguments:
+        df -- the dataframe with missing feature values
+        features -- list of the feature columns to fill
+        levels -- list of the aggregated dataframes in order of preference,
+            each indexed by its keys with one row per value of the keys
+        level_col -- the name of the int8 column recording, for each row, the
+            least specific level any of its features came from: 0 if none
+            were missing, the position of the level counting from 1, or -1
+            if a feature is still missing after every level, None to not
+            record it
+        feature_levels -- whether to record the level each feature's value
+            came from, coded as for level_col, in an int8 column per feature
+            named feature + '_level'
+    Returns:
+        df_imputed -- the dataframe with the features filled, with a fresh
+            index as a merge would give
+    """
+    values = df[features].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+    value_levels = np.where(np.isnan(values), MISSING_LEVEL, OBSERVED_LEVEL).astype(np.int8)
+
+    for code, level in enumerate(levels, start=1):
+        level_values = level[features].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        # a row of NaNs at the end for the rows without a match, at position -1
+        level_values = np.vstack([level_values, np.full((1, len(features)), np.nan)])
+        level_values = level_values[lookup_level_rows(df, level)]
+
+        fill = np.isnan(values) & ~np.isnan(level_values)
+        values[fill] = level_values[fill]
+        value_levels[fill] = code
+
+    df_imputed = df.reset_index(drop=True)
+    df_imputed[features] = values
+
+    if level_col is not None:
+        row_levels = value_levels.max(axis=1)
+        row_levels[(value_levels == MISSING_LEVEL).any(axis=1)] = MISSING_LEVEL
+        df_imputed[level_col] = row_levels.astype(np.int8)
+
+    if feature_levels:
+        for i, feature in enumerate(features):
+            df_imputed[feature + '_level'] = value_levels[:, i]
+
+    return df_imputed
+
+
+def impute_from_cube(df, cube, features, level_col=None, feature_levels=False):
+    """Fills the missing values of features with the best available value in
+    a cube, the mean of the most specific level that has one for the row's
+    keys.
+
+    Keyword arguments:
+        df -- the dataframe with missing feature values
+        cube -- the cube of the features, as given by build_level_cube
+        features -- list of the feature columns to fill
+        level_col -- the name of the column recording the level each row's
+            values came from, as in coalesce_levels, None to not record it
+        feature_levels -- whether to record the level each feature's value
+            came from in a column per feature, as in coalesce_levels
+    Returns:
+        df_imputed -- the dataframe with the features filled, with a fresh
+            index as a merge would give
+    """
+    levels = [level_means(level, features) for level in cube.values()]
+
+    return coalesce_levels(df=df, features=features, levels=levels, level_col=level_col,
+                           feature_levels=feature_levels)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 16 11:05:13 2026
+
+@author: epnzv
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from aggregation_config import DATA_DIR, RM_CACHE_DIR
+
+
+# lower edges of the RM bins on the first two digits of the product name;
+# anything below 1 is -0.1, [1, 5) is 0, [5, 10) is 0.5, ... [85, 90) is 8.5
+# and anything from 90 up is 0
+RM_BIN_EDGES = np.array([1] + list(range(5, 95, 5)))
+RM_BIN_VALUES = np.array([-0.1] + [0.5 * i for i in range(0, 18)] + [0.0])
+
+# the digits and RM of every product name seen so far in this session, or
+# loaded from the parquet cache of the earlier ones
+RM_CACHE = {}
+
+# name of the parquet file in the cache directory holding the digits of every
+# product name parsed so far
+RM_CACHE_FILE = 'product_digits.parquet'
+
+
+def RM_from_digits(digits):
+    """Bins the first two characters of the digits of product names into RMs.
+
+    Keyword arguments:
+        digits -- series of the first group of digits of each name
+    Returns:
+        RM -- array of the RM of each name
+    """
+    leading = digits.str[:2].astype(int).values
+
+    return RM_BIN_VALUES[np.digitize(leading, RM_BIN_EDGES)]
+
+
+def compute_RM(hybrids):
+    """Computes the RM of each product name from the first two characters of
+    the first group of digits in it, '00' if there are none.
+
+    Keyword arguments:
+        hybrids -- series of product names
+    Returns:
+        digits -- series of the first group of digits of each name
+        RM -- array of the RM of each name
+    """
+    digits = hybrids.str.extract('([0-9]+)', expand=False).fillna('00')
+
+    return digits, RM_from_digits(digits)
+
+
+def read_RM_cache(cache_dir):
+    """Loads the digits of the product names parsed in earlier sessions into
+    RM_CACHE. Only the digits are kept on disk and their RMs are binned again
+    here, so a change to the bins applies to the cached names too.
+
+    Keyword arguments:
+        cache_dir -- the directory of the parquet cache
+    Returns:
+        None
+    """
+    cache_path = os.path.join(cache_dir, RM_CACHE_FILE)
+    if os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        RM_CACHE.update(zip(cached['Variety_Name'],
+                            zip(cached['digits'], RM_from_digits(cached['digits']))))
+
+
+def write_RM_cache(cache_dir):
+    """Writes the digits of every product name in RM_CACHE to the parquet
+    cache, replacing the old file atomically.
+
+    Keyword arguments:
+        cache_dir -- the directory of the parquet cache
+    Returns:
+        None
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = os.path.join(cache_dir, RM_CACHE_FILE)
+
+    cached = pd.DataFrame({'Variety_Name': list(RM_CACHE),
+                           'digits': [digit for digit, RM in RM_CACHE.values()]})
+
+    # one temporary file per process, as pipeline stages can write at once
+    tmp_path = cache_path + '.' + str(os.getpid()) + '.tmp'
+    cached.to_parquet(tmp_path, index=False)
+
+    os.replace(tmp_path, cache_path)
+
+
+def get_RM(df, cache_dir=None):
+    """Obtains the RM of a product from its name. Names are only parsed once,
+    the first time any session sees them, and kept in a parquet cache for
+    later sessions.
+
+    Keyword arguments:
+        df -- the dataframe with product names
+        cache_dir -- the directory of the parquet cache of the parsed names
+    Returns:
+        df_w_rm -- the dataframe with RM merged
+        digits -- the dataframe with product names and their RMs
+    """
+    if cache_dir is None:
+        cache_dir = DATA_DIR + RM_CACHE_DIR
+
+    hybrids = df['Variety_Name'].drop_duplicates().reset_index(drop=True)
+
+    # only go to the disk cache, and then parse, for names not seen this session
+    new_hybrids = hybrids[~hybrids.isin(list(RM_CACHE))]
+    if len(new_hybrids) > 0:
+        read_RM_cache(cache_dir)
+        new_hybrids = hybrids[~hybrids.isin(list(RM_CACHE))]
+
+    if len(new_hybrids) > 0:
+        new_digits, new_RM = compute_RM(new_hybrids)
+        RM_CACHE.update(zip(new_hybrids, zip(new_digits, new_RM)))
+        write_RM_cache(cache_dir)
+
+    cached = [RM_CACHE[hybrid] for hybrid in hybrids]
+
+    digits = pd.DataFrame({'digits': [digit for digit, RM in cached],
+                           'RM': np.array([RM for digit, RM in cached], dtype=float),
+                           'Variety_Name': hybrids.values})
+
+    df_w_RM = df.merge(digits.drop(columns=['digits']),
+                       on=['Variety_Name'],
+                       how='left')
+
+    return df_w_RM, digits
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 12 10:14:52 2026
+
+@author: epnzv
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from aggregation_config import DATA_DIR, SALES_CACHE_DIR, SALES_DIR
+
+
+# columns the parquet dataset is partitioned on, in directory order
+SALES_PARTITION_COLS = ['year', 'SPECIE_DESCR', 'BRAND_FAMILY_DESCR']
+
+# name of the file that records which source csv each partition was built from,
+# the leading underscore keeps the parquet reader from treating it as data
+SALES_CACHE_MANIFEST = '_manifest.json'
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """Returns the sha1 hex digest of a file, read in chunks.
+
+    Keyword arguments:
+        path -- the path of the file to hash
+        chunk_size -- the number of bytes to read at a time
+    Returns:
+        digest -- the sha1 hex digest of the file contents
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def read_manifest(cache_dir):
+    """Reads the cache manifest, returning an empty one if there isn't one yet.
+
+    Keyword arguments:
+        cache_dir -- the root directory of the parquet sales dataset
+    Returns:
+        manifest -- dict of year (str) to the mtime, size and sha1 of its csv
+    """
+    manifest_path = os.path.join(cache_dir, SALES_CACHE_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+
+    return manifest
+
+
+def write_manifest(cache_dir, manifest):
+    """Writes the cache manifest, replacing the old one atomically.
+
+    Keyword arguments:
+        cache_dir -- the root directory of the parquet sales dataset
+        manifest -- dict of year (str) to the mtime, size and sha1 of its csv
+    Returns:
+        None
+    """
+    manifest_path = os.path.join(cache_dir, SALES_CACHE_MANIFEST)
+
+    # one temporary file per process, as pipeline stages can write at once
+    tmp_path = manifest_path + '.' + str(os.getpid()) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    os.replace(tmp_path, manifest_path)
+
+
+def is_partition_stale(csv_path, entry):
+    """Checks whether a year's csv has changed since its partition was built.
+    The mtime and size are checked first; the file is only hashed when they
+    differ, so touching a file without changing it doesn't trigger a rebuild.
+
+    Keyword arguments:
+        csv_path -- the path of the year's sales csv
+        entry -- the manifest entry for the year, or None if it was never built
+    Returns:
+        stale -- True if the partition needs to be rebuilt
+        entry -- the up to date manifest entry for the csv
+    """
+    stat = os.stat(csv_path)
+    if (entry is not None and entry['mtime'] == stat.st_mtime and
+        entry['size'] == stat.st_size):
+        return False, entry
+
+    digest = hash_file(csv_path)
+    new_entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': digest}
+    stale = entry is None or entry['sha1'] != digest
+
+    return stale, new_entry
+
+
+def convert_sales_year(csv_path, year, cache_dir):
+    """Parses a year's sales csv once and writes it to the parquet dataset,
+    partitioned by year, specie and brand family, with the effective date
+    already converted to a datetime.
+
+    Keyword arguments:
+        csv_path -- the path of the year's sales csv
+        year -- the sales year the csv holds
+        cache_dir -- the root directory of the parquet sales dataset
+    Returns:
+        None
+    """
+    print("Converting ", str(year), " Sales Data to parquet")
+    dfi = pd.read_csv(csv_path)
+
+    # convert the effective date to a datetime format in order to set the mask
+    dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
+
+    # parquet needs a single type per column, so mixed id columns become str
+    for col in dfi.columns[dfi.dtypes == object]:
+        dfi[col] = dfi[col].where(dfi[col].isna(), dfi[col].astype(str))
+
+    dfi['year'] = year
+
+    # remove the old partition before writing so no stale files are left over
+    year_dir = os.path.join(cache_dir, 'year=' + str(year))
+    if os.path.exists(year_dir):
+        shutil.rmtree(year_dir)
+
+    dfi.to_parquet(cache_dir, partition_cols=SALES_PARTITION_COLS, index=False)
+
+
+def update_sales_cache(years, cache_dir=None, sales_dir=None):
+    """Makes sure the parquet dataset holds an up to date partition for each
+    of the given years, converting only the csvs that are new or have changed.
+
+    Keyword arguments:
+        years -- the sales years to check
+        cache_dir -- the root directory of the parquet sales dataset
+        sales_dir -- the directory holding the <year>.csv sales files
+    Returns:
+        None
+    """
+    if cache_dir is None:
+        cache_dir = DATA_DIR + SALES_CACHE_DIR
+    if sales_dir is None:
+        sales_dir = DATA_DIR + SALES_DIR
+
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = read_manifest(cache_dir)
+
+    for year in years:
+        csv_path = sales_dir + str(year) + '.csv'
+        stale, entry = is_partition_stale(csv_path, manifest.get(str(year)))
+
+        if stale:
+            convert_sales_year(csv_path, year, cache_dir)
+
+        # record the entry even when only the mtime moved, to skip the hash next time
+        if manifest.get(str(year)) != entry:
+            manifest[str(year)] = entry
+            write_manifest(cache_dir, manifest)
+
+
+def read_sales_years(years, species=None, brand_families=None, columns=None,
+                     cache_dir=None, sales_dir=None):
+    """Reads the sales data for the given years from the parquet dataset,
+    loading only the partitions and columns that are asked for. The dataset
+    is refreshed from the csvs first if any of them have changed.
+
+    Keyword arguments:
+        years -- the sales years to read
+        species -- list of SPECIE_DESCR values to keep, None for all
+        brand_families -- list of BRAND_FAMILY_DESCR values to keep, None for all
+        columns -- list of columns to read, None for all
+        cache_dir -- the root directory of the parquet sales dataset
+        sales_dir -- the directory holding the <year>.csv sales files
+    Returns:
+        df_sales -- the dataframe of the sales data with an int year column
+    """
+    if cache_dir is None:
+        cache_dir = DATA_DIR + SALES_CACHE_DIR
+
+    years = [int(year) for year in years]
+    update_sales_cache(years, cache_dir=cache_dir, sales_dir=sales_dir)
+
+    filters = None
+    if species is not None:
+        filters = [('SPECIE_DESCR', 'in', list(species))]
+    if brand_families is not None:
+        filters = (filters or []) + [('BRAND_FAMILY_DESCR', 'in', list(brand_families))]
+
+    # year is added back below rather than read from the partition
+    if columns is not None:
+        columns = [col for col in columns if col != 'year']
+
+    # each year is read on its own, as the columns types can drift between years
+    dfs_sales = []
+    for year in years:
+        year_dir = os.path.join(cache_dir, 'year=' + str(year))
+        dfi = pd.read_parquet(year_dir, columns=columns, filters=filters)
+
+        # partition columns come back as categoricals
+        for col in SALES_PARTITION_COLS:
+            if col in dfi.columns:
+                dfi[col] = dfi[col].astype(str)
+
+        dfi['year'] = year
+        dfs_sales.append(dfi)
+
+    df_sales = pd.concat(dfs_sales).reset_index(drop=True)
+
+    return df_sales
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:41:17 2026
+
+@author: epnzv
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def create_lag_features(df, keys, time_col, value_cols, lags, source=None):
+    """Adds the values of the same keys from earlier periods to a dataframe,
+    e.g. the sales of a hybrid in an ABM one and two years before. The source
+    is sorted once on the keys and the time, and the rows of every lag are
+    then looked up on that index in a single pass, so a deeper lag only adds
+    its lookups rather than another copy and join of the frame. A row with no
+    entry for the period gets NaN, whether the keys are missing that period or
+    never appear.
+
+    Keyword arguments:
+        df -- the dataframe to add the lagged values to
+        keys -- list of the columns identifying a series, e.g. abm and hybrid
+        time_col -- the period column, numeric or a str of a number, e.g. year
+        value_cols -- list of the columns to lag, or dict of each column to
+            the name its lagged columns are based on
+        lags -- list of the lags to add, in periods
+        source -- the dataframe with one row per keys and period to take the
+            earlier values from, None to take them from df itself
+    Returns:
+        df_with_lag -- the dataframe with a column per value and lag, named
+            <value>_<lag> and ordered by lag, with a fresh index as a merge
+            would give
+    """
+    if source is None:
+        source = df
+    if not isinstance(value_cols, dict):
+        value_cols = {col: col for col in value_cols}
+
+    index_cols = list(keys) + [time_col]
+
+    source = source[index_cols + list(value_cols)].copy()
+    source[time_col] = pd.to_numeric(source[time_col])
+    source = source.sort_values(by=index_cols)
+    source_index = pd.MultiIndex.from_frame(source[index_cols])
+    if not source_index.is_unique:
+        raise ValueError('Lagging needs one row per ' + ', '.join(index_cols))
+
+    # the keys of every row repeated once per lag, with the time moved back
+    n_rows = len(df)
+    time = pd.to_numeric(df[time_col]).to_numpy()
+    lagged_index = pd.MultiIndex.from_arrays(
+            [np.tile(df[col].to_numpy(), len(lags)) for col in keys] +
+            [np.concatenate([time - lag for lag in lags])],
+            names=index_cols)
+
+    positions = source_index.get_indexer(lagged_index)
+
+    lag_columns = {}
+    for i, lag in enumerate(lags):
+        lag_positions = positions[i * n_rows:(i + 1) * n_rows]
+        for col, name in value_cols.items():
+            lag_columns[name + '_' + str(lag)] = pd.api.extensions.take(
+                    source[col].to_numpy(), lag_positions, allow_fill=True)
+
+    df_with_lag = df.reset_index(drop=True).assign(**lag_columns)
+
+    return df_with_lag
+
+
+def impute_cohort_lags(df, keys, time_col, age_col, base_col, value_cols, lags):
+    """Imputes the lagged values of the products too young to have them, from
+    their current base quantity and the ratio of each value to the base over
+    their whole group in the earlier period, e.g. an age one product's returns
+    last year as its orders to date times the ABM's ratio of returns to orders
+    to date last year. The ratios of every lag and value are looked up in a
+    single pass into a (lag, row, value) array and multiplied by the base at
+    once, so a row of age a is imputed for every lag of a or more.
+
+    Keyword arguments:
+        df -- the dataframe with the lagged values, named <value>_<lag>
+        keys -- list of the columns of the group the ratios are taken over
+        time_col -- the period column, numeric or a str of a number, e.g. year
+        age_col -- the column of each row's age in periods, 1 in its first
+        base_col -- the column the values are a ratio of, e.g. orders_to_date
+        value_cols -- list of the columns to take the ratios of, or dict of
+            each column to the name its lagged columns are based on
+        lags -- list of the lags to impute, in periods
+    Returns:
+        df_imputed -- the dataframe with the lagged values of the young rows
+            imputed, NaN where the group has no ratio for the period, with a
+            fresh index as a merge would give
+    """
+    if not isinstance(value_cols, dict):
+        value_cols = {col: col for col in value_cols}
+
+    index_cols = list(keys) + [time_col]
+
+    totals = df[index_cols + [base_col] + list(value_cols)].copy()
+    totals[time_col] = pd.to_numeric(totals[time_col])
+    totals = totals.groupby(by=index_cols).sum()
+
+    # a row of NaNs at the end for the rows without a group, at position -1
+    ratios = totals[list(value_cols)].div(totals[base_col], axis=0).to_numpy(
+            dtype=np.float64, na_value=np.nan)
+    ratios = np.vstack([ratios, np.full((1, len(value_cols)), np.nan)])
+
+    # the group of every row repeated once per lag, with the time moved back
+    n_rows = len(df)
+    time = pd.to_numeric(df[time_col]).to_numpy()
+    lagged_index = pd.MultiIndex.from_arrays(
+            [np.tile(df[col].to_numpy(), len(lags)) for col in keys] +
+            [np.concatenate([time - lag for lag in lags])],
+            names=index_cols)
+
+    positions = totals.index.get_indexer(lagged_index).reshape(len(lags), n_rows)
+
+    base = df[base_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    imputed = ratios[positions] * base[np.newaxis, :, np.newaxis]
+
+    age = pd.to_numeric(df[age_col]).to_numpy(dtype=np.float64, na_value=np.nan)
+    young = (age >= 1) & (age <= np.asarray(lags)[:, np.newaxis])
+
+    df_imputed = df.reset_index(drop=True)
+    for i, lag in enumerate(lags):
+        for j, name in enumerate(value_cols.values()):
+            col = name + '_' + str(lag)
+            if col in df_imputed.columns:
+                values = df_imputed[col].to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            else:
+                values = np.full(n_rows, np.nan)
+
+            values[young[i]] = imputed[i, young[i], j]
+            df_imputed[col] = values
+
+    return df_imputed
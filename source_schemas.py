@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:37:09 2026
+
+@author: epnzv
+"""
+
+import pandas as pd
+
+
+# the columns each raw source is read with, by the layout of the file. usecols
+# lists every column any reader of the layout uses, a column missing from a
+# file is skipped so the reader's own subset raises as it did before. the
+# categorical columns are text columns parsed as categories, so each distinct
+# name is only parsed once, and dtype holds the types the readers already cast
+# the columns to
+SOURCE_SCHEMAS = {
+    'abm_table': {
+        'usecols': ['Old Area ID', 'New Area ID'],
+        'categorical': [],
+        'dtype': {}},
+    'd1ms_sales': {
+        'usecols': ['MK_YR', 'EFFECTIVE_DATE', 'BRAND_FAMILY_DESCR', 'SPECIE_DESCR',
+                    'VARIETY_NAME', 'SLS_LVL_2_ID', 'SUM(NET_SALES_QTY_TO_DATE)',
+                    'SUM(ORDER_QTY_TO_DATE)', 'SUM(RETURN_QTY_TO_DATE)',
+                    'SUM(REPLANT_QTY_TO_DATE)'],
+        'categorical': ['BRAND_FAMILY_DESCR', 'SPECIE_DESCR', 'VARIETY_NAME'],
+        'dtype': {}},
+    'team_sales': {
+        'usecols': ['Team', 'VARIETY', 'CY Net Sales', 'Returns', 'Haulbacks', 'Replants',
+                    'Orders', 'Shipped'],
+        'categorical': ['VARIETY'],
+        'dtype': {}},
+    'scm_orders': {
+        'usecols': ['Team', 'VARIETY', 'Dealer/Gross Orders'],
+        'categorical': ['VARIETY'],
+        'dtype': {}},
+    'cf_forecasts': {
+        'usecols': ['FORECAST_YEAR', 'CROP_DESCR', 'BRAND_GROUP', 'ACRONYM_NAME', 'TEAM_KEY',
+                    'TEAM_Y1_FCST_1', 'TEAM_Y1_FCST_2', 'TEAM_FCST_QTY_9',
+                    'TEAM_FCST_QTY_10', 'TEAM_FCST_QTY_11', 'TEAM_FCST_QTY_12'],
+        'categorical': ['CROP_DESCR', 'BRAND_GROUP', 'ACRONYM_NAME'],
+        'dtype': {}},
+    'abm_fips_map': {
+        'usecols': ['year', 'fips', 'abm'],
+        'categorical': [],
+        'dtype': {}},
+    'county_locations': {
+        'usecols': ['fips', 'latitude', 'longitude'],
+        'categorical': [],
+        'dtype': {'latitude': 'float64', 'longitude': 'float64'}},
+    'usda_county': {
+        'usecols': ['Year', 'State ANSI', 'County ANSI', 'Value'],
+        'categorical': [],
+        'dtype': {}},
+    'srp_history': {
+        'usecols': ['VARIETY', 'SRP'],
+        'categorical': ['VARIETY'],
+        'dtype': {}},
+    'h2h': {
+        'usecols': ['state', 'county', 'c_brand', 'c_hybrid', 'c_trait', 'o_trait', 'c_yield',
+                    'o_yield'],
+        'categorical': [],
+        'dtype': {'c_hybrid': 'str', 'c_trait': 'str', 'o_trait': 'str'}},
+    'channel_sales': {
+        'usecols': ['SPECIE_DESCR', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE',
+                    'NET_SHIPPED_QTY_TO_DATE', 'ORDER_QTY_TO_DATE', 'REPLANT_QTY_TO_DATE',
+                    'RETURN_QTY_TO_DATE', 'SHIPPING_FIPS_CODE', 'VARIETY_NAME'],
+        'categorical': ['SPECIE_DESCR', 'VARIETY_NAME'],
+        'dtype': {'SHIPPING_FIPS_CODE': 'float64'}}
+}
+
+
+def source_usecols(source):
+    """Returns the usecols of a source as a callable, so a column the file
+    doesn't have is skipped rather than raising.
+
+    Keyword arguments:
+        source -- the name of the source in SOURCE_SCHEMAS
+    Returns:
+        usecols -- function telling read_csv whether to read a column
+    """
+    columns = set(SOURCE_SCHEMAS[source]['usecols'])
+
+    return columns.__contains__
+
+
+def source_dtypes(source):
+    """Returns the dtypes a source is parsed with, the categorical columns
+    included.
+
+    Keyword arguments:
+        source -- the name of the source in SOURCE_SCHEMAS
+    Returns:
+        dtype -- dict of column to dtype
+    """
+    schema = SOURCE_SCHEMAS[source]
+
+    dtype = dict(schema['dtype'])
+    dtype.update({col: 'category' for col in schema['categorical']})
+
+    return dtype
+
+
+def decode_categoricals(df, source):
+    """Turns the categorical columns of a source back into plain text columns,
+    as the readers fill, compare and merge them as such.
+
+    Keyword arguments:
+        df -- the dataframe read from the source
+        source -- the name of the source in SOURCE_SCHEMAS
+    Returns:
+        df -- the dataframe with text columns, changed in place
+    """
+    for col in SOURCE_SCHEMAS[source]['categorical']:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(df[col].cat.categories.dtype)
+
+    return df
+
+
+def read_source(source, path, **kwargs):
+    """Reads in a raw source csv with only the columns and types its schema
+    declares.
+
+    Keyword arguments:
+        source -- the name of the source in SOURCE_SCHEMAS
+        path -- the path of the csv
+        kwargs -- any other read_csv arguments, e.g. encoding
+    Returns:
+        df -- the dataframe of the source
+    """
+    df = pd.read_csv(path, usecols=source_usecols(source), dtype=source_dtypes(source),
+                     **kwargs)
+
+    return decode_categoricals(df, source)
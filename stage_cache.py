@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:41:26 2026
+
+@author: epnzv
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+
+import pandas as pd
+
+from aggregation_config import DATA_DIR, STAGE_CACHE_DIR, STAGE_CACHE_ENTRIES
+from sales_cache import is_partition_stale, read_manifest, write_manifest
+
+
+# name of the file in each stage entry recording how many frames it holds
+STAGE_INFO = '_stage.json'
+
+
+def list_input_files(input_paths):
+    """Expands a list of files and directories into the sorted list of files
+    they hold, so a stage can depend on a whole directory of inputs.
+
+    Keyword arguments:
+        input_paths -- list of file and directory paths
+    Returns:
+        input_files -- sorted list of file paths
+    """
+    input_files = []
+    for path in input_paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                input_files += [os.path.join(root, file) for file in files]
+        else:
+            input_files.append(path)
+
+    return sorted(set(input_files))
+
+
+def hash_input_files(input_paths, stage_dir):
+    """Hashes the contents of a stage's input files. The sha1 of each file is
+    kept in the stage's own manifest with its mtime and size, so a file is
+    only read again once it has been touched. Every stage has a manifest of
+    its own as stages run at the same time in separate processes, and a
+    shared one would lose the entries of all but the last to write it.
+
+    Keyword arguments:
+        input_paths -- list of file and directory paths the stage reads
+        stage_dir -- the directory of the stage's entries
+    Returns:
+        digest -- the sha1 hex digest over the paths and contents of the files
+    """
+    manifest = read_manifest(stage_dir)
+
+    sha = hashlib.sha1()
+    updated = False
+    for path in list_input_files(input_paths):
+        stale, entry = is_partition_stale(path, manifest.get(path))
+        if manifest.get(path) != entry:
+            manifest[path] = entry
+            updated = True
+
+        sha.update((path + ':' + entry['sha1'] + '\n').encode())
+
+    if updated:
+        write_manifest(stage_dir, manifest)
+
+    return sha.hexdigest()
+
+
+def hash_value(value):
+    """Hashes a stage argument or config value. Dataframes are hashed on their
+    contents, anything else on its json representation.
+
+    Keyword arguments:
+        value -- the value to hash
+    Returns:
+        digest -- the sha1 hex digest of the value
+    """
+    sha = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        sha.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        if isinstance(value, pd.DataFrame):
+            sha.update(json.dumps([str(col) for col in value.columns]).encode())
+            sha.update(json.dumps([str(dtype) for dtype in value.dtypes]).encode())
+    else:
+        sha.update(json.dumps(value, sort_keys=True, default=str).encode())
+
+    return sha.hexdigest()
+
+
+def code_version(code):
+    """Hashes the source of the functions and modules a stage runs, so editing
+    any of them invalidates its cached result.
+
+    Keyword arguments:
+        code -- list of functions and modules
+    Returns:
+        digest -- the sha1 hex digest of their source
+    """
+    sha = hashlib.sha1()
+    for obj in code:
+        sha.update(inspect.getsource(obj).encode())
+
+    return sha.hexdigest()
+
+
+def stage_key(name, producer, args, kwargs, input_files, config_values, code, stage_dir):
+    """Builds the key a stage's result is stored under, from everything that
+    can change it.
+
+    Keyword arguments:
+        name -- the name of the stage
+        producer -- the function that produces the stage's frames
+        args -- list of the positional arguments of the producer
+        kwargs -- dict of the keyword arguments of the producer
+        input_files -- list of file and directory paths the stage reads
+        config_values -- dict of the aggregation_config values the stage uses
+        code -- list of the other functions and modules the producer runs
+        stage_dir -- the directory of the stage's entries
+    Returns:
+        key -- the sha1 hex digest identifying the result
+    """
+    parts = {'name': name,
+             'inputs': hash_input_files(input_files, stage_dir),
+             'config': hash_value(config_values),
+             'code': code_version([producer] + list(code)),
+             'args': [hash_value(arg) for arg in args],
+             'kwargs': {kw: hash_value(arg) for kw, arg in kwargs.items()}}
+
+    key = hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    return key
+
+
+def read_stage(entry_dir):
+    """Reads a stored stage result back in.
+
+    Keyword arguments:
+        entry_dir -- the directory holding the stage's frames
+    Returns:
+        result -- the frame, or tuple of frames, the producer returned
+    """
+    with open(os.path.join(entry_dir, STAGE_INFO)) as f:
+        info = json.load(f)
+
+    frames = [pd.read_parquet(os.path.join(entry_dir, 'frame_' + str(i) + '.parquet'))
+              for i in range(info['n_frames'])]
+
+    if info['is_tuple']:
+        return tuple(frames)
+
+    return frames[0]
+
+
+def evict_stage_entries(stage_dir, max_entries):
+    """Removes the least recently used entries of a stage until only
+    max_entries are left. Temporary directories of writes in progress and the
+    stage's manifest are left alone.
+
+    Keyword arguments:
+        stage_dir -- the directory of the stage's entries
+        max_entries -- the number of entries to keep
+    Returns:
+        None
+    """
+    entries = [entry for entry in os.listdir(stage_dir)
+               if os.path.isdir(os.path.join(stage_dir, entry)) and not entry.endswith('.tmp')]
+    entries.sort(key=lambda entry: os.path.getmtime(os.path.join(stage_dir, entry)))
+
+    for old_entry in entries[:max(len(entries) - max_entries, 0)]:
+        shutil.rmtree(os.path.join(stage_dir, old_entry), ignore_errors=True)
+
+
+def write_stage(stage_dir, key, result, max_entries=STAGE_CACHE_ENTRIES):
+    """Stores a stage result as parquet under its key, keeping the entries of
+    the max_entries - 1 most recently used other keys, so pipelines that run
+    the same stage on different inputs can take turns without recomputing.
+    Results are written to a temporary directory first so a failed write never
+    leaves a partial entry behind.
+
+    Keyword arguments:
+        stage_dir -- the directory of the stage's entries
+        key -- the key of the result
+        result -- the frame, or tuple of frames, the producer returned
+        max_entries -- the number of entries of the stage to keep
+    Returns:
+        written -- True if the result could be stored
+    """
+    is_tuple = isinstance(result, tuple)
+    frames = list(result) if is_tuple else [result]
+
+    tmp_dir = os.path.join(stage_dir, key + '.tmp')
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    try:
+        for i, frame in enumerate(frames):
+            frame.to_parquet(os.path.join(tmp_dir, 'frame_' + str(i) + '.parquet'))
+    except (ValueError, TypeError, NotImplementedError) as e:
+        # e.g. a column mixing str and float, the stage just isn't cached
+        print("Could not cache ", os.path.basename(stage_dir), ": ", e)
+        shutil.rmtree(tmp_dir)
+        return False
+
+    with open(os.path.join(tmp_dir, STAGE_INFO), 'w') as f:
+        json.dump({'n_frames': len(frames), 'is_tuple': is_tuple}, f)
+
+    # another process may have stored the same result in the meantime
+    entry_dir = os.path.join(stage_dir, key)
+    if os.path.exists(entry_dir):
+        shutil.rmtree(tmp_dir)
+        return True
+
+    evict_stage_entries(stage_dir, max_entries - 1)
+
+    os.replace(tmp_dir, entry_dir)
+
+    return True
+
+
+def cached_stage(name, producer, args=(), kwargs=None, input_files=(),
+                 config_values=None, code=(), cache_dir=None):
+    """Runs a stage of the pipeline, or reads its result back in if nothing it
+    depends on has changed since it was last run. The result is keyed by the
+    contents of the stage's input files, the config values it uses, the source
+    of its code and the values of its arguments.
+
+    Keyword arguments:
+        name -- the name of the stage, used as its directory in the cache
+        producer -- the function that produces the stage's frames
+        args -- list of the positional arguments of the producer
+        kwargs -- dict of the keyword arguments of the producer
+        input_files -- list of file and directory paths the stage reads
+        config_values -- dict of the aggregation_config values the stage uses
+        code -- list of the other functions and modules the producer runs
+        cache_dir -- the root directory of the stage cache
+    Returns:
+        result -- the frame, or tuple of frames, the producer returns
+    """
+    if kwargs is None:
+        kwargs = {}
+    if config_values is None:
+        config_values = {}
+    if cache_dir is None:
+        cache_dir = DATA_DIR + STAGE_CACHE_DIR
+
+    stage_dir = os.path.join(cache_dir, name)
+    os.makedirs(stage_dir, exist_ok=True)
+
+    key = stage_key(name, producer, args, kwargs, input_files, config_values, code,
+                    stage_dir)
+
+    entry_dir = os.path.join(stage_dir, key)
+    if os.path.exists(entry_dir):
+        print("Reusing cached ", name, " stage")
+
+        # mark the entry as recently used so it is the last to be evicted
+        os.utime(entry_dir)
+
+        return read_stage(entry_dir)
+
+    print("Running ", name, " stage")
+    result = producer(*args, **kwargs)
+    write_stage(stage_dir, key, result)
+
+    return result
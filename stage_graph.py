@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:22:05 2026
+
+@author: epnzv
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import time
+
+from aggregation_config import STAGE_GRAPH_WORKERS
+
+
+def check_stage_graph(stages, available=()):
+    """Checks that a stage graph can be run: every output is produced by a
+    single stage, every input is produced by some stage (or already
+    available) and there are no cycles.
+
+    Keyword arguments:
+        stages -- list of stage dicts, each with a name, the function to run,
+            the names of its inputs and the names of its outputs
+        available -- names of the frames that are given before any stage runs
+    Returns:
+        order -- list of the stage names in an order they can be run in
+    """
+    producers = {}
+    for stage in stages:
+        for output in stage['outputs']:
+            if output in producers or output in available:
+                raise ValueError('Frame ' + output + ' is produced by more than one stage')
+            producers[output] = stage['name']
+
+    for stage in stages:
+        for frame in stage['inputs']:
+            if frame not in producers and frame not in available:
+                raise ValueError('Stage ' + stage['name'] + ' needs ' + frame +
+                                 ', which no stage produces')
+
+    order = []
+    done = set(available)
+    remaining = list(stages)
+    while len(remaining) > 0:
+        ready = [stage for stage in remaining
+                 if all(frame in done for frame in stage['inputs'])]
+        if len(ready) == 0:
+            raise ValueError('Stages ' + ', '.join(stage['name'] for stage in remaining) +
+                             ' depend on each other')
+
+        for stage in ready:
+            order.append(stage['name'])
+            done.update(stage['outputs'])
+        remaining = [stage for stage in remaining if stage not in ready]
+
+    return order
+
+
+def store_outputs(stage, result, frames):
+    """Stores what a stage returned under the names of its outputs.
+
+    Keyword arguments:
+        stage -- the stage dict
+        result -- what the stage's function returned, a tuple when the stage
+            has more than one output
+        frames -- dict of the frames produced so far, updated in place
+    Returns:
+        None
+    """
+    if len(stage['outputs']) == 1:
+        result = (result,)
+
+    if len(result) != len(stage['outputs']):
+        raise ValueError('Stage ' + stage['name'] + ' returned ' + str(len(result)) +
+                         ' frames, expected ' + str(len(stage['outputs'])))
+
+    frames.update(zip(stage['outputs'], result))
+
+
+def run_stage_graph(stages, max_workers=STAGE_GRAPH_WORKERS, frames=None):
+    """Runs a graph of stages, each as soon as all of its inputs are ready.
+    Stages that don't depend on each other run at the same time in separate
+    processes, so the wall time is that of the longest chain of stages rather
+    than the sum of all of them. The functions have to be defined at module
+    level so they can be sent to the worker processes. Every running stage
+    holds its intermediate frames, so the peak memory grows with the number
+    of workers, which is kept small by default.
+
+    Keyword arguments:
+        stages -- list of stage dicts, each with a name, the function to run,
+            the names of its inputs and the names of its outputs
+        max_workers -- the number of worker processes, None for one per core,
+            0 to run the stages one after another in this process
+        frames -- dict of frames given before any stage runs
+    Returns:
+        frames -- dict of every frame, given or produced, by name
+    """
+    frames = dict(frames or {})
+    order = check_stage_graph(stages, available=frames.keys())
+    stages_by_name = {stage['name']: stage for stage in stages}
+
+    if max_workers == 0:
+        for name in order:
+            stage = stages_by_name[name]
+            start = time.time()
+            result = stage['function'](*[frames[frame] for frame in stage['inputs']])
+            store_outputs(stage, result, frames)
+            print("Stage ", name, " done in ", str(round(time.time() - start, 1)), "s")
+
+        return frames
+
+    pending = [stages_by_name[name] for name in order]
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(pending) > 0 or len(running) > 0:
+            # start every stage whose inputs are all ready
+            ready = [stage for stage in pending
+                     if all(frame in frames for frame in stage['inputs'])]
+            for stage in ready:
+                future = executor.submit(stage['function'],
+                                         *[frames[frame] for frame in stage['inputs']])
+                running[future] = (stage, time.time())
+                pending.remove(stage)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, start = running.pop(future)
+                store_outputs(stage, future.result(), frames)
+                print("Stage ", stage['name'], " done in ",
+                      str(round(time.time() - start, 1)), "s")
+
+    return frames
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 15 09:27:44 2026
+
+@author: epnzv
+"""
+
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from aggregation_config import(BLIZZARD_DIR, WEATHER_FEATURES, WEATHER_FIPS_TOLERANCE,
+                               WEATHER_READ_WORKERS)
+from yearly_reader import map_years
+
+
+# number of decimals the latitude and longitude are matched on
+LOCATION_DECIMALS = 2
+
+
+def quantize_locations(latitude, longitude, decimals=LOCATION_DECIMALS):
+    """Rounds latitude and longitude the same way .round(decimals) does and
+    packs each pair into a single int64 key.
+
+    Keyword arguments:
+        latitude -- array of latitudes
+        longitude -- array of longitudes
+        decimals -- the number of decimals to round to
+    Returns:
+        keys -- array of int64 keys, one per location
+    """
+    scale = 10 ** decimals
+
+    lat_q = np.rint(np.asarray(latitude, dtype=float) * scale).astype(np.int64)
+    lon_q = np.rint(np.asarray(longitude, dtype=float) * scale).astype(np.int64)
+
+    # shift both to be non-negative and put longitude in the low digits
+    keys = (lat_q + 90 * scale) * (360 * scale + 1) + (lon_q + 180 * scale)
+
+    return keys
+
+
+def build_location_lookup(df_county_locations, decimals=LOCATION_DECIMALS):
+    """Builds the sorted integer keyed lookup from location to fips, so each
+    weather year can be mapped with a searchsorted and a take instead of a
+    merge on float columns.
+
+    Keyword arguments:
+        df_county_locations -- the dataframe with fips, latitude, longtitude
+        decimals -- the number of decimals locations are matched on
+    Returns:
+        location_lookup -- dict with the sorted keys, the fips for each key and
+            the rounded coordinates of each key for nearest matching
+    """
+    County_Locations = df_county_locations.dropna(
+            subset=['fips', 'latitude', 'longitude']).reset_index(drop=True)
+
+    keys = quantize_locations(County_Locations['latitude'].values,
+                              County_Locations['longitude'].values,
+                              decimals=decimals)
+
+    # a location listed twice keeps its first fips
+    keys, first = np.unique(keys, return_index=True)
+
+    location_lookup = {'keys': keys,
+                       'fips': County_Locations['fips'].values[first].astype(np.int64),
+                       'latitude': County_Locations['latitude'].values[first].round(decimals),
+                       'longitude': County_Locations['longitude'].values[first].round(decimals),
+                       'decimals': decimals}
+
+    return location_lookup
+
+
+def nearest_location(latitude, longitude, location_lookup, tolerance, chunk_size=2048):
+    """Finds the closest county location for each point, brute force over the
+    county centroids. Only used for the few distinct grid points that don't
+    match a county location exactly.
+
+    Keyword arguments:
+        latitude -- array of latitudes
+        longitude -- array of longitudes
+        location_lookup -- the lookup from build_location_lookup
+        tolerance -- the largest distance, in degrees, to accept a match at
+        chunk_size -- the number of points to compare at a time
+    Returns:
+        positions -- array of positions in the lookup, -1 where nothing is
+            within the tolerance
+    """
+    positions = np.full(len(latitude), -1, dtype=np.int64)
+
+    for start in range(0, len(latitude), chunk_size):
+        lat = latitude[start:start + chunk_size, None]
+        lon = longitude[start:start + chunk_size, None]
+
+        distance = np.hypot(lat - location_lookup['latitude'][None, :],
+                            lon - location_lookup['longitude'][None, :])
+
+        closest = distance.argmin(axis=1)
+        within = distance[np.arange(len(closest)), closest] <= tolerance
+
+        positions[start:start + chunk_size] = np.where(within, closest, -1)
+
+    return positions
+
+
+def map_locations_to_fips(latitude, longitude, location_lookup,
+                          tolerance=WEATHER_FIPS_TOLERANCE):
+    """Maps weather grid locations to fips. Locations that match a county
+    location once rounded get its fips, the rest get the fips of the closest
+    county location within the tolerance, or NaN.
+
+    Keyword arguments:
+        latitude -- array of latitudes
+        longitude -- array of longitudes
+        location_lookup -- the lookup from build_location_lookup
+        tolerance -- the largest distance, in degrees, for a nearest match,
+            0 to only use exact matches
+    Returns:
+        fips -- float array of the fips of each location, NaN if unmatched
+    """
+    lookup_keys = location_lookup['keys']
+
+    keys = quantize_locations(latitude, longitude,
+                              decimals=location_lookup['decimals'])
+
+    positions = np.searchsorted(lookup_keys, keys)
+    positions = np.minimum(positions, len(lookup_keys) - 1)
+    matched = lookup_keys[positions] == keys
+    positions = np.where(matched, positions, -1)
+
+    if tolerance > 0 and not matched.all():
+        # only look up each distinct unmatched grid point once
+        unmatched_keys, inverse = np.unique(keys[~matched], return_inverse=True)
+        first = np.unique(inverse, return_index=True)[1]
+
+        scale = 10 ** location_lookup['decimals']
+        unmatched_lat = np.rint(np.asarray(latitude, dtype=float)[~matched][first] * scale) / scale
+        unmatched_lon = np.rint(np.asarray(longitude, dtype=float)[~matched][first] * scale) / scale
+
+        nearest = nearest_location(unmatched_lat, unmatched_lon, location_lookup,
+                                   tolerance=tolerance)
+        positions[~matched] = nearest[inverse]
+
+        print("Matched ", str((nearest >= 0).sum()), " of ", str(len(unmatched_keys)),
+              " unmatched weather locations to the nearest county")
+
+    fips = np.where(positions >= 0,
+                    location_lookup['fips'][np.maximum(positions, 0)],
+                    np.nan)
+
+    return fips
+
+
+def add_weather_abm(df_weather, location_lookup, df_fips):
+    """Adds the fips and abm to the Blizzard data.
+
+    Keyword arguments:
+        df_weather -- the dataframe of the Blizzard data
+        location_lookup -- the lookup from build_location_lookup
+        df_fips -- the dataframe with fips, abm, year
+    Returns:
+        Weather -- the Blizzard data with the abm, without the latitude,
+            longitude and fips
+    """
+    Weather = df_weather.copy()
+
+    Weather['fips'] = map_locations_to_fips(Weather['latitude'].values,
+                                            Weather['longitude'].values,
+                                            location_lookup)
+
+    # locations without a fips can't be given an abm
+    Weather = Weather[Weather['fips'].isna() == False].reset_index(drop=True)
+    Weather['fips'] = Weather['fips'].astype(np.int64)
+
+    # merge Weather with FIPS_abm to add the abm feature
+    Weather = Weather.merge(df_fips, on=['fips', 'year'])
+
+    # Drop latitude, longitude, fips
+    Weather = Weather.drop(columns=['latitude', 'longitude', 'fips'])
+
+    return Weather
+
+
+def read_weather_year_monthly(year, location_lookup, df_fips, blizzard_dir=BLIZZARD_DIR):
+    """Reads in a year of the Blizzard data, adds the abm and reduces it to the
+    sums and counts by year, month and abm.
+
+    Keyword arguments:
+        year -- the year to read
+        location_lookup -- the lookup from build_location_lookup
+        df_fips -- the dataframe with fips, abm, year
+        blizzard_dir -- the directory holding the Blizzard_<year>.csv files
+    Returns:
+        weather_sums -- the sums of the weather features by year, month and abm
+        weather_counts -- the number of grid rows by year, month and abm
+    """
+    print("Read ", str(year), " Weather Data")
+    dfi_path = blizzard_dir + 'Blizzard_' + str(year) + '.csv'
+    dfi = pd.read_csv(dfi_path)
+
+    # set year as str
+    dfi['year'] = dfi['year'].astype(str)
+
+    dfi = add_weather_abm(dfi, location_lookup, df_fips)
+
+    # Drop missing value
+    print("Check the fraction of missing value: ", dfi.isna().sum()/dfi.shape[0])
+    dfi = dfi.dropna().reset_index(drop=True)
+
+    # keep only the small monthly abm aggregate of the year
+    dfi_grouped = dfi.groupby(by=['year', 'month', 'abm'])
+
+    return dfi_grouped.sum(numeric_only=True), dfi_grouped.size()
+
+
+def read_weather_abm_monthly(years, df_county_locations, df_fips,
+                             blizzard_dir=BLIZZARD_DIR, max_workers=WEATHER_READ_WORKERS):
+    """Reads in the Blizzard data a year at a time, adds the abm and reduces
+    each year to the sums and counts by year, month and abm as soon as it is
+    read, so only max_workers years of grid data are in memory at once, one by
+    default.
+
+    Keyword arguments:
+        years -- the years we want to read the data for
+        df_county_locations -- the dataframe with fips, latitude, longtitude
+        df_fips -- the dataframe with fips, abm, year
+        blizzard_dir -- the directory holding the Blizzard_<year>.csv files
+        max_workers -- the number of years read at the same time
+    Returns:
+        Weather -- the dataframe of the monthly blizzard means by abm
+    """
+    location_lookup = build_location_lookup(df_county_locations)
+
+    read_year = partial(read_weather_year_monthly, location_lookup=location_lookup,
+                        df_fips=df_fips, blizzard_dir=blizzard_dir)
+    yearly = map_years(read_year, years, max_workers=max_workers)
+
+    # the sums and counts combine across years into the exact means
+    weather_sums = pd.concat([sums for sums, counts in yearly]).groupby(
+            level=['year', 'month', 'abm']).sum()
+    weather_counts = pd.concat([counts for sums, counts in yearly]).groupby(
+            level=['year', 'month', 'abm']).sum()
+
+    Weather = weather_sums.div(weather_counts, axis=0).reset_index()
+
+    return Weather
+
+
+def flatten_monthly_weather(df_weather, weather_features=WEATHER_FEATURES):
+    """Flattens the weather dataframe in such a way that each month in a year
+    gets a column. The number of rows will be the number of years and abms, and
+    the number of columns the number of months * the number of weather features
+    + 2 for the year and abm. The data inside is the weather data itself. The
+    months are unstacked in one reshape, so any number of features and months
+    costs the same.
+
+    Keyword arguments:
+        df_weather -- the unflattened dataframe with the weather data
+        weather_features -- list of the weather features to flatten
+    Returns:
+        weather_flattened -- the data flattened as detailed above, with a
+            <feature>_<month> column for each feature and month
+    """
+    # get the month range, in the order the months come in
+    weather_month = df_weather['month'].unique().tolist()
+
+    weather_flattened = df_weather.set_index(['year', 'abm', 'month'])[
+            weather_features].unstack('month')
+
+    # order the columns by month, then feature
+    flattened_columns = [(feature, month) for month in weather_month
+                         for feature in weather_features]
+    weather_flattened = weather_flattened.reindex(
+            columns=pd.MultiIndex.from_tuples(flattened_columns))
+    weather_flattened.columns = [feature + '_' + str(month)
+                                 for feature, month in weather_flattened.columns]
+
+    weather_flattened = weather_flattened.reset_index()
+
+    return weather_flattened
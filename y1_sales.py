@@ -10,6 +10,9 @@ import datetime as dt
 import pandas as pd
 from aggregation_config import(ABM_TABLE, DAILY_FRACTIONS, DATA_DIR, ORDER_DATE,
                                SALES_2021, SALES_2022, SALES_DIR)
+from cumulative_sales import create_monthly_order_features
+from sales_cache import read_sales_years
+from sales_lags import create_lag_features
 
 
 def read_abm_teamkey_file():
@@ -62,28 +65,12 @@ def create_lagged_sales(df):
     #sales_with_lag = sqldf(current_year_q + last_year_q + two_years_q + 
     #                       join_last_year + join_two_years)
     
-    sales_all_lag_1 = sales_all.copy()[['year', 'abm', 'hybrid', 'orders_to_date']]
-    sales_all_lag_2 = sales_all.copy()[['year', 'abm', 'hybrid', 'orders_to_date']]
-    sales_all_lag_3 = sales_all.copy()[['year', 'abm', 'hybrid', 'orders_to_date']]
-    
-    # adjust years
-    sales_all_lag_1['year'] = sales_all_lag_1['year'] + 1
-    sales_all_lag_2['year'] = sales_all_lag_2['year'] + 2
-    sales_all_lag_3['year'] = sales_all_lag_3['year'] + 3
-    
-    sales_all_lag_1 = sales_all_lag_1[
-            ['year', 'hybrid', 'abm', 'orders_to_date']].rename(
-            columns={'orders_to_date': 'order_Q_1'})
-    sales_all_lag_2 = sales_all_lag_2[
-            ['year', 'hybrid', 'abm', 'orders_to_date']].rename(
-            columns={'orders_to_date': 'order_Q_2'})
-    sales_all_lag_3 = sales_all_lag_3[
-            ['year', 'hybrid', 'abm', 'orders_to_date']].rename(
-            columns={'orders_to_date': 'order_Q_3'})
-    
-    sales_with_lag = sales_all.merge(sales_all_lag_1, on=['year', 'hybrid', 'abm'], how='left')
-    sales_with_lag = sales_with_lag.merge(sales_all_lag_2, on=['year', 'hybrid', 'abm'], how='left')
-    sales_with_lag = sales_with_lag.merge(sales_all_lag_3, on=['year', 'hybrid', 'abm'], how='left')
+    # look up each product's orders to date in the ABM up to three years before
+    sales_with_lag = create_lag_features(df=sales_all,
+                                         keys=['hybrid', 'abm'],
+                                         time_col='year',
+                                         value_cols={'orders_to_date': 'order_Q'},
+                                         lags=[1, 2, 3])
     
     for col in sales_with_lag.columns:
         print(col)
@@ -118,39 +105,13 @@ def create_monthly_sales(Sale_2012_2020_lagged, clean_Sale):
     """
     print('Creating monthly features...')
 
-    clean_Sale = clean_Sale[['EFFECTIVE_DATE', 'year', 'abm', 'Variety_Name', 'order_Q']]
-    
-    dfs_monthly_netsales = []
     years = ['2012', '2013', '2014', '2015', '2016', '2017', '2018', '2019', '2020']
-    for year in years:
-        print('year', year)
-        df_year = clean_Sale[clean_Sale['year'] == year].reset_index(drop = True)
-        
-        df_monthly_total = pd.DataFrame()
-        
-        df_single_year = Sale_2012_2020_lagged[Sale_2012_2020_lagged['year'] == year].copy().reset_index(drop = True)
-        
-        df_monthly_total['year'] = df_single_year['year'].tolist()
-        df_monthly_total['Variety_Name'] = df_single_year['Variety_Name'].tolist()
-        df_monthly_total['abm'] = df_single_year['abm'].tolist()
-        
-        orders_to_date_mask = dt.datetime(year=int(year),
-                                          month=ORDER_DATE['month'],
-                                          day=ORDER_DATE['day'])
-        
-        # grab the orders to date
-        df_to_date = df_year[
-                df_year['EFFECTIVE_DATE'] <= orders_to_date_mask].copy().reset_index(drop=True)
-        
-        df_to_date = df_to_date.groupby(by=['year', 'Variety_Name', 'abm'],
-                                        as_index=False).sum().reset_index(drop=True)
-        
-        df_to_date = df_to_date.rename(columns={'order_Q': 'orders_to_date'})
-                
-        dfs_monthly_netsales.append(df_to_date)
-     
-    Sales_monthly = pd.concat(dfs_monthly_netsales).reset_index(drop = True)    
-    Sales_monthly = Sales_monthly.fillna(0)
+    
+    # only the orders to date are used, the monthly columns are skipped
+    Sales_monthly = create_monthly_order_features(df_keys=Sale_2012_2020_lagged,
+                                                  clean_Sale=clean_Sale,
+                                                  years=years,
+                                                  monthly=False)
     
     Sale_all = Sale_2012_2020_lagged.merge(Sales_monthly, on = ['year', 'Variety_Name', 'abm'], how = 'left')
     
@@ -446,36 +407,27 @@ def read_sales_filepath():
     # preprocess sales 2020 sales data to get consistent abm data  
     #Preprocess_2020_sale()
 
-    # define a list to store all sales data 
-    dfs_path = []
-    
-    # read in the data by year 
-    for year in range(2018, 2021):
-        print("Read ", str(year), " Sales Data")
-        dfi_path = DATA_DIR + SALES_DIR + str(year) + '.csv'
-        dfi = pd.read_csv(dfi_path)
-        
-        dfi = dfi[dfi['SPECIE_DESCR'] == 'SOYBEAN'].reset_index(drop=True)
-        
-        # set a year parameter to be the year 
-        dfi['year'] = year
-        
-        # convert the effective date to a datetime format in order to set the mask 
-        dfi['EFFECTIVE_DATE'] = pd.to_datetime(dfi['EFFECTIVE_DATE'])
-        
-        # set 2020 abms to old format
-        if year == 2020:
-            dfi = dfi.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
-            dfi = dfi.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
-            dfi = dfi.rename(columns = {'abm':'SLS_LVL_2_ID'})
-            dfi = dfi.drop(columns=['TEAM_KEY'])
-
-        
-        # add modified dataframe to the list 
-        dfs_path.append(dfi)
-      
-    # concate all dataframes  
-    Sale_2012_2020 = pd.concat(dfs_path).reset_index(drop=True)
+    # read in the soybean data by year from the parquet cache, which only
+    # re-parses a year's csv when it has changed
+    SALES_COLUMNS = ['SPECIE_DESCR', 'BRAND_FAMILY_DESCR', 'SLS_LVL_2_ID',
+                     'VARIETY_NAME', 'EFFECTIVE_DATE', 'NET_SALES_QTY_TO_DATE',
+                     'ORDER_QTY_TO_DATE', 'RETURN_QTY_TO_DATE',
+                     'REPLANT_QTY_TO_DATE']
+    
+    Sale_2012_2020 = read_sales_years(years=range(2018, 2021),
+                                      species=['SOYBEAN'],
+                                      brand_families=['NATIONAL'],
+                                      columns=SALES_COLUMNS)
+    
+    # set 2020 abms to old format
+    Sale_2020 = Sale_2012_2020[Sale_2012_2020['year'] == 2020]
+    Sale_2020 = Sale_2020.rename(columns = {'SLS_LVL_2_ID':"TEAM_KEY"})
+    Sale_2020 = Sale_2020.merge(abm_Teamkey, how = 'left', on = ['TEAM_KEY'])
+    Sale_2020 = Sale_2020.rename(columns = {'abm':'SLS_LVL_2_ID'})
+    Sale_2020 = Sale_2020.drop(columns=['TEAM_KEY'])
+    
+    Sale_2012_2020 = pd.concat([Sale_2012_2020[Sale_2012_2020['year'] != 2020],
+                                Sale_2020]).reset_index(drop=True)
     
     # rename the columns 
     SALES_COLUMN_NAMES = {'year': 'year', 'SPECIE_DESCR': 'crop',
@@ -487,33 +439,15 @@ def read_sales_filepath():
     
     Sale_2012_2020 = Sale_2012_2020.rename(columns = SALES_COLUMN_NAMES)
     
-    # select the soybean crop 
-    Sale_2012_2020 = Sale_2012_2020[
-            Sale_2012_2020['BRAND_FAMILY_DESCR'] == 'NATIONAL'].reset_index(drop=True)
-    
     # set year as str
     Sale_2012_2020['year'] = Sale_2012_2020['year'].astype(str)
     
     # create a clean sales data for monthly calculation
     df_clean_sale = Sale_2012_2020.copy()
     
-    # drop unnecessary columns
-    SALES_COLUMNS_TO_DROP_Monthly = ['BRAND_FAMILY_DESCR', 
-                                     'DEALER_ACCOUNT_CY_BRAND_FAMILY',
-                                     'SHIPPING_STATE_CODE', 'SHIPPING_COUNTY',
-                                     'SHIPPING_FIPS_CODE', 'SLS_LVL_1_ID', 'CUST_ID',
-                                     'ACCT_ID', 'NET_SHIPPED_QTY_TO_DATE']
-    
-    df_clean_sale = df_clean_sale.drop(columns = SALES_COLUMNS_TO_DROP_Monthly)
-    
-    # drop unnecessary columns for yearly sales
-    SALES_COLUMNS_TO_DROP_Yearly = ['BRAND_FAMILY_DESCR', 'EFFECTIVE_DATE',
-                                    'DEALER_ACCOUNT_CY_BRAND_FAMILY',
-                                    'SHIPPING_STATE_CODE', 'SHIPPING_COUNTY',
-                                    'SHIPPING_FIPS_CODE', 'SLS_LVL_1_ID', 'CUST_ID',
-                                    'ACCT_ID', 'NET_SHIPPED_QTY_TO_DATE']
-    
-    Sale_2012_2020 = Sale_2012_2020.drop(columns=SALES_COLUMNS_TO_DROP_Yearly)
+    # keep the columns needed for the monthly calculation
+    df_clean_sale = df_clean_sale[['EFFECTIVE_DATE', 'year', 'crop', 'abm', 'Variety_Name',
+                                   'nets_Q', 'order_Q', 'return_Q', 'replant_Q']]
     
     # reorder the columns
     Sale_2012_2020 = Sale_2012_2020[['year', 'abm', 'Variety_Name', 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:48:31 2026
+
+@author: epnzv
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from source_schemas import SOURCE_SCHEMAS, decode_categoricals, source_dtypes
+
+
+# the default number of files read at the same time, which also bounds how many
+# years of raw data are in memory at once
+YEARLY_READ_WORKERS = 4
+
+
+def map_years(function, years, max_workers=YEARLY_READ_WORKERS, use_processes=False):
+    """Calls a function on each year in a pool of threads, or processes, and
+    returns the results in the order of the years.
+
+    Keyword arguments:
+        function -- the function to call with each year, defined at module
+            level (or a partial of one) when use_processes is True
+        years -- the years to call it for
+        max_workers -- the number of years handled at the same time, 1 to
+            handle them one after another in this thread
+        use_processes -- whether to use processes rather than threads
+    Returns:
+        results -- list of what the function returned for each year
+    """
+    years = list(years)
+
+    if max_workers == 1 or len(years) <= 1:
+        return [function(year) for year in years]
+
+    pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool(max_workers=min(max_workers, len(years))) as executor:
+        results = list(executor.map(function, years))
+
+    return results
+
+
+def filter_rows(df, filters):
+    """Keeps the rows of a dataframe whose columns hold the values asked for.
+
+    Keyword arguments:
+        df -- the dataframe to filter
+        filters -- dict of column to the value, or list of values, to keep
+    Returns:
+        df -- the dataframe of the rows that are kept
+    """
+    for col, values in filters.items():
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        df = df[df[col].isin(values)]
+
+    return df
+
+
+def read_year_file(year, path_template, source=None, year_offset=0, usecols=None,
+                   dtype=None, filters=None, date_columns=None):
+    """Reads in one year's csv, keeping only the rows and columns asked for.
+
+    Keyword arguments:
+        year -- the year of the file
+        path_template -- the path of the files, with {year} where the year goes
+        source -- the name of the files' schema in SOURCE_SCHEMAS, which gives
+            the default usecols and the dtypes
+        year_offset -- added to the file's year to give the year column, e.g. 1
+            for the H2H data which is used for the next season
+        usecols -- list of columns to read, None for all
+        dtype -- dict of column types to read the columns as
+        filters -- dict of column to the value, or list of values, to keep
+        date_columns -- list of columns to convert to datetimes
+    Returns:
+        dfi -- the dataframe of the year's data with a year column
+    """
+    if filters is None:
+        filters = {}
+
+    if source is not None:
+        if usecols is None:
+            usecols = SOURCE_SCHEMAS[source]['usecols']
+        dtype = dict(source_dtypes(source), **(dtype or {}))
+
+    # the filter columns have to be read even when they aren't kept
+    read_cols = None
+    if usecols is not None:
+        read_cols = list(usecols) + [col for col in filters if col not in usecols]
+
+    dfi_path = path_template.format(year=year)
+    print("Read ", dfi_path)
+    dfi = pd.read_csv(dfi_path, usecols=read_cols, dtype=dtype)
+
+    dfi = filter_rows(dfi, filters)
+
+    if usecols is not None:
+        dfi = dfi[[col for col in dfi.columns if col in usecols]]
+
+    dfi = dfi.reset_index(drop=True)
+
+    if source is not None:
+        dfi = decode_categoricals(dfi, source)
+
+    for col in date_columns or []:
+        dfi[col] = pd.to_datetime(dfi[col])
+
+    # set a year parameter to be the year
+    dfi['year'] = year + year_offset
+
+    return dfi
+
+
+def read_yearly_csvs(path_template, years, source=None, year_offset=0, usecols=None,
+                     dtype=None, filters=None, date_columns=None,
+                     max_workers=YEARLY_READ_WORKERS, use_processes=False):
+    """Reads in a yearly series of csvs, several files at a time, and
+    concatenates them into a single dataframe with a year column. The column
+    selection and types are pushed down into read_csv and the row filters are
+    applied to each file as soon as it is read, so only the rows that are kept
+    are ever concatenated.
+
+    Keyword arguments:
+        path_template -- the path of the files, with {year} where the year goes
+        years -- the years to read
+        source -- the name of the files' schema in SOURCE_SCHEMAS, which gives
+            the default usecols and the dtypes
+        year_offset -- added to each file's year to give the year column
+        usecols -- list of columns to read, None for all
+        dtype -- dict of column types to read the columns as
+        filters -- dict of column to the value, or list of values, to keep
+        date_columns -- list of columns to convert to datetimes
+        max_workers -- the number of files read at the same time
+        use_processes -- whether to read in processes rather than threads
+    Returns:
+        df -- the dataframe of every year's data
+    """
+    read_year = partial(read_year_file, path_template=path_template, source=source,
+                        year_offset=year_offset, usecols=usecols, dtype=dtype,
+                        filters=filters, date_columns=date_columns)
+
+    dfs = map_years(read_year, years, max_workers=max_workers,
+                    use_processes=use_processes)
+
+    df = pd.concat(dfs).reset_index(drop=True)
+
+    return df
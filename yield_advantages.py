@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:06:12 2026
+
+@author: epnzv
+"""
+
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from geography import lookup_fips, read_geocodes
+from source_schemas import source_dtypes, source_usecols
+from yearly_reader import YEARLY_READ_WORKERS, filter_rows, map_years
+
+
+# the h2h columns each product is aggregated by, and the names they take
+ADV_KEYS = {'year': 'year', 'abm': 'abm', 'c_trait': 'trait', 'c_hybrid': 'hybrid'}
+
+# the mean features of each product
+ADV_FEATURES = ['yield_adv_within_abm_by_trait_brand', 'yield_adv_within_abm_outof_trait_brand',
+                'yield_adv_with_abm_brand', 'yield']
+
+# the number of h2h rows read from a file at a time
+H2H_CHUNK_ROWS = 1000000
+
+
+def advantage_sums(df):
+    """Sums up the yield advantages of each product in each abm and year
+    within its trait group, outside its trait group and overall, along with
+    its yield. The in and out of trait advantages are masked to NaN on the
+    other rows so every sum and count is taken in a single groupby. Sums of
+    separate pieces of the h2h data can be added together before taking the
+    means.
+
+    Keyword arguments:
+        df -- the dataframe of the performance data, with the year, abm,
+            c_trait, o_trait, c_hybrid, c_yield and yield_adv columns
+    Returns:
+        adv_sums -- the dataframe of the sum and count of each feature, and
+            the number of in and out of trait h2hs, for each product
+    """
+    in_trait = (df['c_trait'] == df['o_trait']).to_numpy()
+
+    # out of trait is anything that isn't in trait, a missing o_trait included
+    adv_rows = df[list(ADV_KEYS)].assign(**{
+            'yield_adv_within_abm_by_trait_brand': df['yield_adv'].where(in_trait),
+            'yield_adv_within_abm_outof_trait_brand': df['yield_adv'].where(~in_trait),
+            'yield_adv_with_abm_brand': df['yield_adv'],
+            'yield': df['c_yield'],
+            'in_trait_rows': in_trait.astype(np.int64),
+            'outof_trait_rows': (~in_trait).astype(np.int64)})
+
+    aggregations = {}
+    for feature in ADV_FEATURES:
+        aggregations[feature + '_sum'] = (feature, 'sum')
+        aggregations[feature + '_count'] = (feature, 'count')
+    aggregations['in_trait_rows'] = ('in_trait_rows', 'sum')
+    aggregations['outof_trait_rows'] = ('outof_trait_rows', 'sum')
+
+    adv_sums = adv_rows.groupby(by=list(ADV_KEYS), as_index=False).agg(**aggregations)
+
+    return adv_sums
+
+
+def finish_advantages(adv_sums, how='inner'):
+    """Adds up the sums of the pieces of the h2h data and turns them into the
+    mean yield and yield advantages of each product.
+
+    Keyword arguments:
+        adv_sums -- the dataframe of the sums of one or more pieces, as given
+            by advantage_sums
+        how -- 'inner' to keep only the products with both in and out of
+            trait h2hs, 'left' to keep every product
+    Returns:
+        adv_df -- the dataframe of the average yield and yield advantages,
+            broken down by year, abm, trait and hybrid
+    """
+    adv_sums = adv_sums.groupby(by=list(ADV_KEYS), as_index=False).sum()
+
+    if how == 'inner':
+        adv_sums = adv_sums[(adv_sums['in_trait_rows'] > 0) &
+                            (adv_sums['outof_trait_rows'] > 0)].reset_index(drop=True)
+    elif how != 'left':
+        raise ValueError('how must be inner or left, not ' + str(how))
+
+    # a product without any values of a feature gets NaN, 0 / 0
+    adv_df = adv_sums[list(ADV_KEYS)].rename(columns=ADV_KEYS)
+    for feature in ADV_FEATURES:
+        adv_df[feature] = adv_sums[feature + '_sum'] / adv_sums[feature + '_count']
+
+    return adv_df
+
+
+def aggregate_advantages(df, how='inner'):
+    """Aggregates the yield advantages of each product in each abm and year
+    within its trait group, outside its trait group and overall, along with
+    its mean yield, scanning the h2h rows once.
+
+    Keyword arguments:
+        df -- the dataframe of the performance data, with the year, abm,
+            c_trait, o_trait, c_hybrid, c_yield and yield_adv columns
+        how -- 'inner' to keep only the products with both in and out of
+            trait h2hs, 'left' to keep every product
+    Returns:
+        adv_df -- the dataframe of the average yield and yield advantages,
+            broken down by year, abm, trait and hybrid
+    """
+    return finish_advantages(advantage_sums(df), how=how)
+
+
+def read_h2h_year_sums(year, path_template, location_map, add_yield_adv, year_offset=0,
+                       filters=None, chunksize=H2H_CHUNK_ROWS):
+    """Reads in one year's H2H file a chunk at a time and sums up the yield
+    advantages of each chunk, so only one chunk of the head to heads is in
+    memory at once. The state and county of each h2h are looked up in the
+    census county table and joined to their abm on the integer fips.
+
+    Keyword arguments:
+        year -- the year of the file
+        path_template -- the path of the files, with {year} where the year goes
+        location_map -- the dataframe mapping fips to abm
+        add_yield_adv -- function adding the yield_adv column to a chunk
+        year_offset -- added to the file's year to give the year column
+        filters -- dict of column to the value, or list of values, to keep
+        chunksize -- the number of rows read at a time
+    Returns:
+        adv_sums -- the dataframe of the sums of each chunk
+    """
+    location_map = location_map[['fips', 'abm']].dropna(subset=['fips'])
+    location_map = location_map.assign(
+            fips=pd.to_numeric(location_map['fips']).astype(np.int32))
+    geocodes = read_geocodes()
+
+    dfi_path = path_template.format(year=year)
+    print("Read ", dfi_path)
+
+    chunk_sums = []
+    for chunk in pd.read_csv(dfi_path, usecols=source_usecols('h2h'),
+                             dtype=source_dtypes('h2h'), chunksize=chunksize):
+        chunk = filter_rows(chunk, filters or {})
+        chunk['year'] = year + year_offset
+
+        chunk['fips'] = lookup_fips(chunk['state'], chunk['county'], geocodes=geocodes)
+        chunk = chunk.merge(location_map, on=['fips'], how='left')
+        chunk = add_yield_adv(chunk)
+
+        chunk_sums.append(advantage_sums(chunk))
+
+    adv_sums = pd.concat(chunk_sums).reset_index(drop=True)
+
+    return adv_sums
+
+
+def read_h2h_advantages(path_template, years, location_map, add_yield_adv, year_offset=0,
+                        filters=None, how='inner', chunksize=H2H_CHUNK_ROWS,
+                        max_workers=YEARLY_READ_WORKERS):
+    """Streams a yearly series of H2H files into the yield advantages of each
+    product, without ever holding the head to heads of a whole file. Each
+    chunk is mapped to its abm and summed up as soon as it is read, and only
+    the sums are kept.
+
+    Keyword arguments:
+        path_template -- the path of the files, with {year} where the year goes
+        years -- the years to read
+        location_map -- the dataframe mapping fips to abm
+        add_yield_adv -- function adding the yield_adv column to a chunk of
+            the h2h data, defined at module level
+        year_offset -- added to each file's year to give the year column
+        filters -- dict of column to the value, or list of values, to keep
+        how -- 'inner' to keep only the products with both in and out of
+            trait h2hs, 'left' to keep every product
+        chunksize -- the number of rows read from a file at a time
+        max_workers -- the number of files read at the same time
+    Returns:
+        adv_df -- the dataframe of the average yield and yield advantages,
+            broken down by year, abm, trait and hybrid
+    """
+    read_year = partial(read_h2h_year_sums, path_template=path_template,
+                        location_map=location_map, add_yield_adv=add_yield_adv,
+                        year_offset=year_offset, filters=filters, chunksize=chunksize)
+
+    adv_sums = pd.concat(map_years(read_year, years, max_workers=max_workers))
+
+    return finish_advantages(adv_sums, how=how)